@@ -1,9 +1,15 @@
-from src.Talker import LocalTalker, TerminalTalker
+from src.Talker import LocalTalker, TerminalTalker, FanOutTalker
+from src.TTSCache import TTSCache
+from src.TTSBackend import BACKENDS, FallbackBackend
 from src.Chatter import Chatter
-from src.Listener import Listener
+from src.Listener import Listener, ReplaySource, NAOAudioSource, EchoSuppressor
 from src.NAO.NAOTalker import NAOTalker
 from src.NAO.ChoregrapheTalker import ChoregrapheTalker
-import warnings, yaml, sys, os, time
+from src.NAO.NAOAttention import NAOAttention
+from src.NAO.SpeechDuration import SpeechDuration
+from src.NAO.ChoirTalker import ChoirTalker
+from urllib.parse import urlparse
+import warnings, yaml, sys, os, time, statistics, threading
 conf_path = os.path.join(os.path.dirname(os.path.realpath(__file__)),"configs")
 kwargs = {key.lower() : value for key, value in [a.split("=") for a in sys.argv[1:]]}
 base_params = yaml.safe_load(open(os.path.join(conf_path, "base_params.yaml"))) # Used to identify correct type of parameters
@@ -41,51 +47,153 @@ chatter = Chatter(
 )
 
 # Set up talker
-talker_type = params["talker"].lower()
-if talker_type == "terminal":
-    talker = TerminalTalker(
-        language=params.get("language","en"),
-        prefix=params.get("terminal_talker_prefix", "\nAssistant: ").format(**params)
-    )
-elif talker_type == "speaker":
-    talker = LocalTalker(
-        language=params.get("language","en")
-    )
-elif talker_type == "nao":
-    talker = NAOTalker(
-        ip=params["ip"],
-        language=params.get("language","en"),
-        stand=params.get("nao_stand",False),
-        sleep_len=params.get("nao_sleep_len",0.03),
-        volume=params.get("nao_volume",100)
-    )
-elif talker_type == "choregraphe":
-    talker = ChoregrapheTalker(
-        ip=params["ip"],
-        language=params.get("language","en"),
-        stand=params.get("nao_stand",False),
-        sleep_len=params.get("nao_sleep_len",0.03),
-        volume=params.get("nao_volume",100)
-    )
-else:
-    raise Exception("Incorrect 'talker' specified! Use 'terminal', 'speaker', 'NAO', or 'choregraphe'")
+bridge_url = "http://{}:{}".format(params.get("bridge_host","localhost"), params.get("nao_bridge_port",8080))
+def make_talker(talker_type, bridge_url=bridge_url, duration=None):
+    if talker_type in ["nao", "choregraphe", "choir"] and duration is None: # Paces speech on the robot, which has no completion signal
+        duration = SpeechDuration(
+            language=params.get("language","en"),
+            path=os.path.join(conf_path, "local", params["nao_duration_file"]) if params.get("nao_duration_file","") else "",
+            char_len=params.get("nao_sleep_len",0.03)
+        )
+    if talker_type == "terminal":
+        return TerminalTalker(
+            language=params.get("language","en"),
+            prefix=params.get("terminal_talker_prefix", "\nAssistant: ").format(**params)
+        )
+    elif talker_type == "speaker":
+        backend = BACKENDS[params.get("tts_backend","gtts")]()
+        if params.get("tts_fallback",""):
+            backend = FallbackBackend(backend, BACKENDS[params["tts_fallback"]](),
+                deadline=params.get("tts_deadline",2.0),
+                cooldown=params.get("tts_cooldown",30.0)
+            )
+        return LocalTalker(
+            language=params.get("language","en"),
+            synth_workers=params.get("local_synth_workers",2),
+            queue_depth=params.get("local_queue_depth",3),
+            trim_silence=params.get("local_trim_silence",True),
+            trim_pad=params.get("local_trim_pad",0.05),
+            loudness=params.get("local_loudness",0.1),
+            backend=backend,
+            cache=TTSCache(
+                directory=params.get("tts_cache_dir",""),
+                max_items=params.get("tts_cache_size",128)
+            ) if params.get("tts_cache",True) else None,
+            prewarm=[phrase.format(**params) for phrase in params.get("tts_prewarm",[])]
+        )
+    elif talker_type == "nao":
+        return NAOTalker(
+            ip=params["ip"],
+            language=params.get("language","en"),
+            stand=params.get("nao_stand",False),
+            sleep_len=params.get("nao_sleep_len",0.03),
+            volume=params.get("nao_volume",100),
+            duration=duration,
+            batch_window=params.get("nao_batch_window",0.05),
+            stream_ingest=params.get("nao_stream_ingest",True),
+            transport=params.get("nao_transport","http"),
+            socket_port=params.get("nao_socket_port",8082) + (urlparse(bridge_url).port or 8080) - 8080, # Bridges started with port=<n> serve sockets on n+2
+            socket_path=params.get("nao_socket_path",""),
+            reconnect_max=params.get("nao_reconnect_max",30.0),
+            offline_policy=params.get("nao_offline_policy","drop"),
+            offline_buffer=params.get("nao_offline_buffer",16),
+            bridge_url=bridge_url
+        )
+    elif talker_type == "choir":
+        return ChoirTalker(
+            [make_talker("nao", bridge_url=url, duration=duration) for url in params["choir_bridges"]], # One learned pace, stored in one file
+            skew=params.get("choir_skew",0.3)
+        )
+    elif talker_type == "choregraphe":
+        return ChoregrapheTalker(
+            ip=params["ip"],
+            language=params.get("language","en"),
+            stand=params.get("nao_stand",False),
+            sleep_len=params.get("nao_sleep_len",0.03),
+            volume=params.get("nao_volume",100),
+            duration=duration
+        )
+    else:
+        raise Exception("Incorrect 'talker' specified! Use 'terminal', 'speaker', 'NAO', 'choregraphe', 'choir' or several separated by commas")
+
+talkers = [make_talker(talker_type.strip()) for talker_type in params["talker"].lower().split(",")]
+talker = talkers[0] if len(talkers) == 1 else FanOutTalker(talkers, queue_depth=params.get("fanout_queue_depth",32))
 
 # Set up listener
 listener_type = params["listener"].lower()
-if listener_type == "mic":
+if listener_type in ["mic", "replay", "nao_mic"]:
+    if listener_type == "replay":
+        source = ReplaySource(
+            params["replay_path"],
+            speed=params.get("replay_speed",1.0),
+            gap=params.get("replay_gap",1.0)
+        )
+    elif listener_type == "nao_mic":
+        source = NAOAudioSource(
+            host=params.get("bridge_host","localhost"),
+            port=params.get("nao_audio_port",8081),
+            buffer_frames=params.get("nao_audio_buffer",64)
+        )
+    else:
+        source = None
     listener = Listener(
         language=params.get("language","en"),
         default_mic=params.get("default_mic",True),
-        use_whisper=params.get("use_whisper",False)
+        use_whisper=params.get("use_whisper",False),
+        recognizers=params.get("recognizers",""),
+        race_min_confidence=params.get("race_min_confidence",0.7),
+        race_min_length=params.get("race_min_length",2),
+        race_timeout=params.get("race_timeout",10.0),
+        source=source,
+        wake_word=params.get("name", "assistant") if params.get("wake_word",False) else None,
+        wake_window=params.get("wake_window",20.0),
+        wake_sensitivity=params.get("wake_sensitivity",0.8),
+        wake_spelling=params.get("wake_spelling","") or None,
+        echo_suppressor=EchoSuppressor(
+            talker,
+            tail=params.get("echo_tail",0.5),
+            overlap=params.get("echo_overlap",0.8),
+            similarity=params.get("echo_similarity",0.8),
+            min_words=params.get("echo_min_words",3)
+        ) if params.get("echo_suppression",False) else None,
+        attention=NAOAttention(
+            bridge_url=bridge_url,
+            grace=params.get("vision_grace",10.0)
+        ) if params.get("vision_gate",False) else None
     )
 elif listener_type == "terminal":
     listener = lambda : input(params.get("terminal_listener_prefix","User: "))
 elif listener_type == "timer":
     listener = lambda : [time.sleep(params["listener_timer_delay"]), params.get("listener_timer_message", " ")][1]
 else:
-    raise Exception("Incorrect 'listener' specified! Use 'terminal', 'timer' or 'mic'.")
+    raise Exception("Incorrect 'listener' specified! Use 'terminal', 'timer', 'mic', 'replay' or 'nao_mic'.")
+
+# Set up barge-in, only possible when listening to audio
+barge_in = params.get("barge_in", False) and isinstance(listener, Listener)
+if barge_in and listener.echo_suppressor is None:
+    print("Warning: barge_in without echo_suppression, the talker's own voice may interrupt it")
+def speak(response):
+    """
+    Speaks response. With barge-in the talker is interrupted if the user talks over it,
+    and only the spoken part of the response is remembered
+    """
+    if not barge_in:
+        talker(response)
+        return
+    stop = threading.Event()
+    def watch():
+        if listener.watch(stop, ratio=params.get("barge_in_ratio",1.5), duration=params.get("barge_in_duration",0.3)):
+            talker.interrupt()
+    monitor = threading.Thread(target=watch, daemon=True)
+    monitor.start()
+    talker(response)
+    stop.set()
+    monitor.join()
+    if talker.interrupted.is_set():
+        chatter.interrupt(response, talker.spoken)
 
 # Start conversation
+latencies = [] # Seconds from the end of a heard phrase to the first audio of the response
 try:
     # Test mode with single "hello" message if test parameter is set
     if params.get("test", False):
@@ -100,7 +208,20 @@ try:
         if params.get("print_heard", True): print("Heard: {}".format(heard))
         if heard != "":
             response = chatter(heard)
-            talker(response)
+            speak(response)
+            if hasattr(listener, "keep_open"): listener.keep_open()
+            if getattr(listener, "heard_at", None) and talker.first_audio_at:
+                latencies.append(talker.first_audio_at - listener.heard_at)
 except (KeyboardInterrupt, EOFError):
     print("\n\nExiting...")
-    sys.exit()
\ No newline at end of file
+    if params.get("print_stats", False):
+        if hasattr(listener, "print_stats"): listener.print_stats()
+        if hasattr(talker, "print_stats"): talker.print_stats()
+        if getattr(listener, "wake_spotter", None) and chatter.filt_horizon > 0:
+            print("Wake word saved {} filter calls".format(listener.wake_counts["gated"]))
+        if latencies:
+            print("Latency to first audio: {:.2f}s mean, {:.2f}s median, {:.2f}s max over {} responses".format(
+                statistics.mean(latencies), statistics.median(latencies), max(latencies), len(latencies)))
+    sys.exit()
+finally:
+    if hasattr(talker, "close"): talker.close() # Sits the NAO down, if it stood up
\ No newline at end of file
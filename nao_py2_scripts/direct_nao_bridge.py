@@ -11,11 +11,16 @@ import sys
 import json
 import time
 import socket
+import struct
 import threading
+import select
+import Queue
+import collections
+import codecs
+import math
 # Fix imports for Python 2.7
 import BaseHTTPServer
 from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
-import SocketServer as socketserver
 import urlparse
 
 # Set up logging
@@ -117,6 +122,177 @@ DEFAULT_LANGUAGE = "Arabic"
 DEFAULT_VOLUME = 80
 HOST = "localhost"
 PORT = 8080
+AUDIO_PORT = 8081
+AUDIO_SAMPLE_RATE = 16000
+AUDIO_FRAME_SAMPLES = 1024  # 16 bit mono samples per frame, 64 ms
+AUDIO_HEADER = struct.Struct("!Id")  # Sequence number, capture time. Must match src/Listener.py
+AUDIO_CLIENT_QUEUE = 64  # Frames queued per host before dropping
+FACE_PERIOD = 200  # Milliseconds between face detections
+MAX_ATTENTION_WAIT = 60  # Longest long-poll on /attention, in seconds
+KEEP_ALIVE_TIMEOUT = 120  # Seconds an idle host connection is kept open
+UTTERANCE_HISTORY = 256  # Utterances remembered for hosts waiting on them
+MAX_UTTERANCE_WAIT = 60  # Longest long-poll on /utterance, in seconds
+COMMANDS = ("stand", "sit", "turnoff", "turnon", "e")
+URGENT_COMMANDS = ("stop", "emergency")  # Run at once ahead of queued speech. "emergency" also sits the NAO down
+STOP_WAIT = 2  # Longest wait, in seconds, for speech to go quiet after a stop
+SOCKET_PORT = 8082
+FRAME_HEADER = struct.Struct("!IBI")  # Payload length, frame type, request id. Must match src/NAO/BridgeConnection.py
+FRAME_REQUEST, FRAME_RESPONSE, FRAME_EVENT, FRAME_AUDIO = 1, 2, 3, 4
+MAX_FRAME = 1 << 20  # Largest payload accepted, in bytes
+HTTP_WORKERS = 16  # Threads serving HTTP requests. A kept-alive connection only holds one while a request is served
+COMMAND_QUEUE_DEPTH = 64  # Speech and commands queued for the NAO before hosts are told to retry later
+NAOQI_PORT = 9559
+CALL_TIMEOUT = 10  # Seconds a NAOqi call may take before it's given up on
+MOTION_TIMEOUT = 30  # Seconds standing up or sitting down may take
+SPEECH_TIMEOUT_PER_CHAR = 0.25  # Seconds speech may take per character, on top of CALL_TIMEOUT
+RECONNECT_MAX = 30  # Longest wait between attempts to reconnect to the NAO, in seconds
+# Where streamed text is split into segments to speak. Must match src/Segmenter.py
+SENTENCE_ENDS = u".!?\u2026\u061f"  # Ends a sentence when followed by whitespace
+CLAUSE_ENDS = u",;:\u060c\u061b"  # Ends a clause when followed by whitespace
+UNSPACED_ENDS = u"\u3002\uff01\uff1f"  # Ends a sentence without whitespace following
+
+class CallTimeout(Exception):
+    """Raised when a NAOqi call doesn't return in time"""
+
+class ProxyRegistry(object):
+    """Creates each NAOqi proxy once, the first time it's used, and shares it between threads"""
+
+    def __init__(self, robot_ip, port=NAOQI_PORT):
+        """
+        Args:
+            robot_ip (str): IP address of the NAO robot
+            port (int): NAOqi port of the NAO robot
+        """
+        self.robot_ip = robot_ip
+        self.port = port
+        self.proxies = {}
+        self.lock = threading.Lock()
+        self.supervisor = None  # Told about failed calls, once set
+
+    def get(self, name):
+        """The proxy of module name, such as ALTextToSpeech, created if it doesn't exist yet"""
+        with self.lock:
+            if name not in self.proxies:
+                self.proxies[name] = ALProxy(name, self.robot_ip, self.port)
+            return self.proxies[name]
+
+    def clear(self):
+        """Drop every proxy, so they're created anew for a new connection"""
+        with self.lock:
+            self.proxies.clear()
+
+    def call(self, name, method, *args, **kwargs):
+        """
+        Call method on module name, giving up after timeout seconds. The call runs on its own thread,
+        so a hung NAOqi call strands only that thread, not the caller
+
+        Args:
+            name (str): The module, such as ALTextToSpeech
+            method (str): The method, such as say. "post.say" runs it as a task, returning the task id
+            *args: Arguments of the method
+            timeout (float): Seconds to wait for the call, CALL_TIMEOUT by default
+
+        Returns:
+            The value the method returned
+
+        Raises:
+            CallTimeout: If the call didn't return in time
+        """
+        timeout = kwargs.pop('timeout', CALL_TIMEOUT)
+        result = {}
+
+        def run():
+            try:
+                function = self.get(name)
+                for part in method.split('.'):
+                    function = getattr(function, part)
+                result['value'] = function(*args)
+            except Exception as e:
+                result['error'] = e
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        thread.join(timeout)
+        if thread.is_alive():
+            self.failed("%s.%s timed out after %s s" % (name, method, timeout))
+            raise CallTimeout("%s.%s timed out" % (name, method))
+        if 'error' in result:
+            self.failed("%s.%s failed: %s" % (name, method, result['error']))
+            raise result['error']
+        return result['value']
+
+    def failed(self, reason):
+        if self.supervisor is not None:
+            self.supervisor.failed(reason)
+
+class ConnectionSupervisor(object):
+    """Keeps the bridge connected to the NAO, reconnecting in the background with backoff when a call fails"""
+
+    def __init__(self, proxies, on_connect):
+        """
+        Args:
+            proxies (ProxyRegistry): The proxies, cleared on each reconnect
+            on_connect (function): Called after each connection, to set the NAO up. Returns False on failure
+        """
+        self.proxies = proxies
+        self.on_connect = on_connect
+        self.connected = threading.Event()
+        self.lost = threading.Event()
+        self.connects = 0
+        proxies.supervisor = self
+
+    def start(self):
+        thread = threading.Thread(target=self.supervise)
+        thread.daemon = True
+        thread.start()
+
+    def reachable(self):
+        """If something accepts connections on the NAO's NAOqi port"""
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.settimeout(2)
+        try:
+            return s.connect_ex((self.proxies.robot_ip, self.proxies.port)) == 0
+        finally:
+            s.close()
+
+    def connect(self):
+        """Connect to the NAO and set it up, with fresh proxies"""
+        if not self.reachable():
+            logger.error("NAO robot is not reachable at %s:%s", self.proxies.robot_ip, self.proxies.port)
+            return False
+        self.proxies.clear()
+        self.lost.clear()
+        try:
+            if self.on_connect() is False:
+                return False
+        except Exception as e:
+            logger.error("Error connecting to NAO robot: %s", e)
+            return False
+        if self.lost.is_set():  # A call failed while setting up
+            return False
+        self.connects += 1
+        self.connected.set()
+        logger.info("Successfully connected to NAO robot")
+        return True
+
+    def supervise(self):
+        """Connect, then reconnect whenever a call fails, waiting longer after each failed attempt"""
+        backoff = 1
+        while True:
+            if self.connect():
+                backoff = 1
+                self.lost.wait()
+                continue
+            time.sleep(backoff)
+            backoff = min(backoff * 2, RECONNECT_MAX)
+
+    def failed(self, reason):
+        """Mark the connection as lost, so it's reconnected in the background"""
+        if self.connected.is_set():
+            logger.error("Lost connection to NAO robot: %s", reason)
+        self.connected.clear()
+        self.lost.set()
 
 class NAOController:
     """Controller for interacting with the NAO robot via NAOqi SDK"""
@@ -133,191 +309,1125 @@ class NAOController:
         self.robot_ip = robot_ip
         self.language = language
         self.volume = volume
-        self.tts = None
-        self.audio = None
-        self.motion = None
-        self.connected = False
+        self.proxies = ProxyRegistry(robot_ip)
+        self.supervisor = ConnectionSupervisor(self.proxies, self.configure)
+        self.generation = 0  # Increased by stop, so requests queued before it are dropped
+        self.speech_lock = threading.Lock()  # Speech is said one at a time, so each is timed from its start
+        self.tasks = set()  # (module, task id) of each speech task running, so stop cancels exactly those
+        self.quiet = threading.Event()  # Set while no speech is running
+        self.quiet.set()
+        self.stop_latencies = collections.deque(maxlen=100)  # Seconds from each stop until the NAO was quiet
+        self.subscribers = []  # Called after each connection, to subscribe to the NAO's modules again
         
         logger.info("Initializing NAO controller")
         logger.info("Robot IP: %s", robot_ip)
         logger.info("Language: %s", language)
         logger.info("Volume: %s", volume)
         
-        # Try to connect to NAO
-        self.connect_to_nao()
+        # Connect to NAO in the background, waiting a little so the first requests find it connected
+        self.supervisor.start()
+        self.supervisor.connected.wait(5)
+
+    @property
+    def connected(self):
+        return self.supervisor.connected.is_set()
+
+    def configure(self):
+        """Set the language and volume, after each connection"""
+        languages = self.proxies.call("ALTextToSpeech", "getAvailableLanguages")
+        logger.info("Available languages: %s", ", ".join(languages))
+        
+        if self.language in languages:
+            self.proxies.call("ALTextToSpeech", "setLanguage", self.language)
+            logger.info("Set language to: %s", self.language)
+        else:
+            logger.warning("Language %s not available", self.language)
+            logger.info("Using robot's current language: %s", self.proxies.call("ALTextToSpeech", "getLanguage"))
+        
+        # Set volume
+        self.proxies.call("ALAudioDevice", "setOutputVolume", self.volume)
+        logger.info("Set volume to: %s%%", self.volume)
+
+        for subscribe in list(self.subscribers):
+            subscribe()
     
-    def connect_to_nao(self):
-        """Connect to NAO robot and initialize proxies"""
+    def stop(self):
+        """
+        Stop speaking immediately and drop all speech queued before the stop, by cancelling the speech tasks
+        this bridge started. Motion and LEDs are left to finish, emergency stops those
+
+        Returns:
+            float: Seconds until the NAO was quiet, or None if it couldn't be stopped
+        """
+        start = time.time()
+        self.generation += 1
+        if not self.connected:
+            return None
         try:
-            # Check if NAO is reachable
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.settimeout(2)
-            result = s.connect_ex((self.robot_ip, 9559))
-            s.close()
-            
-            if result != 0:
-                logger.error("NAO robot is not reachable at %s:9559", self.robot_ip)
-                return False
-            
-            # Initialize proxies
-            self.tts = ALProxy("ALTextToSpeech", self.robot_ip, 9559)
-            self.audio = ALProxy("ALAudioDevice", self.robot_ip, 9559)
-            self.motion = ALProxy("ALMotion", self.robot_ip, 9559)
-            
-            # Set language
-            languages = self.tts.getAvailableLanguages()
-            logger.info("Available languages: %s", ", ".join(languages))
-            
-            if self.language in languages:
-                self.tts.setLanguage(self.language)
-                logger.info("Set language to: %s", self.language)
-            else:
-                logger.warning("Language %s not available", self.language)
-                logger.info("Using robot's current language: %s", self.tts.getLanguage())
-            
-            # Set volume
-            self.audio.setOutputVolume(self.volume)
-            logger.info("Set volume to: %s%%", self.volume)
-            
-            self.connected = True
-            logger.info("Successfully connected to NAO robot")
-            return True
-            
+            logger.info("NAO stops speaking")
+            for name, task in list(self.tasks):
+                self.proxies.call(name, "stop", task)
+            self.quiet.wait(STOP_WAIT)
+            latency = time.time() - start
+            self.stop_latencies.append(latency)
+            return latency
         except Exception as e:
-            logger.error("Error connecting to NAO robot: %s", e)
-            self.connected = False
-            return False
-    
-    def say(self, text):
+            logger.error("Error stopping NAO speech: %s", e)
+            return None
+
+    def emergency(self):
+        """
+        Stop everything the NAO is saying or doing, including what other programs started, and sit down
+
+        Returns:
+            float: Seconds until the NAO was quiet, or None if it couldn't be stopped
+        """
+        latency = self.stop()
+        try:
+            logger.info("NAO stops everything and sits down")
+            self.proxies.call("ALTextToSpeech", "stopAll")
+            self.proxies.call("ALMotion", "rest", timeout=MOTION_TIMEOUT)
+        except Exception as e:
+            logger.error("Error stopping NAO: %s", e)
+        return latency
+
+    def run_task(self, name, method, args, limit, generation=None, tracked=False):
+        """
+        Run method of module name as a NAOqi task and wait for it to finish
+
+        Args:
+            name (str): The module, such as ALTextToSpeech
+            method (str): The method, such as say
+            args (list): Arguments of the method
+            limit (float): Seconds the task may run before it's stopped
+            generation (int): The generation it was requested in. Stopped at once if a stop has happened since
+            tracked (bool): If stop cancels it, as it does speech
+
+        Returns:
+            bool: If the task finished within limit, without being stopped
+        """
+        task = self.proxies.call(name, "post." + method, *args)
+        if tracked:
+            self.tasks.add((name, task))
+        try:
+            if generation is not None and generation != self.generation:  # Stopped before it was tracked
+                self.proxies.call(name, "stop", task)
+            if self.proxies.call(name, "wait", task, int(limit * 1000), timeout=limit + CALL_TIMEOUT):  # True if it timed out
+                logger.error("NAO took over %d s to run %s.%s", limit, name, method)
+                self.proxies.call(name, "stop", task)
+                return False
+        finally:
+            self.tasks.discard((name, task))
+        return generation is None or generation == self.generation
+
+    def say(self, text, started=None, generation=None):
         """
         Make the NAO robot say something
         
         Args:
             text (str): Text for the robot to say
+            started (function): Called as the robot starts, if set
+            generation (int): The generation text was requested in. Dropped if a stop has happened since
             
         Returns:
             bool: True if successful, False otherwise
         """
         if not self.connected:
-            if not self.connect_to_nao():
-                logger.error("Not connected to NAO robot")
-                return False
+            logger.error("Not connected to NAO robot, reconnecting in the background")
+            return False
         
         try:
             logger.info("NAO says: %s", text)
+            if started and text.lower() in COMMANDS:
+                started()
             
             # Special commands
             if text.lower() == "stand":
                 logger.info("NAO is standing up")
-                self.motion.wakeUp()
-                return True
+                return self.run_task("ALMotion", "wakeUp", [], MOTION_TIMEOUT)
             elif text.lower() == "sit":
                 logger.info("NAO is sitting down")
-                self.motion.rest()
-                return True
+                return self.run_task("ALMotion", "rest", [], MOTION_TIMEOUT)
             elif text.lower() == "turnoff":
                 logger.info("NAO is turning off eye LEDs")
-                leds = ALProxy("ALLeds", self.robot_ip, 9559)
-                leds.fade("FaceLeds", 0.0, 1.0)
-                return True
+                return self.run_task("ALLeds", "fade", ["FaceLeds", 0.0, 1.0], CALL_TIMEOUT)
             elif text.lower() == "turnon":
                 logger.info("NAO is turning on eye LEDs")
-                leds = ALProxy("ALLeds", self.robot_ip, 9559)
-                leds.fade("FaceLeds", 1.0, 1.0)
-                return True
+                return self.run_task("ALLeds", "fade", ["FaceLeds", 1.0, 1.0], CALL_TIMEOUT)
             elif text.lower() == "e":
                 logger.info("NAO is nodding")
                 # Simple head nod
-                self.motion.angleInterpolation(
-                    ["HeadPitch"], 
-                    [0.0, 0.3, 0.0], 
-                    [0.5, 1.0, 1.5], 
-                    True
-                )
-                return True
+                return self.run_task("ALMotion", "angleInterpolation",
+                    [["HeadPitch"], [0.0, 0.3, 0.0], [0.5, 1.0, 1.5], True], CALL_TIMEOUT)
             
-            # Regular speech
-            self.tts.say(text)
-            return True
+            # Regular speech, returning once the speech task is done or stopped
+            with self.speech_lock:
+                if generation is not None and generation != self.generation:
+                    return False
+                if started:
+                    started()
+                self.quiet.clear()
+                try:
+                    return self.run_task("ALTextToSpeech", "say", [text],
+                                         CALL_TIMEOUT + SPEECH_TIMEOUT_PER_CHAR * len(text), generation, tracked=True)
+                finally:
+                    self.quiet.set()
             
         except Exception as e:
             logger.error("Error making NAO say something: %s", e)
-            self.connected = False
             return False
 
+class AudioStreamer(object):
+    """Streams the NAO's front microphone to connected hosts as fixed-size PCM frames"""
+
+    def __init__(self, robot_ip, host, port):
+        """
+        Initialize the audio streamer
+
+        Args:
+            robot_ip (str): IP address of the NAO robot
+            host (str): Host to accept audio clients on
+            port (int): Port to accept audio clients on
+        """
+        self.robot_ip = robot_ip
+        self.host = host
+        self.port = port
+        self.frame_bytes = AUDIO_FRAME_SAMPLES * 2
+        self.pending = ""
+        self.sequence = 0
+        self.clients = []
+        self.listeners = []  # Called with each packet, as well as sending it to clients
+        self.lock = threading.Lock()
+        self.broker = None
+        self.module = None
+
+    def start(self):
+        """Subscribe to ALAudioDevice remote buffers, again after each reconnect, and accept hosts in the background"""
+        self.subscribe()
+        nao_controller.subscribers.append(self.subscribe)
+
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((self.host, self.port))
+        server.listen(5)
+        thread = threading.Thread(target=self.accept, args=(server,))
+        thread.daemon = True
+        thread.start()
+        logger.info("Streaming NAO audio at %s:%s", self.host, self.port)
+        return True
+
+    def subscribe(self):
+        """Subscribe to ALAudioDevice remote buffers, registering the module that receives them the first time"""
+        try:
+            if self.module is None:
+                from naoqi import ALBroker, ALModule
+                streamer = self
+
+                class NAOChatAudio(ALModule):
+                    """Receives remote audio buffers from ALAudioDevice"""
+
+                    def processRemote(self, nbOfChannels, nbOfSamplesByChannel, timeStamp, inputBuffer):
+                        """Called by ALAudioDevice for every captured buffer"""
+                        streamer.push(inputBuffer, timeStamp[0] + timeStamp[1] / 1e6)
+
+                self.broker = ALBroker("NAOChatAudioBroker", "0.0.0.0", 0, self.robot_ip, NAOQI_PORT)
+                self.module = NAOChatAudio("NAOChatAudio")
+            # 3 is the front microphone, 0 keeps the buffer interleaved
+            nao_controller.proxies.call("ALAudioDevice", "setClientPreferences", "NAOChatAudio", AUDIO_SAMPLE_RATE, 3, 0)
+            nao_controller.proxies.call("ALAudioDevice", "subscribe", "NAOChatAudio")
+            logger.info("Subscribed to NAO audio")
+            return True
+        except Exception as e:
+            logger.error("Could not subscribe to NAO audio: %s", e)
+            return False
+
+    def stop(self):
+        """Unsubscribe from ALAudioDevice"""
+        try:
+            if self.module is not None:
+                nao_controller.proxies.call("ALAudioDevice", "unsubscribe", "NAOChatAudio")
+            if self.broker is not None:
+                self.broker.shutdown()
+        except Exception as e:
+            logger.error("Error stopping NAO audio: %s", e)
+
+    def accept(self, server):
+        """Accept hosts, each served by its own sender thread and bounded queue"""
+        while True:
+            conn, address = server.accept()
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client = {"conn": conn, "queue": Queue.Queue(AUDIO_CLIENT_QUEUE), "dropped": 0}
+            with self.lock:
+                self.clients.append(client)
+            logger.info("Audio client connected: %s", address)
+            thread = threading.Thread(target=self.send, args=(client,))
+            thread.daemon = True
+            thread.start()
+
+    def send(self, client):
+        """Send queued frames to a host until it disconnects"""
+        try:
+            while True:
+                client["conn"].sendall(client["queue"].get())
+        except socket.error as e:
+            logger.info("Audio client disconnected: %s (%s frames dropped)", e, client["dropped"])
+        finally:
+            with self.lock:
+                self.clients.remove(client)
+            client["conn"].close()
+
+    def push(self, buffer, capture_time):
+        """
+        Split a captured buffer into fixed-size frames and queue them to every host.
+        Frames are dropped for hosts that fall behind, which shows as a sequence gap on the host
+        """
+        self.pending += buffer
+        while len(self.pending) >= self.frame_bytes:
+            frame, self.pending = self.pending[:self.frame_bytes], self.pending[self.frame_bytes:]
+            self.sequence += 1
+            packet = AUDIO_HEADER.pack(self.sequence, capture_time) + frame
+            with self.lock:
+                clients = list(self.clients)
+            for client in clients:
+                try:
+                    client["queue"].put_nowait(packet)
+                except Queue.Full:
+                    client["dropped"] += 1
+            for listener in list(self.listeners):
+                listener(packet)
+
+class FaceWatcher(object):
+    """Tracks whether someone is in front of the NAO via ALFaceDetection"""
+
+    def __init__(self, robot_ip):
+        """
+        Initialize the face watcher
+
+        Args:
+            robot_ip (str): IP address of the NAO robot
+        """
+        self.robot_ip = robot_ip
+        self.engaged = False
+        self.last_seen = 0.0
+        self.changed = threading.Condition()
+        self.listeners = []  # Called with the state when engagement changes
+
+    def start(self):
+        """Subscribe to ALFaceDetection, again after each reconnect, and watch the FaceDetected memory key in the background"""
+        self.subscribe()
+        nao_controller.subscribers.append(self.subscribe)
+        thread = threading.Thread(target=self.watch)
+        thread.daemon = True
+        thread.start()
+        logger.info("Watching for faces")
+        return True
+
+    def subscribe(self):
+        """Subscribe to ALFaceDetection"""
+        try:
+            nao_controller.proxies.call("ALFaceDetection", "subscribe", "NAOChatFaces", FACE_PERIOD, 0.0)
+            logger.info("Subscribed to face detection")
+            return True
+        except Exception as e:
+            logger.error("Could not subscribe to face detection: %s", e)
+            return False
+
+    def stop(self):
+        """Unsubscribe from ALFaceDetection"""
+        try:
+            nao_controller.proxies.call("ALFaceDetection", "unsubscribe", "NAOChatFaces")
+        except Exception as e:
+            logger.error("Error stopping face detection: %s", e)
+
+    def watch(self):
+        """Poll FaceDetected and notify waiting requests when engagement changes"""
+        while True:
+            try:
+                if not nao_controller.connected:  # Nobody is seen until it's reconnected
+                    engaged = False
+                else:
+                    data = nao_controller.proxies.call("ALMemory", "getData", "FaceDetected")
+                    engaged = bool(data) and len(data) > 1 and len(data[1]) > 0
+            except Exception as e:
+                logger.error("Error reading face detection: %s", e)
+                engaged = False
+            with self.changed:
+                if engaged:
+                    self.last_seen = time.time()
+                changed = engaged != self.engaged
+                if changed:
+                    logger.info("Someone is %s", "engaged" if engaged else "gone")
+                    self.engaged = engaged
+                    self.changed.notify_all()
+            if changed:
+                for listener in self.listeners:
+                    listener(self.state())
+            time.sleep(FACE_PERIOD / 1000.0)
+
+    def state(self, known=None, wait=0):
+        """
+        Current engagement, waiting up to wait seconds for it to differ from known
+
+        Returns:
+            dict: If someone is engaged and seconds since a face was last seen
+        """
+        deadline = time.time() + min(wait, MAX_ATTENTION_WAIT)
+        with self.changed:
+            while known is not None and self.engaged == known and time.time() < deadline:
+                self.changed.wait(deadline - time.time())
+            return {'engaged': self.engaged, 'since_seen': time.time() - self.last_seen if self.last_seen else None}
+
+class UtteranceTracker(object):
+    """Tracks each request by id, so hosts can wait for the NAO to finish it"""
+
+    FINISHED = ('done', 'stopped', 'failed')
+
+    def __init__(self, history=UTTERANCE_HISTORY):
+        self.history = history
+        self.next_id = 1
+        self.utterances = collections.OrderedDict()
+        self.changed = threading.Condition()
+        self.listeners = []  # Called with each utterance that starts or finishes
+
+    def add(self, text):
+        """
+        Start tracking text as queued
+
+        Returns:
+            int: The id of the utterance
+        """
+        with self.changed:
+            uid = self.next_id
+            self.next_id += 1
+            self.utterances[uid] = {'id': uid, 'text': text, 'state': 'queued', 'started': None, 'duration': None}
+            while len(self.utterances) > self.history:
+                self.utterances.popitem(last=False)
+            return uid
+
+    def update(self, uid, state):
+        """
+        Move an utterance to state: queued, speaking, done, stopped or failed
+        """
+        with self.changed:
+            utterance = self.utterances.get(uid)
+            if utterance is None:
+                return
+            utterance['state'] = state
+            if state == 'speaking':
+                utterance['started'] = time.time()
+            elif state in self.FINISHED and utterance['started'] is not None:
+                utterance['duration'] = time.time() - utterance['started']
+            self.changed.notify_all()
+            utterance = dict(utterance)
+        for listener in self.listeners:
+            listener(utterance)
+
+    def wait(self, uid, wait=0):
+        """
+        The state of an utterance, waiting up to wait seconds for it to finish
+
+        Returns:
+            dict: The utterance, or None if it isn't known
+        """
+        deadline = time.time() + min(wait, MAX_UTTERANCE_WAIT)
+        with self.changed:
+            while uid in self.utterances and self.utterances[uid]['state'] not in self.FINISHED \
+                    and time.time() < deadline:
+                self.changed.wait(deadline - time.time())
+            utterance = self.utterances.get(uid)
+            return dict(utterance) if utterance else None
+
+utterances = UtteranceTracker()
+
+class SpeechAssembler(object):
+    """Splits streamed text into segments to speak as it arrives, like Segmenter in src/Segmenter.py"""
+
+    def __init__(self, first_min=8, clause_min=40, max_len=200):
+        """
+        Args:
+            first_min (int): Shortest first segment, in characters, which can end at a clause
+            clause_min (int): Shortest later segment, in characters, which can end at a clause
+            max_len (int): Longest segment before it's split at a space, in characters
+        """
+        self.first_min = first_min
+        self.clause_min = clause_min
+        self.max_len = max_len
+        self.buffer = u""
+        self.scanned = 0
+        self.first = True
+
+    def cut(self, end, segments):
+        segment = self.buffer[:end].strip()
+        self.buffer = self.buffer[end:]
+        self.scanned = 0
+        if segment:
+            segments.append(segment)
+            self.first = False
+
+    def feed(self, text):
+        """
+        Add text to the buffer
+
+        Returns:
+            list: The segments completed by text
+        """
+        self.buffer += text
+        segments = []
+        i = self.scanned
+        while i < len(self.buffer):
+            c = self.buffer[i]
+            followed = i + 1 < len(self.buffer) and self.buffer[i + 1].isspace()
+            if c == u"\n":
+                self.cut(i + 1, segments)
+                i = 0
+                continue
+            if i + 1 == len(self.buffer) and (c in SENTENCE_ENDS or c in CLAUSE_ENDS):
+                break  # Wait for the next character to know if it's followed by whitespace
+            if c in UNSPACED_ENDS or (followed and c in SENTENCE_ENDS) or \
+                    (followed and c in CLAUSE_ENDS and i + 1 >= (self.first_min if self.first else self.clause_min)):
+                self.cut(i + 1, segments)
+                i = 0
+                continue
+            if i >= self.max_len:
+                space = self.buffer.rfind(u" ", 0, i)
+                self.cut(space + 1 if space > 0 else i, segments)
+                i = 0
+                continue
+            i += 1
+        self.scanned = i
+        return segments
+
+    def flush(self):
+        """Everything left in the buffer, once the stream has ended"""
+        segment, self.buffer, self.scanned = self.buffer.strip(), u"", 0
+        return segment
+
+class StreamTurn(object):
+    """Speaks a stream of text deltas, queueing each segment to the NAO as soon as it's complete"""
+
+    def __init__(self, turn):
+        """
+        Args:
+            turn (str): The id of the turn, given by the host
+        """
+        self.turn = turn
+        self.generation = nao_controller.generation  # Segments are dropped after a stop, like the rest of the turn
+        self.queued = []
+        self.assembler = SpeechAssembler()
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')  # Deltas can split characters
+
+    def queue(self, texts):
+        """Queue segments to speak, waiting for room rather than dropping part of the stream"""
+        for text in texts:
+            self.queued.append((command_queue.put([text], block=True, generation=self.generation)[0], text))
+
+    def feed(self, data):
+        """Add the next UTF-8 encoded delta of the stream"""
+        self.queue(self.assembler.feed(self.decoder.decode(data)))
+
+    def close(self):
+        """
+        End the stream, queueing whatever is left
+
+        Returns:
+            dict: The ids and texts of the segments queued
+        """
+        self.queue(self.assembler.feed(self.decoder.decode('', final=True)))
+        self.queue(filter(None, [self.assembler.flush()]))
+        logger.info("Streamed turn %s in %d segments", self.turn, len(self.queued))
+        return {'success': True, 'turn': self.turn, 'ids': [uid for uid, _ in self.queued],
+                'texts': [text for _, text in self.queued]}
+
 class NAOBridgeHandler(BaseHTTPRequestHandler):
     """HTTP handler for NAO Bridge requests"""
+    # Keep connections open between requests, so each command doesn't open a new one
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEP_ALIVE_TIMEOUT # Gives up on a request stalled for longer
+    # Buffer each response and send it at once without waiting for ACKs. Otherwise the
+    # headers and body go in separate packets, and a kept-alive connection waits ~40 ms on delayed ACKs
+    wbufsize = -1
+    disable_nagle_algorithm = True
     
+    def handle(self):
+        """Serve one request, and any already read after it. The server watches the connection
+        for the next one without holding a worker, see PooledHTTPServer"""
+        self.close_connection = 1
+        self.handle_one_request()
+        while not self.close_connection and self.rfile._rbuf.tell():  # Pipelined requests
+            self.handle_one_request()
+
     def log_message(self, format, *args):
         # Override to use our logger
         logger.info("%s - %s", self.address_string(), format % args)
     
-    def _set_headers(self, status_code=200):
-        """Set response headers"""
+    def _respond(self, response, status_code=200, headers=None):
+        """Send response as JSON, with the length needed to keep the connection open"""
+        body = json.dumps(response)
         self.send_response(status_code)
         self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
         self.end_headers()
+        self.wfile.write(body)
     
+    def do_GET(self):
+        """Handle GET requests for robot state"""
+        url = urlparse.urlparse(self.path)
+        query = urlparse.parse_qs(url.query)
+        if url.path == '/attention':
+            if face_watcher is None:
+                self._respond({'error': 'Face detection not enabled, start the bridge with "vision"'}, 404)
+                return
+            known = query.get('engaged', [None])[0]
+            wait = float(query.get('wait', [0])[0])
+            state = face_watcher.state(None if known is None else known == '1', wait)
+            self._respond(state)
+            return
+        if url.path == '/utterance':
+            try:
+                uid = int(query['id'][0])
+            except (KeyError, ValueError):
+                self._respond({'error': 'No utterance id provided'}, 400)
+                return
+            utterance = utterances.wait(uid, float(query.get('wait', [0])[0]))
+            if utterance is None:
+                self._respond({'error': 'Unknown utterance'}, 404)
+            else:
+                self._respond(utterance)
+            return
+        if url.path == '/status':
+            status = command_queue.status()
+            status['connections_waiting'] = self.server.connections.qsize()
+            status['connections_idle'] = len(self.server.idle)
+            self._respond(status)
+            return
+        self._respond({'error': 'Unknown path'}, 404)
+
     def do_OPTIONS(self):
         """Handle OPTIONS requests for CORS"""
-        self._set_headers()
-        response = {'status': 'ok'}
-        self.wfile.write(json.dumps(response))
+        self._respond({'status': 'ok'})
     
+    def _read_body(self):
+        """Yield the request body as it arrives, chunk by chunk if it's sent chunked"""
+        if self.headers.getheader('Transfer-Encoding', '').lower() != 'chunked':
+            yield self.rfile.read(int(self.headers.getheader('Content-Length', 0)))
+            return
+        while True:
+            size = int(self.rfile.readline().split(';')[0].strip(), 16)
+            if size == 0:
+                while self.rfile.readline().strip():  # Skip any trailers
+                    pass
+                return
+            chunk = self.rfile.read(size)
+            self.rfile.readline()  # The line break ending the chunk
+            yield chunk
+
+    def _stream(self, turn):
+        """
+        Speak raw text deltas streamed in the request body, each segment as soon as it's complete.
+        Responds once the stream ends, with the ids and texts of the segments queued
+        """
+        stream = StreamTurn(turn)
+        try:
+            for chunk in self._read_body():
+                stream.feed(chunk)
+        finally:
+            response = stream.close()
+        self._respond(response)
+
     def do_POST(self):
-        """Handle POST requests to send text to NAO"""
+        """Handle POST requests to send text, or a batch of texts run in order, to NAO.
+        "stop" and "emergency" on their own are run at once, see CommandQueue.urgent.
+        POST /stream?turn=<id> speaks a stream of text instead, see _stream"""
+        url = urlparse.urlparse(self.path)
+        if url.path == '/stream':
+            try:
+                self._stream(urlparse.parse_qs(url.query).get('turn', [None])[0])
+            except Exception as e:
+                logger.error("Error processing stream: %s", e)
+                self._respond({'error': str(e)}, 500)
+            return
         content_length = int(self.headers.getheader('Content-Length', 0))
         post_data = self.rfile.read(content_length)
         
         try:
             data = json.loads(post_data)
             
-            if 'text' not in data:
-                self._set_headers(400)
-                response = {'error': 'No text provided'}
-                self.wfile.write(json.dumps(response))
+            if 'batch' in data:
+                texts = data['batch']
+                if not isinstance(texts, list) or not all(isinstance(t, basestring) for t in texts):
+                    self._respond({'error': 'Batch must be a list of texts'}, 400)
+                    return
+            elif 'text' in data:
+                texts = [data['text']]
+                # Stop right away, so it isn't queued behind the speech it stops
+                if texts[0].lower() in URGENT_COMMANDS:
+                    self._respond(command_queue.urgent(texts[0]))
+                    return
+            else:
+                self._respond({'error': 'No text provided'}, 400)
                 return
+            # Process the requests in order without blocking the response
+            ids = queue_texts(texts)
             
-            text = data['text']
+            # Return success immediately, with the ids to wait for them on /utterance
+            if 'batch' in data:
+                self._respond({'success': True, 'ids': ids, 'queued': command_queue.queued})
+            else:
+                self._respond({'success': True, 'id': ids[0], 'queued': command_queue.queued})
             
-            # Process the request without blocking the response
-            def process_nao_request():
+        except QueueFull as e:
+            logger.warning("Turning away %d texts: %s", len(texts), e)
+            self._respond({'error': 'busy', 'retry_after': e.retry_after, 'queued': command_queue.queued}, 429,
+                          {'Retry-After': str(e.retry_after)})
+        except ValueError:
+            self._respond({'error': 'Invalid JSON'}, 400)
+        except Exception as e:
+            logger.error("Error processing request: %s", e)
+            self._respond({'error': str(e)}, 500)
+
+class QueueFull(Exception):
+    """Raised when the command queue has no room, with the seconds to wait before retrying"""
+
+    def __init__(self, retry_after):
+        Exception.__init__(self, "Command queue is full, retry in %d s" % retry_after)
+        self.retry_after = retry_after
+
+class CommandQueue(object):
+    """
+    Runs speech and commands on the NAO one at a time, in the order they were queued, on a single thread.
+    Only so many are queued at once, so a burst of requests can't pile up threads or overlap speech
+    """
+
+    def __init__(self, depth=COMMAND_QUEUE_DEPTH):
+        """
+        Args:
+            depth (int): Most texts queued or running at once
+        """
+        self.depth = depth
+        self.batches = collections.deque()  # (requests, generation) waiting to run
+        self.queued = 0  # Texts queued or running
+        self.rejected = 0  # Batches turned away as the queue was full
+        self.mean = 1.0  # Moving mean of seconds per text, for the retry hint
+        self.changed = threading.Condition()
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+
+    def put(self, texts, block=False, generation=None):
+        """
+        Queue texts to run in order after everything already queued. A batch larger than the queue
+        is still taken once the queue is empty
+
+        Args:
+            texts (list): The texts to say or run
+            block (bool): Wait for room if the queue is full, instead of raising QueueFull
+            generation (int): The generation texts were requested in, if not the current one
+
+        Returns:
+            list: The utterance id of each text
+        """
+        with self.changed:
+            while self.queued and self.queued + len(texts) > self.depth:
+                if not block:
+                    self.rejected += 1
+                    raise QueueFull(self.retry_after())
+                self.changed.wait()
+            requests = [(utterances.add(text), text) for text in texts]
+            self.batches.append((requests, nao_controller.generation if generation is None else generation))
+            self.queued += len(requests)
+            self.changed.notify_all()
+        return [uid for uid, _ in requests]
+
+    def run(self):
+        while True:
+            with self.changed:
+                while not self.batches:
+                    self.changed.wait()
+                requests, generation = self.batches.popleft()
+            start = time.time()
+            try:
+                process_nao_requests(requests, generation)
+            finally:
+                with self.changed:
+                    self.queued -= len(requests)
+                    self.mean = 0.8 * self.mean + 0.2 * (time.time() - start) / len(requests)
+                    self.changed.notify_all()
+
+    def urgent(self, text):
+        """
+        Run an urgent command now, on the caller's thread, ahead of everything queued. The queued speech is
+        dropped, and what's being said is cancelled
+
+        Returns:
+            dict: The response, with the seconds until the NAO was quiet
+        """
+        self.flush()
+        latency = nao_controller.emergency() if text.lower() == "emergency" else nao_controller.stop()
+        return {'success': latency is not None, 'stopped_in': latency}
+
+    def flush(self):
+        """Drop everything queued that hasn't started, marking it stopped"""
+        with self.changed:
+            batches = list(self.batches)
+            self.batches.clear()
+            self.queued -= sum(len(requests) for requests, _ in batches)
+            self.changed.notify_all()
+        for requests, _ in batches:
+            for uid, text in requests:
+                utterances.update(uid, 'stopped')
+        if batches:
+            logger.info("Dropped %d queued texts", sum(len(requests) for requests, _ in batches))
+
+    def retry_after(self):
+        """Seconds until there's likely room, as a whole number for Retry-After"""
+        return max(1, int(math.ceil(self.mean)))
+
+    def status(self):
+        with self.changed:
+            status = {'queued': self.queued, 'capacity': self.depth, 'rejected': self.rejected,
+                      'seconds_per_text': round(self.mean, 3)}
+        latencies = list(nao_controller.stop_latencies)
+        if latencies:
+            status['stop_latency'] = {'mean': round(sum(latencies) / len(latencies), 3),
+                                      'max': round(max(latencies), 3), 'count': len(latencies)}
+        return status
+
+def queue_texts(texts):
+    """
+    Run texts in order in the background, after everything already queued
+
+    Returns:
+        list: The utterance id of each text
+
+    Raises:
+        QueueFull: If there's no room for texts
+    """
+    return command_queue.put(texts)
+
+def process_nao_requests(requests, generation):
+    """
+    Run requests one after another, dropping those made before a stop
+
+    Args:
+        requests (list): (id, text) of each request, in order
+        generation (int): The generation the requests were made in
+    """
+    for uid, text in requests:
+        state = 'failed'
+        try:
+            if text.lower() in URGENT_COMMANDS:  # Only in a batch, where it stops what came before it
+                nao_controller.emergency() if text.lower() == "emergency" else nao_controller.stop()
+                generation = nao_controller.generation
+                state = 'done'
+                continue
+            if generation != nao_controller.generation:
+                logger.info("Dropping speech queued before stop: %s", text)
+                state = 'stopped'
+                continue
+            success = nao_controller.say(text, lambda: utterances.update(uid, 'speaking'), generation)
+            if generation != nao_controller.generation:
+                state = 'stopped'
+            elif success:
+                state = 'done'
+        except Exception as e:
+            logger.error("Error processing NAO request: %s", e)
+        finally:
+            utterances.update(uid, state)
+
+class FrameConnection(object):
+    """
+    A host connected over the framed socket protocol. Each frame is a FRAME_HEADER followed by its payload.
+    Requests and responses are JSON, matched by request id. Request id 0 gets no response.
+    Events, such as utterances finishing or engagement changing, and audio packets are pushed as they happen
+    """
+
+    def __init__(self, conn, address):
+        self.conn = conn
+        self.address = address
+        self.write_lock = threading.Lock()
+        self.audio = None  # Queue of audio packets, once subscribed
+        self.turns = {}  # Streamed turns in progress, by turn id
+        self.feeds = {}  # Queue of (request id, request) for each streamed turn's feeder thread, by turn id
+        self.open = True
+
+    def send(self, kind, rid, payload):
+        """Send one frame. Called from any thread"""
+        with self.write_lock:
+            self.conn.sendall(FRAME_HEADER.pack(len(payload), kind, rid) + payload)
+
+    def event(self, message):
+        """Push an event, dropping the connection if it fails"""
+        if not self.open:
+            return
+        try:
+            self.send(FRAME_EVENT, 0, json.dumps(message))
+        except socket.error:
+            self.open = False
+
+    def push_audio(self, packet):
+        """Queue an audio packet, dropping it if the host has fallen behind"""
+        try:
+            self.audio.put_nowait(packet)
+        except Queue.Full:
+            pass
+
+    def send_audio(self):
+        """Send queued audio packets until the connection closes, which queues None"""
+        try:
+            while self.open:
+                packet = self.audio.get()
+                if packet is None:
+                    break
+                self.send(FRAME_AUDIO, 0, packet)
+        except socket.error:
+            self.open = False
+
+    def read_exact(self, size):
+        data = ""
+        while len(data) < size:
+            chunk = self.conn.recv(size - len(data))
+            if not chunk:
+                raise EOFError()
+            data += chunk
+        return data
+
+    def serve(self):
+        """Read and handle frames until the host disconnects"""
+        try:
+            while self.open:
+                size, kind, rid = FRAME_HEADER.unpack(self.read_exact(FRAME_HEADER.size))
+                if size > MAX_FRAME:
+                    logger.error("Frame of %d bytes from %s is too large", size, self.address)
+                    break
+                payload = self.read_exact(size)
+                if kind == FRAME_REQUEST:
+                    self.dispatch(rid, json.loads(payload))
+        except (EOFError, socket.error, ValueError) as e:
+            logger.info("Socket client disconnected: %s (%s)", self.address, e)
+        finally:
+            self.open = False
+            for feed in self.feeds.values():
+                feed.put(None)  # Ends the feeder, dropping the rest of its turn
+            if self.audio is not None:
                 try:
-                    nao_controller.say(text)
-                except Exception as e:
-                    logger.error("Error processing NAO request: %s", e)
-            
-            # Start a new thread to process the request
-            thread = threading.Thread(target=process_nao_request)
+                    audio_streamer.listeners.remove(self.push_audio)
+                except ValueError:
+                    pass
+                try:
+                    self.audio.put_nowait(None)  # Wakes send_audio, which otherwise sees open is unset after its next packet
+                except Queue.Full:
+                    pass
+            self.conn.close()
+
+    def dispatch(self, rid, message):
+        """
+        Handle a request in order, apart from those that wait, which run on their own thread, and a streamed
+        turn's deltas, which run in order on the turn's feeder as they can wait for room in the command queue.
+        So the next request, such as a stop, is always read at once
+        """
+        if message.get('op') in ('delta', 'end'):
+            turn = message['turn']
+            if turn not in self.feeds:
+                self.feeds[turn] = Queue.Queue()
+                thread = threading.Thread(target=self.feed, args=(self.feeds[turn],))
+                thread.daemon = True
+                thread.start()
+            feed = self.feeds.pop(turn) if message['op'] == 'end' else self.feeds[turn]
+            feed.put((rid, message))
+        elif message.get('wait'):
+            thread = threading.Thread(target=self.handle, args=(rid, message))
             thread.daemon = True
             thread.start()
-            
-            # Return success immediately
-            self._set_headers()
-            response = {'success': True}
-            self.wfile.write(json.dumps(response))
-            
-        except ValueError:
-            self._set_headers(400)
-            response = {'error': 'Invalid JSON'}
-            self.wfile.write(json.dumps(response))
+        else:
+            self.handle(rid, message)
+
+    def feed(self, feed):
+        """Handle the requests of a streamed turn in order, until its end or the connection closing"""
+        while True:
+            item = feed.get()
+            if item is None:
+                break
+            self.handle(*item)
+            if item[1]['op'] == 'end':
+                break
+
+    def handle(self, rid, message):
+        """Run a request and send its response"""
+        op = message.get('op')
+        try:
+            if op == 'say' and message['text'].lower() in URGENT_COMMANDS:
+                response = command_queue.urgent(message['text'])
+            elif op == 'say':
+                response = {'success': True, 'id': queue_texts([message['text']])[0], 'queued': command_queue.queued}
+            elif op == 'batch':
+                response = {'success': True, 'ids': queue_texts(message['texts']), 'queued': command_queue.queued}
+            elif op == 'status':
+                response = command_queue.status()
+            elif op == 'delta':
+                turn = message['turn']
+                if turn not in self.turns:
+                    self.turns[turn] = StreamTurn(turn)
+                self.turns[turn].feed(message['text'].encode('utf-8'))
+                response = {'success': True}
+            elif op == 'end':
+                turn = self.turns.pop(message['turn'], None) or StreamTurn(message['turn'])
+                response = turn.close()
+            elif op == 'utterance':
+                response = utterances.wait(int(message['id']), float(message.get('wait', 0))) or \
+                    {'error': 'Unknown utterance'}
+            elif op == 'attention':
+                response = face_watcher.state(message.get('engaged'), float(message.get('wait', 0))) \
+                    if face_watcher is not None else {'error': 'Face detection not enabled, start the bridge with "vision"'}
+            elif op == 'subscribe':
+                if message.get('audio') and audio_streamer is not None and self.audio is None:
+                    self.audio = Queue.Queue(AUDIO_CLIENT_QUEUE)
+                    audio_streamer.listeners.append(self.push_audio)
+                    thread = threading.Thread(target=self.send_audio)
+                    thread.daemon = True
+                    thread.start()
+                response = {'success': True, 'audio': self.audio is not None}
+            else:
+                response = {'error': 'Unknown op: %s' % op}
+        except QueueFull as e:
+            logger.warning("Turning away a socket request: %s", e)
+            response = {'error': 'busy', 'retry_after': e.retry_after, 'queued': command_queue.queued}
         except Exception as e:
-            logger.error("Error processing request: %s", e)
-            self._set_headers(500)
+            logger.error("Error processing socket request: %s", e)
             response = {'error': str(e)}
-            self.wfile.write(json.dumps(response))
+        if rid:
+            try:
+                self.send(FRAME_RESPONSE, rid, json.dumps(response))
+            except socket.error:
+                self.open = False
+
+class FrameServer(object):
+    """Accepts hosts over the framed socket protocol, on TCP or a Unix domain socket"""
+
+    def __init__(self, host, port, path=None):
+        """
+        Args:
+            host (str): Host to accept TCP clients on
+            port (int): Port to accept TCP clients on
+            path (str): If set, a Unix domain socket to accept clients on instead of TCP
+        """
+        self.address = path or (host, port)
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Accept hosts in the background, pushing events to all of them"""
+        if isinstance(self.address, tuple):
+            server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        else:
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            if os.path.exists(self.address):
+                os.remove(self.address)
+        server.bind(self.address)
+        server.listen(5)
+        utterances.listeners.append(lambda utterance: self.broadcast(dict(utterance, event='utterance')))
+        if face_watcher is not None:
+            face_watcher.listeners.append(lambda state: self.broadcast(dict(state, event='attention')))
+        thread = threading.Thread(target=self.accept, args=(server,))
+        thread.daemon = True
+        thread.start()
+        logger.info("Accepting socket clients at %s", self.address)
+
+    def accept(self, server):
+        while True:
+            conn, address = server.accept()
+            if isinstance(self.address, tuple):
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection = FrameConnection(conn, address or self.address)
+            with self.lock:
+                self.connections = [c for c in self.connections if c.open] + [connection]
+            logger.info("Socket client connected: %s", connection.address)
+            thread = threading.Thread(target=connection.serve)
+            thread.daemon = True
+            thread.start()
 
-class ThreadedHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
-    """Handle requests in a separate thread."""
-    pass
+    def broadcast(self, message):
+        """Push an event to every connected host"""
+        with self.lock:
+            connections = list(self.connections)
+        for connection in connections:
+            connection.event(message)
+
+class PooledHTTPServer(HTTPServer):
+    """Handle requests on a fixed pool of threads, queueing those that come while all are busy.
+    Kept-alive connections are only held by a worker while a request is served. Between requests
+    one thread watches them, and queues each again once its next request arrives, so idle hosts
+    can't take every worker and keep a stop waiting"""
+
+    def __init__(self, address, handler, workers=HTTP_WORKERS):
+        HTTPServer.__init__(self, address, handler)
+        self.connections = Queue.Queue()  # (socket, address) with a request to serve
+        self.idle = {}  # Kept-alive sockets between requests, to (address, idle since)
+        self.idle_lock = threading.Lock()
+        # Interrupts the watcher's select when a connection goes idle. UDP to itself, as pipes can't be selected on Windows
+        self.waker = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.waker.bind(('127.0.0.1', 0))
+        for _ in range(workers):
+            thread = threading.Thread(target=self.work)
+            thread.daemon = True  # Connections kept open don't stop the server exiting
+            thread.start()
+        thread = threading.Thread(target=self.watch_idle)
+        thread.daemon = True
+        thread.start()
+
+    def process_request(self, request, client_address):
+        self.connections.put((request, client_address))
+
+    def finish_request(self, request, client_address):
+        """
+        Serve the connection's next request
+
+        Returns:
+            bool: If the connection is kept open for another
+        """
+        return not self.RequestHandlerClass(request, client_address, self).close_connection
+
+    def work(self):
+        while True:
+            request, client_address = self.connections.get()
+            try:
+                if self.finish_request(request, client_address):
+                    with self.idle_lock:
+                        self.idle[request] = (client_address, time.time())
+                    self.waker.sendto('!', self.waker.getsockname())
+                    continue
+            except Exception:
+                self.handle_error(request, client_address)
+            self.shutdown_request(request)
+
+    def watch_idle(self):
+        """Queue idle connections as their next request, or their close, arrives. Close those idle for KEEP_ALIVE_TIMEOUT"""
+        while True:
+            with self.idle_lock:
+                sockets = list(self.idle)
+            readable = select.select(sockets + [self.waker], [], [], 1.0)[0]
+            if self.waker in readable:
+                self.waker.recv(4096)
+            now = time.time()
+            with self.idle_lock:
+                for request in readable:
+                    if request in self.idle:
+                        self.connections.put((request, self.idle.pop(request)[0]))
+                expired = [request for request, (_, since) in self.idle.items() if now - since > KEEP_ALIVE_TIMEOUT]
+                for request in expired:
+                    del self.idle[request]
+            for request in expired:
+                self.shutdown_request(request)
 
 def run_server(host, port):
     """Run the HTTP server"""
     try:
-        server = ThreadedHTTPServer((host, port), NAOBridgeHandler)
+        server = PooledHTTPServer((host, port), NAOBridgeHandler)
         logger.info("Starting Direct NAO Bridge server at http://%s:%s", host, port)
         logger.info("Press Ctrl+C to exit")
         server.serve_forever()
@@ -327,17 +1437,75 @@ def run_server(host, port):
     except Exception as e:
         logger.error("Server error: %s", e)
 
+def parse_args(argv):
+    """
+    Parse [ip] [language] [volume] followed, or preceded, by any of the flags:
+    "audio" streams the NAO microphones, "vision" watches for faces,
+    "socket" accepts framed socket clients on SOCKET_PORT and "socket=<path>" on a Unix domain socket,
+    "port=<n>" serves HTTP on n, audio on n+1 and sockets on n+2, so one host can run a bridge per robot.
+    Flags aren't counted as positional arguments, so "bridge.py <ip> audio" keeps the default language
+
+    Args:
+        argv (list): The arguments, without the script name
+
+    Returns:
+        dict: The settings, with defaults for anything not given
+    """
+    args = {'robot_ip': DEFAULT_IP, 'language': DEFAULT_LANGUAGE, 'volume': DEFAULT_VOLUME,
+            'audio': False, 'vision': False, 'socket': None, 'port': None}
+    positional = []
+    for arg in argv:
+        name, equals, value = arg.partition("=")
+        if arg in ("audio", "vision"):
+            args[arg] = True
+        elif name == "socket":
+            args['socket'] = value if equals else True
+        elif name == "port" and equals:
+            args['port'] = int(value)
+        else:
+            positional.append(arg)
+    if len(positional) > 3:
+        raise ValueError("Unknown arguments: %s" % " ".join(positional[3:]))
+    for key, value in zip(('robot_ip', 'language', 'volume'), positional):
+        args[key] = value
+    args['volume'] = int(args['volume'])
+    return args
+
 if __name__ == "__main__":
     # Get arguments
-    robot_ip = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_IP
-    language = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_LANGUAGE
-    volume = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_VOLUME
+    args = parse_args(sys.argv[1:])
+    robot_ip, language, volume = args['robot_ip'], args['language'], args['volume']
+    stream_audio = args['audio']
+    watch_faces = args['vision']
+    if args['port'] is not None:
+        PORT, AUDIO_PORT, SOCKET_PORT = args['port'], args['port'] + 1, args['port'] + 2
     
     # Initialize NAO controller
     nao_controller = NAOController(robot_ip, language, volume)
+    command_queue = CommandQueue()
+
+    # Stream the NAO microphones if requested
+    audio_streamer = None
+    if stream_audio:
+        audio_streamer = AudioStreamer(robot_ip, HOST, AUDIO_PORT)
+        audio_streamer.start()
+
+    # Watch for faces if requested
+    face_watcher = None
+    if watch_faces:
+        face_watcher = FaceWatcher(robot_ip)
+        face_watcher.start()
+
+    # Accept framed socket clients if requested
+    if args['socket']:
+        FrameServer(HOST, SOCKET_PORT, args['socket'] if args['socket'] is not True else None).start()
     
     # Start server
     run_server(HOST, PORT)
+    if audio_streamer is not None:
+        audio_streamer.stop()
+    if face_watcher is not None:
+        face_watcher.stop()
 
     # The main issues are related to:
     # 1. NAOqi SDK discovery and loading
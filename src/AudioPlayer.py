@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import threading
+import time
+from io import BytesIO
+
+try:
+    import numpy as np
+    import sounddevice as sd
+    AUDIO_PLAYER_AVAILABLE = True
+except (ImportError, OSError):
+    AUDIO_PLAYER_AVAILABLE = False
+
+try:
+    import soundfile as sf
+    SOUNDFILE_AVAILABLE = True
+except (ImportError, OSError):
+    SOUNDFILE_AVAILABLE = False
+
+def resample(samples, rate, target_rate):
+    """
+    Resamples mono samples from rate to target_rate via linear interpolation
+    """
+    if rate == target_rate or len(samples) == 0:
+        return samples
+    length = int(round(len(samples) * target_rate / float(rate)))
+    positions = np.arange(length, dtype=np.float64) * (rate / float(target_rate))
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+def decode(data, samplerate):
+    """
+    Decodes compressed audio, such as MP3, into mono float32 samples.
+    Done in-process via soundfile, falling back to pydub which runs ffmpeg,
+    also used for formats the installed libsndfile can't read, such as MP3 before libsndfile 1.1
+
+    Args:
+        data (bytes): The compressed audio
+        samplerate (int): The sample rate to return
+
+    Returns:
+        np.ndarray: The samples, between -1 and 1
+    """
+    samples = None
+    if SOUNDFILE_AVAILABLE:
+        try:
+            samples, rate = sf.read(BytesIO(data), dtype="float32", always_2d=True)
+            samples = samples[:, 0] if samples.shape[1] == 1 else samples.mean(axis=1, dtype=np.float32)
+        except (RuntimeError, getattr(sf, "LibsndfileError", RuntimeError)): # Older soundfile raises RuntimeError
+            pass
+    if samples is None:
+        from pydub import AudioSegment
+        segment = AudioSegment.from_file(BytesIO(data)).set_channels(1)
+        samples = np.array(segment.get_array_of_samples(), dtype=np.float32)
+        samples /= float(1 << (8 * segment.sample_width - 1))
+        rate = segment.frame_rate
+    return np.ascontiguousarray(resample(samples, rate, samplerate))
+
+def bounds(samples, samplerate, threshold_db=-40.0, pad=0.05, frame=0.01):
+    """
+    Finds the speech in samples, padded by pad seconds on either side.
+    Silence is every frame quieter than threshold_db below the loudest frame
+
+    Args:
+        samples (np.ndarray): Mono float32 samples
+        samplerate (int): The sample rate of samples
+        threshold_db (float): Loudness, relative to the loudest frame, below which a frame is silent
+        pad (float): Seconds of silence kept before and after the speech
+        frame (float): Length of the frames compared, in seconds
+
+    Returns:
+        tuple: The first and last sample of the speech, as a slice
+    """
+    frame_len = max(int(samplerate * frame), 1)
+    count = len(samples) // frame_len
+    if count == 0:
+        return 0, len(samples)
+    frames = samples[:count * frame_len].reshape(count, frame_len)
+    energy = np.einsum("ij,ij->i", frames, frames) # Sum of squares per frame, without squaring into a copy
+    loud = np.flatnonzero(energy > energy.max() * 10 ** (threshold_db / 10.0))
+    if len(loud) == 0:
+        return 0, 0
+    padding = int(samplerate * pad)
+    return max(loud[0] * frame_len - padding, 0), min((loud[-1] + 1) * frame_len + padding, len(samples))
+
+def trim(samples, samplerate, threshold_db=-40.0, pad=0.05):
+    """
+    Trims leading and trailing silence, keeping pad seconds on either side of the speech
+
+    Returns:
+        np.ndarray: A view of samples without the silence, so nothing is copied
+    """
+    start, end = bounds(samples, samplerate, threshold_db, pad)
+    return samples[start:end]
+
+def normalize(samples, rms=0.1, peak=0.95):
+    """
+    Scales samples in place to an RMS loudness, without letting the peak go above peak
+
+    Args:
+        samples (np.ndarray): Mono float32 samples
+        rms (float): The target RMS, between 0 and 1
+        peak (float): The highest absolute sample allowed, between 0 and 1
+
+    Returns:
+        np.ndarray: samples, scaled
+    """
+    if len(samples) == 0:
+        return samples
+    current = np.sqrt(np.dot(samples, samples) / len(samples))
+    highest = max(samples.max(), -samples.min())
+    if current > 0 and highest > 0:
+        samples *= min(rms / current, peak / highest)
+    return samples
+
+class PlayHandle:
+    def __init__(self, samples, samplerate, idle):
+        """
+        Follows the playback of samples queued on an AudioPlayer
+
+        Args:
+            samples (np.ndarray): The queued samples
+            samplerate (int): The sample rate of the player
+            idle (bool): If nothing else was queued ahead of the samples
+        """
+        self.samples = samples
+        self.samplerate = samplerate
+        self.idle = idle
+        self.position = 0 # Samples played
+        self.queued_at = time.time()
+        self.start_time = None
+        self.end_time = None
+        self.done = threading.Event()
+
+    @property
+    def duration(self):
+        return len(self.samples) / float(self.samplerate)
+
+    @property
+    def played(self):
+        """
+        Returns:
+            float: The fraction of samples played
+        """
+        return self.position / float(max(len(self.samples), 1))
+
+class AudioPlayer:
+    def __init__(self, samplerate=24000, blocksize=512):
+        """
+        Plays queued samples back to back on a single output stream, which stays open.
+        This avoids opening the audio device for every string and the gaps between them
+
+        Args:
+            samplerate (int): The sample rate of the stream. Queued samples have to match it
+            blocksize (int): Samples written per callback. Smaller gives lower latency
+        """
+        self.samplerate = samplerate
+        self.handles = collections.deque()
+        self.lock = threading.Lock()
+        self.stream = sd.OutputStream(samplerate=samplerate, channels=1, dtype="float32",
+                                      blocksize=blocksize, callback=self.callback)
+        self.stream.start()
+
+    def callback(self, outdata, frames, time_info, status):
+        """
+        Fills outdata with the queued samples, and silence once they run out. Runs on the audio thread
+        """
+        filled = 0
+        now = time.time()
+        with self.lock:
+            while filled < frames and self.handles:
+                handle = self.handles[0]
+                if handle.start_time is None:
+                    handle.start_time = now + filled / float(self.samplerate)
+                n = min(frames - filled, len(handle.samples) - handle.position)
+                outdata[filled:filled + n, 0] = handle.samples[handle.position:handle.position + n]
+                handle.position += n
+                filled += n
+                if handle.position >= len(handle.samples):
+                    handle.end_time = now + filled / float(self.samplerate)
+                    handle.done.set()
+                    self.handles.popleft()
+        outdata[filled:] = 0
+
+    def enqueue(self, samples):
+        """
+        Queues samples to play after everything already queued
+
+        Args:
+            samples (np.ndarray): Mono float32 samples at the player's sample rate
+
+        Returns:
+            PlayHandle: Follows the playback of samples
+        """
+        with self.lock:
+            handle = PlayHandle(samples, self.samplerate, idle=not self.handles)
+            if len(samples) == 0:
+                handle.start_time = handle.end_time = handle.queued_at
+                handle.done.set()
+            else:
+                self.handles.append(handle)
+        return handle
+
+    def queued(self):
+        """
+        Returns:
+            float: Seconds of audio queued, including what's left of the current samples
+        """
+        with self.lock:
+            return sum(len(h.samples) - h.position for h in self.handles) / float(self.samplerate)
+
+    def stop(self):
+        """
+        Stops playback immediately and drops everything queued
+        """
+        with self.lock:
+            for handle in self.handles:
+                handle.done.set()
+            self.handles.clear()
+
+    def close(self):
+        self.stop()
+        self.stream.close()
+
+if __name__ == "__main__":
+    # Usage: python AudioPlayer.py [audio files ...]
+    # Shows how much silence trimming shortens each segment, which is the latency it saves
+    import sys
+    samplerate = 24000
+    segments = {}
+    for name in sys.argv[1:]:
+        with open(name, "rb") as f:
+            segments[name] = decode(f.read(), samplerate)
+    if not segments:
+        try:
+            from gtts import gTTS
+            for text in ["Hello there.", "I am Pepper, a humanoid robot.", "Ask me anything!"]:
+                fp = BytesIO()
+                gTTS(text).write_to_fp(fp)
+                segments[text] = decode(fp.getvalue(), samplerate)
+        except Exception as e: # Simulate speech with the silence gTTS adds, if it can't be reached
+            print("Simulating speech, as gTTS failed: {}".format(e))
+            for seconds in [0.8, 1.6, 2.4]:
+                t = np.arange(int(samplerate * seconds), dtype=np.float32) / samplerate
+                speech = (0.3 * np.sin(2 * np.pi * 220 * t) * np.sin(np.pi * 3 * t) ** 2).astype(np.float32)
+                silence = np.zeros(int(samplerate * 0.15), dtype=np.float32)
+                segments["{:.1f}s tone".format(seconds)] = np.concatenate([silence, speech, silence, silence])
+    leads, trails = [], []
+    for name, samples in segments.items():
+        start = time.time()
+        first, last = bounds(samples, samplerate)
+        normalize(samples[first:last])
+        elapsed = time.time() - start
+        leads.append(first / float(samplerate))
+        trails.append((len(samples) - last) / float(samplerate))
+        print("{}: {:.0f}ms leading and {:.0f}ms trailing silence trimmed in {:.2f}ms".format(
+            name, leads[-1] * 1000, trails[-1] * 1000, elapsed * 1000))
+    print("Latency saved per segment: {:.0f}ms before speech starts, {:.0f}ms between segments".format(
+        sum(leads) / len(leads) * 1000, (sum(leads) + sum(trails)) / len(leads) * 1000))
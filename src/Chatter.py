@@ -150,13 +150,31 @@ class Chatter:
             
             def res(self): # A hack to alternate return between generator and classic returns
                 response = ""
-                for chunk in self.stream_response():
-                    response += chunk
-                    yield chunk
-                self.messages.append({"role": "assistant", "content": response})
+                try:
+                    for chunk in self.stream_response():
+                        response += chunk
+                        yield chunk
+                finally: # Also reached if closed early, which closes the upstream request
+                    self.messages.append({"role": "assistant", "content": response})
             return res(self)
         except KeyError as KE: # In case the model is overloaded
             return "{}".format(KE)
+
+    def interrupt(self, response, spoken):
+        """
+        Stops a response which was interrupted, and only remembers the part which was spoken
+
+        Args:
+            response (str/Generator): The interrupted response, as returned when called
+            spoken (str): The part of response which was spoken
+        """
+        if hasattr(response, "close"):
+            response.close()
+        if self.messages and self.messages[-1]["role"] == "assistant":
+            self.messages.pop()
+        spoken = spoken.strip()
+        if spoken:
+            self.messages.append({"role": "assistant", "content": spoken})
                 
 if __name__ == "__main__":
     name = "Pepper"
@@ -4,10 +4,404 @@
 import openai
 import speech_recognition as sr
 import sounddevice
+import threading
+import time
+import numpy as np
+import collections
+import difflib
+import importlib.util
+import json
+import re
+import math
+import os
+import queue
+import socket
+import struct
+import wave
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeout
 from io import BytesIO
 
+RECOGNIZERS = ["google", "whisper", "whisper_local", "sphinx"]
+LOCAL_PACKAGES = {"whisper_local": "whisper", "sphinx": "pocketsphinx"} # Optional, from requirements-local.in
+
+def pcm_to_samples(pcm, width):
+    """
+    Converts little-endian PCM, as in WAV files, to float samples between -1 and 1.
+    8 bit PCM is unsigned, wider PCM is signed
+
+    Args:
+        pcm (bytes): The PCM frames
+        width (int): Bytes per sample, 1 to 4
+
+    Returns:
+        np.ndarray: The samples, as float64
+    """
+    if width == 1:
+        return (np.frombuffer(pcm, dtype=np.uint8).astype(np.float64) - 128) / 128
+    if width == 3:
+        b = np.frombuffer(pcm, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+        ints = np.where(ints >= 1 << 23, ints - (1 << 24), ints)
+    else:
+        ints = np.frombuffer(pcm, dtype="<i{}".format(width))
+    return ints.astype(np.float64) / float(1 << (8 * width - 1))
+
+def samples_to_pcm(samples, width):
+    """
+    Converts float samples between -1 and 1 to little-endian PCM. The inverse of pcm_to_samples
+
+    Returns:
+        bytes: The PCM frames
+    """
+    scale = float(1 << (8 * width - 1))
+    ints = np.clip(np.round(samples * scale), -scale, scale - 1).astype(np.int64)
+    if width == 1:
+        return (ints + 128).astype(np.uint8).tobytes()
+    if width == 3:
+        ints = ints & 0xFFFFFF
+        return np.stack([ints & 0xFF, (ints >> 8) & 0xFF, ints >> 16], axis=1).astype(np.uint8).tobytes()
+    return ints.astype("<i{}".format(width)).tobytes()
+
+def rms(pcm, width):
+    """
+    Returns:
+        float: The root mean square of signed PCM, in sample units like sr.Recognizer.energy_threshold
+    """
+    if len(pcm) < width:
+        return 0.0
+    ints = np.frombuffer(pcm, dtype="<i{}".format(width)) if width in (2, 4) else \
+        pcm_to_samples(pcm, width) * float(1 << (8 * width - 1))
+    return float(np.sqrt(np.mean(np.square(ints, dtype=np.float64))))
+
+class ReplaySource(sr.AudioSource):
+    def __init__(self, path, speed=1.0, gap=1.0, chunk_size=1024):
+        """
+        An audio source replaying recorded WAV files as if they were heard through a microphone.
+        Used for repeatable benchmarks of the full listening pipeline.
+
+        The replay acts like a paused tape, it only advances while read. 
+        All clips are converted to the format of the first one, as mono audio.
+
+        Args:
+            path (str): A directory of WAV files, played in alphabetical order, or a JSONL script.
+                Each script line is {"audio": "file.wav", "at": 3.5}, where "at" is an optional start time in 
+                seconds from the start of the replay. "audio" is relative to the script. 
+            speed (float): How fast audio is replayed. 1 is real time, 2 twice as fast and 0 as fast as possible
+            gap (float): Seconds of silence before each clip without a start time
+            chunk_size (int): Frames per read, matching sr.Microphone
+        """
+        self.path = path
+        self.speed = speed
+        self.CHUNK = chunk_size
+        clips = self.load_script(path)
+        if not clips:
+            raise Exception("No WAV files found in {}".format(path))
+        with wave.open(clips[0][1], "rb") as w:
+            self.SAMPLE_RATE = w.getframerate()
+            self.SAMPLE_WIDTH = w.getsampwidth()
+        data = bytearray()
+        for at, file in clips:
+            pcm = self.read_wav(file)
+            if at is None:
+                silence = int(gap * self.SAMPLE_RATE)
+            else:
+                silence = max(0, int(at * self.SAMPLE_RATE) - len(data) // self.SAMPLE_WIDTH)
+            data += bytes(silence * self.SAMPLE_WIDTH)
+            data += pcm
+        data += bytes(int(gap * self.SAMPLE_RATE) * self.SAMPLE_WIDTH) # Trailing silence ends the last phrase
+        self.data = memoryview(bytes(data))
+        self.position = 0
+        self.played = 0.0 # Seconds of audio played, used for pacing
+        self.stream = None
+
+    @staticmethod
+    def load_script(path):
+        """
+        Returns:
+            list: (start time or None, WAV path) for each clip in the replay
+        """
+        if os.path.isdir(path):
+            return [(None, os.path.join(path, f)) for f in sorted(os.listdir(path)) if f.lower().endswith(".wav")]
+        clips = []
+        with open(path) as f:
+            for line in f:
+                if not line.strip(): continue
+                entry = json.loads(line)
+                clips.append((entry.get("at"), os.path.join(os.path.dirname(path), entry["audio"])))
+        return clips
+
+    def read_wav(self, file):
+        """
+        Returns:
+            bytes: The frames of a WAV file, converted to the replay format
+        """
+        with wave.open(file, "rb") as w:
+            pcm, width, rate, channels = w.readframes(w.getnframes()), w.getsampwidth(), w.getframerate(), w.getnchannels()
+        if width == self.SAMPLE_WIDTH and rate == self.SAMPLE_RATE and channels == 1:
+            return pcm
+        samples = pcm_to_samples(pcm, width)
+        if channels > 1:
+            samples = samples[:len(samples) // channels * channels].reshape(-1, channels).mean(axis=1)
+        if rate != self.SAMPLE_RATE and len(samples):
+            # Linear interpolation onto the replay's sample times
+            length = int(round(len(samples) * self.SAMPLE_RATE / float(rate)))
+            samples = np.interp(np.arange(length) * (rate / float(self.SAMPLE_RATE)), np.arange(len(samples)), samples)
+        return samples_to_pcm(samples, self.SAMPLE_WIDTH)
+
+    @property
+    def done(self):
+        return self.position >= len(self.data)
+
+    def __enter__(self):
+        self.stream = self
+        self.resumed_at = time.time()
+        self.resumed_from = self.played
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stream = None
+
+    def read(self, size):
+        """
+        Returns the next size frames, waiting to keep pace with the replay speed. Empty once finished
+        """
+        chunk = self.data[self.position:self.position + size * self.SAMPLE_WIDTH].tobytes()
+        self.position += len(chunk)
+        self.played += len(chunk) / self.SAMPLE_WIDTH / self.SAMPLE_RATE
+        if self.speed > 0:
+            delay = self.resumed_at + (self.played - self.resumed_from) / self.speed - time.time()
+            if delay > 0: time.sleep(delay)
+        return chunk
+
+NAO_AUDIO_HEADER = struct.Struct("!Id") # Sequence number, capture time. Must match direct_nao_bridge.py
+NAO_AUDIO_FRAME_SAMPLES = 1024 # 16 bit mono samples per frame at 16 kHz
+
+class NAOAudioSource(sr.AudioSource):
+    def __init__(self, host="localhost", port=8081, buffer_frames=64, timeout=1.0):
+        """
+        An audio source streaming the NAO:s front microphone from the bridge server.
+        Frames are received on a background thread into a bounded buffer. When the buffer is full
+        the oldest frame is dropped. Frames buffered while not listening are flushed when listening starts.
+
+        Args:
+            host (str): The host running the bridge server
+            port (int): The audio port of the bridge server
+            buffer_frames (int): Frames buffered before dropping
+            timeout (float): Seconds to wait for a frame before yielding silence
+        """
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.SAMPLE_RATE = 16000
+        self.SAMPLE_WIDTH = 2
+        self.CHUNK = NAO_AUDIO_FRAME_SAMPLES
+        self.frame_bytes = NAO_AUDIO_FRAME_SAMPLES * self.SAMPLE_WIDTH
+        self.buffer = queue.Queue(maxsize=buffer_frames)
+        self.counts = {"received": 0, "dropped": 0, "lost": 0, "flushed": 0, "reconnects": 0}
+        self.stream = None
+        self.receiver = threading.Thread(target=self.receive, daemon=True)
+        self.receiver.start()
+
+    def recv_exact(self, sock, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk: raise ConnectionError("Bridge closed the audio stream")
+            data += chunk
+        return bytes(data)
+
+    def receive(self):
+        """
+        Receives frames from the bridge forever, reconnecting if the connection is lost.
+        Gaps in sequence numbers are counted as lost frames
+        """
+        last = None
+        while True:
+            try:
+                with socket.create_connection((self.host, self.port), timeout=5) as sock:
+                    sock.settimeout(None)
+                    while True:
+                        sequence, _ = NAO_AUDIO_HEADER.unpack(self.recv_exact(sock, NAO_AUDIO_HEADER.size))
+                        frame = self.recv_exact(sock, self.frame_bytes)
+                        if last is not None and sequence > last + 1:
+                            self.counts["lost"] += sequence - last - 1
+                        last = sequence
+                        self.counts["received"] += 1
+                        while True:
+                            try:
+                                self.buffer.put_nowait(frame)
+                                break
+                            except queue.Full:
+                                try:
+                                    self.buffer.get_nowait()
+                                    self.counts["dropped"] += 1
+                                except queue.Empty:
+                                    pass
+            except (OSError, ConnectionError):
+                self.counts["reconnects"] += 1
+                last = None
+                time.sleep(1)
+
+    def __enter__(self):
+        while True:
+            try:
+                self.buffer.get_nowait()
+                self.counts["flushed"] += 1
+            except queue.Empty:
+                break
+        self.stream = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stream = None
+
+    def read(self, size):
+        """
+        Returns the next frame. Silence if none arrives within timeout, so listening continues while reconnecting
+        """
+        try:
+            return self.buffer.get(timeout=self.timeout)
+        except queue.Empty:
+            return bytes(self.frame_bytes)
+
+    def print_stats(self):
+        print("NAO audio: {received} received, {dropped} dropped, {lost} lost, {flushed} flushed, {reconnects} reconnects".format(**self.counts))
+
+class WakeWordSpotter(object):
+    def __init__(self, keyword, sensitivity=0.8, spelling=None):
+        """
+        A local keyword spotter, using CMU Sphinx, which checks if a phrase contains keyword.
+        The decoder is kept loaded between phrases to keep each check cheap.
+        It runs on each whole phrase once it has ended, not on frames as they're heard, so it saves the
+        speech-to-text call for phrases without the keyword rather than starting to listen on the keyword.
+        Only supports the English models bundled with SpeechRecognition, so keyword, or spelling, has to be in its dictionary
+
+        Args:
+            keyword (str): The word or phrase to spot, such as the robot's name
+            sensitivity (float): 0 gives more missed keywords, 1 more false detections
+            spelling (str): Dictionary words which sound like keyword, such as "now" for "Nao". Defaults to keyword
+
+        Raises:
+            ValueError: If a word of the phrase spotted is not in the dictionary
+        """
+        try:
+            from pocketsphinx import pocketsphinx
+        except ImportError:
+            raise ImportError("wake_word needs pocketsphinx. Install it with: pip install -r requirements-local.in")
+        language_directory = os.path.join(os.path.dirname(os.path.realpath(sr.__file__)), "pocketsphinx-data", "en-US")
+        dictionary = os.path.join(language_directory, "pronounciation-dictionary.dict")
+        phrase = (spelling or keyword).lower()
+        with open(dictionary) as f:
+            words = {line.split(" ", 1)[0].split("(", 1)[0] for line in f}
+        missing = [word for word in phrase.split() if word not in words]
+        if missing: # Sphinx would only fail, or crash, once the decoder is built
+            raise ValueError("'{}' is not in the Sphinx dictionary, set wake_spelling to words that sound like it".format(" ".join(missing)))
+        config = pocketsphinx.Decoder.default_config()
+        config.set_string("-hmm", os.path.join(language_directory, "acoustic-model"))
+        config.set_string("-dict", dictionary)
+        config.set_string("-keyphrase", phrase)
+        config.set_float("-kws_threshold", 10 ** (100 * sensitivity - 110)) # Same scale as sr.Recognizer.recognize_sphinx
+        config.set_string("-logfn", os.devnull)
+        self.decoder = pocketsphinx.Decoder(config)
+        self.keyword = keyword
+
+    def __call__(self, audio_data):
+        """
+        Returns:
+            bool: If audio_data (sr.AudioData) contains the keyword
+        """
+        self.decoder.start_utt()
+        self.decoder.process_raw(audio_data.get_raw_data(convert_rate=16000, convert_width=2), False, True)
+        self.decoder.end_utt()
+        return self.decoder.hyp() is not None
+
+class EchoSuppressor(object):
+    def __init__(self, talker, tail=0.5, overlap=0.8, similarity=0.8, min_words=3, memory=30.0):
+        """
+        Keeps the listener from hearing the talker. Uses the speech the talker publishes in its speech_log.
+        Phrases mostly captured while the talker spoke are dropped before transcription, 
+        and transcriptions matching recently spoken text are dropped before reaching the chatter
+
+        Args:
+            talker (Talker): The talker whose speech is suppressed
+            tail (float): Seconds after speech ends that it's still heard, such as from reverb or late robots
+            overlap (float): Fraction of a phrase overlapping speech for it to be dropped
+            similarity (float): Fraction of a transcription's words found in spoken text for it to be dropped
+            min_words (int): Fewest words a transcription needs to be matched, so short replies such as "no" are kept
+            memory (float): Seconds spoken text is remembered for matching
+        """
+        self.talker = talker
+        self.tail = tail
+        self.overlap = overlap
+        self.similarity = similarity
+        self.min_words = min_words
+        self.memory = memory
+        self.counts = {"overlapping": 0, "matching": 0}
+
+    @staticmethod
+    def normalise(text):
+        return re.findall(r"\w+", text.lower())
+
+    def overlaps(self, start, end):
+        """
+        Whether a phrase captured from start to end was mostly captured while the talker spoke
+        """
+        if end <= start: return False
+        covered = 0.0
+        for speech_start, speech_end, _ in list(self.talker.speech_log):
+            covered += max(0.0, min(end, speech_end + self.tail) - max(start, speech_start))
+        if covered / (end - start) >= self.overlap:
+            self.counts["overlapping"] += 1
+            return True
+        return False
+
+    def is_echo(self, text):
+        """
+        Whether text matches something the talker recently said. Words are compared, against each run of
+        as many words in the recent speech, so a transcription only matches speech it could be an echo of
+        """
+        heard = self.normalise(text)
+        if len(heard) < self.min_words: return False
+        oldest = time.time() - self.memory
+        spoken = [word for _, speech_end, said in list(self.talker.speech_log) if speech_end >= oldest
+                  for word in self.normalise(said)]
+        matcher = difflib.SequenceMatcher(None, autojunk=False)
+        matcher.set_seq2(heard)
+        for i in range(max(len(spoken) - len(heard), 0) + 1):
+            matcher.set_seq1(spoken[i:i + len(heard)])
+            if sum(b.size for b in matcher.get_matching_blocks()) / len(heard) >= self.similarity:
+                self.counts["matching"] += 1
+                return True
+        return False
+
+    def print_stats(self):
+        print("Echo: {overlapping} phrases dropped as overlapping speech, {matching} transcriptions dropped as matching speech".format(**self.counts))
+
+class PrerollStream(object):
+    def __init__(self, frames, stream):
+        """
+        Wraps an audio stream so frames already captured, such as during barge-in, are read first
+
+        Args:
+            frames (list): Captured frames, oldest first
+            stream: The stream to read from once the frames are used
+        """
+        self.frames = collections.deque(frames)
+        self.stream = stream
+
+    def read(self, size):
+        if self.frames:
+            return self.frames.popleft()
+        return self.stream.read(size)
+
+    def close(self):
+        if hasattr(self.stream, "close"):
+            self.stream.close()
+
 class Listener():
-    def __init__(self, language="en", default_mic=True, use_whisper=False):
+    def __init__(self, language="en", default_mic=True, use_whisper=False,
+            recognizers=None, race_min_confidence=0.7, race_min_length=2, race_timeout=10.0, source=None,
+            wake_word=None, wake_window=20.0, wake_sensitivity=0.8, wake_spelling=None, echo_suppressor=None, attention=None):
         """
         Creates a Listener object for speech-to-text
 
@@ -15,13 +409,59 @@ class Listener():
             language (str): The ISO 639-1 code for the language used
             default_mic (bool): Wheter the default mic should be used. Otherwise user selects
             use_whisper (bool): If OpenAIs Whisper API should be used, worse in testing 
+            recognizers (list/str): Speech-to-text engines to race against each other, see RECOGNIZERS. 
+                Can be a comma separated string. If empty, only google or whisper is used depending on use_whisper
+            race_min_confidence (float): Lowest confidence at which a racing result is accepted. Ignored by engines without confidence
+            race_min_length (int): Shortest transcription, in characters, at which a racing result is accepted
+            race_timeout (float): Longest time, in seconds, to wait for any racing engine
+            source (sr.AudioSource): Audio source used instead of a microphone, such as a ReplaySource
+            wake_word (str): If set, phrases are only transcribed if they contain wake_word, or are heard 
+                within wake_window of the last transcribed phrase or response
+            wake_window (float): Seconds the conversation stays open after the wake word
+            wake_sensitivity (float): 0 gives more missed wake words, 1 more false wake ups
+            wake_spelling (str): Dictionary words which sound like wake_word, for names Sphinx doesn't know
+            echo_suppressor (EchoSuppressor): If set, used to drop phrases which are the talker's own speech
+            attention (NAOAttention): If set, only listens while someone is engaged
         """
         self.r = sr.Recognizer()
         self.language = language
         self.use_whisper = use_whisper
-        if use_whisper and not openai.api_key:
+        if isinstance(recognizers, str):
+            recognizers = [r.strip() for r in recognizers.split(",") if r.strip()]
+        if not recognizers:
+            recognizers = ["whisper" if use_whisper else "google"]
+        for engine in recognizers:
+            if engine not in RECOGNIZERS:
+                raise Exception("Unknown recognizer '{}'. Use one of: {}".format(engine, ", ".join(RECOGNIZERS)))
+            if engine in LOCAL_PACKAGES and importlib.util.find_spec(LOCAL_PACKAGES[engine]) is None:
+                raise ImportError("The '{}' recognizer needs {}. Install it with: pip install -r requirements-local.in".format(
+                    engine, LOCAL_PACKAGES[engine]))
+        self.recognizers = recognizers
+        self.race_min_confidence = race_min_confidence
+        self.race_min_length = race_min_length
+        self.race_timeout = race_timeout
+        self.engine_stats = {engine: {"calls": 0, "wins": 0, "errors": 0, "latency": 0.0} for engine in recognizers}
+        self.stats_lock = threading.Lock()
+        # Twice the engines, so engines still running from an abandoned race don't block the next one
+        self.executor = ThreadPoolExecutor(max_workers=2*len(recognizers)) if len(recognizers) > 1 else None
+        if "whisper" in recognizers and not openai.api_key:
             openai.api_key = open("openai.key").read().strip()
-        if default_mic:
+        self.heard_at = None # When the last phrase ended
+        self.preroll = [] # Frames captured by watch, heard before the next phrase
+        self.wake_spotter = None
+        if wake_word:
+            try:
+                self.wake_spotter = WakeWordSpotter(wake_word, wake_sensitivity, wake_spelling)
+            except (ValueError, RuntimeError) as e:
+                print("Warning: Wake word disabled, every phrase is transcribed. {}".format(e))
+        self.wake_window = wake_window
+        self.open_until = 0 # When the conversation closes and the wake word is needed again
+        self.wake_counts = {"phrases": 0, "woken": 0, "open": 0, "gated": 0}
+        self.echo_suppressor = echo_suppressor
+        self.attention = attention
+        if source is not None:
+            self.mic = source
+        elif default_mic:
             self.mic = sr.Microphone()
         else:
             print("Please select a microphone from this list:")
@@ -32,8 +472,12 @@ class Listener():
                 self.mic = sr.Microphone()
             else:
                 self.mic = sr.Microphone(device_index=id)
-        with self.mic as mic:
-            self.r.adjust_for_ambient_noise(mic)
+        if isinstance(self.mic, ReplaySource):
+            # A fixed threshold keeps replays deterministic
+            self.r.dynamic_energy_threshold = False
+        else:
+            with self.mic as mic:
+                self.r.adjust_for_ambient_noise(mic)
 
     def recognize_whisper_api(self, audio_data):
         """
@@ -50,18 +494,213 @@ class Listener():
         wav_data.name = "SpeechRecognition_aduio.wav"
         transcript = openai.Audio.transcribe("whisper-1", wav_data, api_key=openai.api_key,language=self.language)
         return transcript["text"]
-    
-    def __call__(self):
+
+    def recognize(self, engine, audio_data):
         """
-        Listens to and returns a transcription of the next heard phrase
+        Transcribes audio_data with a single engine
+
+        Args:
+            engine (str): One of RECOGNIZERS
+            audio_data (sr.AudioData): Audio to transcribe
+
+        Returns:
+            tuple: The transcription and its confidence. Confidence is None if the engine doesn't report one
         """
-        with self.mic as mic:
-            audio = self.r.listen(mic)
+        if engine == "google":
+            return self.r.recognize_google(audio_data, language=self.language, with_confidence=True)
+        elif engine == "whisper":
+            return self.recognize_whisper_api(audio_data), None
+        elif engine == "whisper_local":
+            return self.r.recognize_whisper(audio_data, model="base", language=self.language), None
+        elif engine == "sphinx":
+            return self.r.recognize_sphinx(audio_data), None
+        raise ValueError("Unknown recognizer '{}'".format(engine))
+
+    def timed_recognize(self, engine, audio_data):
+        """
+        Runs recognize and records the latency and outcome in engine_stats. Never raises
+
+        Returns:
+            tuple: The transcription and its confidence. ("", None) on failure
+        """
+        start = time.time()
         try:
-            if self.use_whisper: return self.recognize_whisper_api(audio)
-            else: return self.r.recognize_google(audio,language=self.language)
+            text, confidence = self.recognize(engine, audio_data)
+            failed = False
         except Exception:
-            return ""
+            text, confidence, failed = "", None, True
+        with self.stats_lock:
+            stats = self.engine_stats[engine]
+            stats["calls"] += 1
+            stats["latency"] += time.time() - start
+            stats["errors"] += failed
+        return text, confidence
+
+    def accept(self, text, confidence):
+        """
+        Whether a racing result is good enough to end the race
+        """
+        if len(text.strip()) < max(self.race_min_length, 1): return False
+        return confidence is None or confidence >= self.race_min_confidence
+
+    def race(self, audio_data):
+        """
+        Submits audio_data to every engine in recognizers concurrently. Returns the first accepted 
+        transcription and cancels the remaining engines. Engines already running are left to finish 
+        in the background, but their results are discarded.
+        If no engine is accepted the most confident, then longest, transcription is returned
+
+        Args:
+            audio_data (sr.AudioData): Audio to transcribe
+
+        Returns:
+            str: The transcription. Empty if no engine succeeded
+        """
+        futures = {self.executor.submit(self.timed_recognize, engine, audio_data): engine for engine in self.recognizers}
+        best, best_key, winner = "", None, None
+        try:
+            for future in as_completed(futures, timeout=self.race_timeout):
+                text, confidence = future.result()
+                if self.accept(text, confidence):
+                    best, winner = text, futures[future]
+                    break
+                key = (confidence or 0, len(text.strip()))
+                if text.strip() and (best_key is None or key > best_key):
+                    best, best_key, winner = text, key, futures[future]
+        except FutureTimeout:
+            pass
+        for future in futures:
+            future.cancel()
+        if winner is not None:
+            with self.stats_lock:
+                self.engine_stats[winner]["wins"] += 1
+        return best
+
+    def stats(self):
+        """
+        Returns:
+            dict: Per engine number of calls, wins, errors, win rate and mean latency in seconds
+        """
+        with self.stats_lock:
+            res = {}
+            for engine, s in self.engine_stats.items():
+                res[engine] = dict(s,
+                    win_rate=s["wins"] / s["calls"] if s["calls"] else 0.0,
+                    mean_latency=s["latency"] / s["calls"] if s["calls"] else 0.0)
+            return res
+
+    def print_stats(self):
+        """
+        Prints the stats of each engine
+        """
+        for engine, s in self.stats().items():
+            print("{}: {} calls, {:.0%} wins, {} errors, {:.2f}s mean latency".format(
+                engine, s["calls"], s["win_rate"], s["errors"], s["mean_latency"]))
+        if hasattr(self.mic, "print_stats"):
+            self.mic.print_stats()
+        if self.echo_suppressor is not None:
+            self.echo_suppressor.print_stats()
+        if self.attention is not None:
+            self.attention.print_stats()
+        if self.wake_spotter is not None:
+            print("Wake word: {gated} of {phrases} phrases gated, saving {gated} speech-to-text calls. {woken} wake ups".format(**self.wake_counts))
+
+    def keep_open(self):
+        """
+        Keeps an open conversation open for another wake_window, such as after responding
+        """
+        if time.time() < self.open_until:
+            self.open_until = time.time() + self.wake_window
+
+    def woken(self, audio_data):
+        """
+        Whether a phrase should be transcribed. Always true without a wake word.
+        Opens the conversation if the wake word is heard
+
+        Args:
+            audio_data (sr.AudioData): The phrase
+        """
+        if self.wake_spotter is None:
+            return True
+        self.wake_counts["phrases"] += 1
+        if time.time() < self.open_until:
+            self.wake_counts["open"] += 1
+        elif self.wake_spotter(audio_data):
+            self.wake_counts["woken"] += 1
+        else:
+            self.wake_counts["gated"] += 1
+            return False
+        self.open_until = time.time() + self.wake_window
+        return True
+    
+    def watch(self, stop, ratio=1.5, duration=0.3):
+        """
+        Waits for someone to start speaking, such as while talking to detect barge-in.
+        The frames leading up to the speech are kept and heard by the next call
+
+        Args:
+            stop (threading.Event): Stops watching when set
+            ratio (float): How many times louder than the energy threshold speech has to be
+            duration (float): Seconds of speech needed before it's detected
+
+        Returns:
+            bool: True if speech was detected, False if stopped
+        """
+        with self.mic as mic:
+            seconds_per_buffer = float(mic.CHUNK) / mic.SAMPLE_RATE
+            needed = max(1, int(math.ceil(duration / seconds_per_buffer)))
+            frames = collections.deque(maxlen=needed + int(math.ceil(self.r.non_speaking_duration / seconds_per_buffer)))
+            count = 0
+            while not stop.is_set():
+                buffer = mic.stream.read(mic.CHUNK)
+                if len(buffer) == 0: return False
+                frames.append(buffer)
+                if rms(buffer, mic.SAMPLE_WIDTH) > self.r.energy_threshold * ratio:
+                    count += 1
+                else:
+                    count = 0
+                if count >= needed:
+                    self.preroll = list(frames)
+                    return True
+        return False
+
+    def __call__(self):
+        """
+        Listens to and returns a transcription of the next heard phrase.
+        With a wake word, phrases are skipped until the conversation is open.
+        With an echo suppressor, phrases which are the talker's own speech are skipped.
+        With attention, listening waits for someone to engage and phrases heard once they left are skipped.
+        Raises EOFError when a replayed source is finished
+        """
+        while True:
+            if getattr(self.mic, "done", False):
+                raise EOFError("Replay finished")
+            if self.attention is not None:
+                self.attention.wait()
+            with self.mic as mic:
+                if self.preroll:
+                    mic.stream = PrerollStream(self.preroll, mic.stream)
+                    self.preroll = []
+                audio = self.r.listen(mic)
+                chunk = mic.CHUNK * mic.SAMPLE_WIDTH
+            self.heard_at = time.time()
+            if getattr(self.mic, "done", False) and not any( # The silence left at the end of a replay
+                    rms(audio.frame_data[i:i + chunk], audio.sample_width) > self.r.energy_threshold
+                    for i in range(0, len(audio.frame_data), chunk)):
+                raise EOFError("Replay finished")
+            if self.echo_suppressor is not None:
+                duration = len(audio.frame_data) / float(audio.sample_rate * audio.sample_width)
+                if self.echo_suppressor.overlaps(self.heard_at - duration, self.heard_at): continue
+            if self.attention is not None and not self.attention.engaged():
+                self.attention.gate()
+                continue
+            if not self.woken(audio): continue
+            if self.executor is not None:
+                heard = self.race(audio)
+            else:
+                heard = self.timed_recognize(self.recognizers[0], audio)[0]
+            if self.echo_suppressor is not None and self.echo_suppressor.is_echo(heard): continue
+            return heard
         
 if __name__ == "__main__":
     from Chatter import Chatter
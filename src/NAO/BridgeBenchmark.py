@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+from os import path
+# Append to path to find the "BridgeConnection" class in this dictionary
+sys.path.append(path.dirname(path.realpath(__file__)))
+import json
+import socket
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import requests
+from BridgeConnection import BridgeConnection, FRAME_HEADER, FRAME_REQUEST, FRAME_RESPONSE, FRAME_EVENT
+
+class MockBridgeHandler(BaseHTTPRequestHandler):
+    """
+    Answers like the bridge server in nao_py2_scripts/direct_nao_bridge.py, without a NAO
+    """
+    wbufsize = -1 # Sends each response at once, see NAOBridgeHandler
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, response, status_code=200):
+        body = json.dumps(response).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_OPTIONS(self):
+        self.respond({"status": "ok"})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/utterance":
+            self.respond({"error": "Unknown path"}, 404)
+            return
+        uid = int(parse_qs(url.query)["id"][0])
+        if not 0 < uid <= len(self.server.received):
+            self.respond({"error": "Unknown utterance"}, 404)
+            return
+        # The mock says everything instantly
+        self.respond({"id": uid, "text": self.server.received[uid - 1], "state": "done", "started": time.time(), "duration": 0.0})
+
+    def do_POST(self):
+        data = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if "batch" in data:
+            self.server.received.extend(data["batch"])
+            count = len(self.server.received)
+            self.respond({"success": True, "ids": list(range(count - len(data["batch"]) + 1, count + 1))})
+            return
+        if data["text"].lower() == "stop":
+            self.respond({"success": True})
+            return
+        self.server.received.append(data["text"])
+        self.respond({"success": True, "id": len(self.server.received)})
+
+class MockBridge:
+    def __init__(self, keep_alive=True, port=0):
+        """
+        Starts a mock bridge server in the background
+
+        Args:
+            keep_alive (bool): If connections are kept open, as with HTTP/1.1, or closed after each response as with HTTP/1.0
+            port (int): The port to listen on. 0 for any free port
+        """
+        handler = type("Handler", (MockBridgeHandler,), {"protocol_version": "HTTP/1.1" if keep_alive else "HTTP/1.0"})
+        self.server = ThreadingHTTPServer(("localhost", port), handler)
+        self.server.daemon_threads = True
+        self.server.received = []
+        self.url = "http://localhost:{}".format(self.server.server_address[1])
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class MockFrameHandler(socketserver.BaseRequestHandler):
+    """
+    Answers like the bridge's framed socket server in nao_py2_scripts/direct_nao_bridge.py, without a NAO
+    """
+
+    def setup(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def send(self, kind, rid, message):
+        payload = json.dumps(message).encode("utf-8")
+        self.request.sendall(FRAME_HEADER.pack(len(payload), kind, rid) + payload)
+
+    def handle(self):
+        reader = self.request.makefile("rb")
+        while True:
+            header = reader.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                return
+            size, kind, rid = FRAME_HEADER.unpack(header)
+            message = json.loads(reader.read(size))
+            if kind != FRAME_REQUEST:
+                continue
+            texts = message["texts"] if message["op"] == "batch" else [message.get("text", "")]
+            received = self.server.received
+            received.extend(texts)
+            ids = list(range(len(received) - len(texts) + 1, len(received) + 1))
+            if rid:
+                self.send(FRAME_RESPONSE, rid, {"success": True, "id": ids[-1], "ids": ids})
+            for uid, text in zip(ids, texts): # The mock says everything instantly
+                self.send(FRAME_EVENT, 0, {"event": "utterance", "id": uid, "text": text, "state": "done",
+                                           "started": time.time(), "duration": 0.0})
+
+class MockFrameBridge:
+    def __init__(self, port=0):
+        """
+        Starts a mock of the bridge's framed socket server in the background
+
+        Args:
+            port (int): The port to listen on. 0 for any free port
+        """
+        self.server = socketserver.ThreadingTCPServer(("localhost", port), MockFrameHandler)
+        self.server.daemon_threads = True
+        self.server.received = []
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def benchmark(url, send, count=200):
+    """
+    Times sending count commands
+
+    Args:
+        url (str): The URL of the bridge
+        send (function): Sends a command, taking the URL and the command
+        count (int): How many commands are sent
+
+    Returns:
+        float: Mean seconds per command
+    """
+    send(url, "e") # Not timed, so both start from a warm process
+    start = time.time()
+    for _ in range(count):
+        send(url, "e")
+    return (time.time() - start) / count
+
+if __name__ == "__main__":
+    # Usage: python BridgeBenchmark.py [bridge_url] [count]
+    # Compares the overhead per command of a new connection each time, a kept-alive session and
+    # the framed socket transport. Without a bridge_url it's measured against mock bridges.
+    # Against a real bridge OPTIONS is sent, and attention is asked over the socket, so the NAO doesn't act
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    session = requests.Session()
+    if len(sys.argv) > 1:
+        url = sys.argv[1]
+        new = benchmark(url, lambda u, c: requests.options(u, timeout=5), count)
+        kept = benchmark(url, lambda u, c: session.options(u, timeout=5), count)
+        try:
+            connection = BridgeConnection(host=url.split("://")[-1].split(":")[0])
+            framed = benchmark(url, lambda u, c: connection.request("attention"), count)
+        except OSError as e:
+            print("Socket transport not available, start the bridge with \"socket\": {}".format(e))
+            framed = None
+    else:
+        before, after, frames = MockBridge(keep_alive=False), MockBridge(keep_alive=True), MockFrameBridge()
+        new = benchmark(before.url, lambda u, c: requests.post(u, json={"text": c}, timeout=5), count)
+        kept = benchmark(after.url, lambda u, c: session.post(u, json={"text": c}, timeout=5), count)
+        connection = BridgeConnection(port=frames.port)
+        framed = benchmark(None, lambda u, c: connection.request("say", text=c), count)
+        # Saying and hearing it finished, pushed by the bridge, compared with polling for it over HTTP
+        def say_http(u, c):
+            uid = session.post(u, json={"text": c}, timeout=5).json()["id"]
+            session.get(u + "/utterance", params={"id": uid, "wait": 10}, timeout=15)
+        said_http = benchmark(after.url, say_http, count)
+        said_framed = benchmark(None, lambda u, c: connection.wait_utterance(connection.request("say", text=c)["id"], 10), count)
+        connection.close()
+        for bridge in (before, after, frames):
+            bridge.close()
+    print("New connection per command (HTTP/1.0): {:.2f}ms".format(new * 1000))
+    print("Kept-alive session (HTTP/1.1): {:.2f}ms".format(kept * 1000))
+    if framed is not None:
+        print("Framed socket: {:.2f}ms".format(framed * 1000))
+    if len(sys.argv) == 1:
+        print("Say and wait until done, HTTP long-poll: {:.2f}ms, framed socket push: {:.2f}ms".format(
+            said_http * 1000, said_framed * 1000))
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import collections
+import itertools
+import json
+import socket
+import struct
+import threading
+
+FRAME_HEADER = struct.Struct("!IBI") # Payload length, frame type, request id. Must match nao_py2_scripts/direct_nao_bridge.py
+FRAME_REQUEST, FRAME_RESPONSE, FRAME_EVENT, FRAME_AUDIO = 1, 2, 3, 4
+FINISHED = ("done", "stopped", "failed")
+
+class BridgeConnection:
+    def __init__(self, host: str = "localhost", port: int = 8082, path: str = "", timeout: float = 5.0):
+        """
+        A persistent connection to the bridge over its framed socket protocol, started with "socket".
+        Requests are matched to responses by id, so several can be in flight at once, and the bridge
+        pushes utterances as they start and finish instead of being polled for them
+
+        Args:
+            host (str): The host running the bridge
+            port (int): The bridge's socket port
+            path (str): If set, the bridge's Unix domain socket, used instead of host and port
+            timeout (float): Seconds to wait for the connection and for each response
+        """
+        self.timeout = timeout
+        if path:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            self.sock.connect(path)
+        else:
+            self.sock = socket.create_connection((host, port), timeout=timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.settimeout(None)
+        self.write_lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.pending = {} # Request id to [Event, response]
+        self.utterances = collections.OrderedDict() # Latest pushed state of each utterance, by id
+        self.changed = threading.Condition()
+        self.listeners = [] # Called with each event the bridge pushes
+        self.audio_listeners = [] # Called with each audio packet the bridge pushes
+        self.closed = False
+        self.reader = threading.Thread(target=self.read, daemon=True)
+        self.reader.start()
+
+    def read_exact(self, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise EOFError("Bridge closed the connection")
+            data += chunk
+        return bytes(data)
+
+    def read(self):
+        """
+        Reads frames until the connection closes, completing requests and storing pushed events
+        """
+        try:
+            while True:
+                size, kind, rid = FRAME_HEADER.unpack(self.read_exact(FRAME_HEADER.size))
+                payload = self.read_exact(size)
+                if kind == FRAME_RESPONSE:
+                    waiter = self.pending.get(rid)
+                    if waiter is not None:
+                        waiter[1] = json.loads(payload)
+                        waiter[0].set()
+                elif kind == FRAME_EVENT:
+                    self.on_event(json.loads(payload))
+                elif kind == FRAME_AUDIO:
+                    for listener in self.audio_listeners:
+                        listener(payload)
+        except (EOFError, OSError, ValueError):
+            pass
+        finally:
+            self.closed = True
+            for waiter in list(self.pending.values()):
+                waiter[0].set()
+            with self.changed:
+                self.changed.notify_all()
+
+    def on_event(self, event):
+        if event.get("event") == "utterance":
+            with self.changed:
+                self.utterances[event["id"]] = event
+                while len(self.utterances) > 256:
+                    self.utterances.popitem(last=False)
+                self.changed.notify_all()
+        for listener in self.listeners:
+            listener(event)
+
+    def write(self, rid, message):
+        payload = json.dumps(message).encode("utf-8")
+        with self.write_lock:
+            self.sock.sendall(FRAME_HEADER.pack(len(payload), FRAME_REQUEST, rid) + payload)
+
+    def request(self, op, timeout=None, **fields):
+        """
+        Sends a request and waits for its response
+
+        Args:
+            op (str): The operation, such as "say", "batch", "utterance" or "delta"
+            timeout (float): Seconds to wait for the response. The connection's timeout if not set
+            **fields: The rest of the request
+
+        Returns:
+            dict: The bridge's response
+
+        Raises:
+            ConnectionError: If the connection is closed
+            TimeoutError: If the response doesn't arrive in time
+        """
+        if self.closed:
+            raise ConnectionError("Bridge connection is closed")
+        rid = next(self.ids)
+        waiter = self.pending[rid] = [threading.Event(), None]
+        try:
+            self.write(rid, dict(fields, op=op))
+            if not waiter[0].wait(self.timeout if timeout is None else timeout):
+                raise TimeoutError("No response to {} from the bridge".format(op))
+        finally:
+            del self.pending[rid]
+        if waiter[1] is None:
+            raise ConnectionError("Bridge connection closed before responding to {}".format(op))
+        return waiter[1]
+
+    def send(self, op, **fields):
+        """
+        Sends a request without waiting for, or getting, a response
+        """
+        if self.closed:
+            raise ConnectionError("Bridge connection is closed")
+        self.write(0, dict(fields, op=op))
+
+    def wait_utterance(self, uid, timeout):
+        """
+        Waits for the bridge to push that utterance uid finished
+
+        Returns:
+            dict: The utterance, with its state and duration. Its latest state if it hasn't finished within timeout
+        """
+        with self.changed:
+            self.changed.wait_for(lambda: self.closed or self.utterances.get(uid, {}).get("state") in FINISHED, timeout)
+            utterance = self.utterances.get(uid)
+        if utterance is not None and utterance["state"] in FINISHED:
+            return utterance
+        response = self.request("utterance", id=uid) # Pushed before this connected, or not at all
+        return response if "error" not in response else None
+
+    def close(self):
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
@@ -0,0 +1,142 @@
+from ..Talker import Talker
+from ..Segmenter import Segmenter
+import threading
+import queue
+import time
+
+class ChoirTalker(Talker):
+    def __init__(self, robots, skew: float = 0.3):
+        """
+        Has several NAOs say each response together, each through its own bridge. Responses are split into
+        sentences, and every robot waits at each sentence until all are ready, then they start it at once.
+        A robot more than skew seconds behind isn't waited for, and catches up through its own queue.
+        The first robot is the one whose spoken text is remembered on interruption
+
+        Args:
+            robots (list): The BridgeNAOTalkers to speak through, one per robot
+            skew (float): Longest time, in seconds, the robots wait for a slower one before each sentence
+        """
+        super().__init__(language=robots[0].language)
+        self.robots = robots
+        self.skew = skew
+        self.queues = [queue.Queue() for _ in robots]
+        self.gates = {} # When each sentence of the current response started, by index
+        self.changed = threading.Condition()
+        self.lags = [[] for _ in robots] # Seconds each robot started each sentence after the first
+        self.speech_log = self.speech_log # All speech is logged in one place, for echo suppression
+        for i, (robot, q) in enumerate(zip(robots, self.queues)):
+            threading.Thread(target=self.work, args=(i, robot, q), daemon=True).start()
+
+    @property
+    def speech_log(self):
+        return self._speech_log
+
+    @speech_log.setter
+    def speech_log(self, log):
+        """
+        Shares log with every robot, which publish to it, including when a FanOutTalker replaces it
+        """
+        self._speech_log = log
+        for robot in getattr(self, "robots", []): # Not yet set by Talker.__init__
+            robot.speech_log = log
+
+    def work(self, i, robot, q):
+        """
+        Says the sentences queued for robot i, forever
+        """
+        while True:
+            index, to_say = q.get()
+            try:
+                if not robot.interrupted.is_set():
+                    start = self.gate(index)
+                    self.lags[i].append(time.time() - start)
+                    if to_say is None: # The end of the response
+                        robot.signal_done()
+                    else:
+                        robot.say(to_say, first=index == 0)
+                        robot.record_spoken(to_say)
+            except Exception as e:
+                print("Error in robot {}: {}".format(i, e))
+            finally:
+                q.task_done()
+
+    def gate(self, index):
+        """
+        Waits until every robot is ready for sentence index, or skew seconds after the first was
+
+        Returns:
+            float: When the sentence started, shared by every robot
+        """
+        with self.changed:
+            gate = self.gates.setdefault(index, {"ready": 0, "first": time.time(), "start": None})
+            gate["ready"] += 1
+            if gate["ready"] == len(self.robots) and gate["start"] is None:
+                gate["start"] = time.time()
+                self.changed.notify_all()
+            self.changed.wait_for(lambda: gate["start"] is not None or self.interrupted.is_set(),
+                                  gate["first"] + self.skew - time.time())
+            if gate["start"] is None: # Given up on the slowest robots
+                gate["start"] = time.time()
+                self.changed.notify_all()
+            return gate["start"]
+
+    def __call__(self, to_say):
+        """
+        Speaks to_say through every robot, returning once all are done
+        """
+        self.first_audio_at = None
+        self.interrupted.clear()
+        self.spoken = ""
+        self.gates = {}
+        for robot in self.robots:
+            robot.first_audio_at = None
+            robot.interrupted.clear()
+            robot.spoken = ""
+        segmenter = Segmenter()
+        chunks = []
+        for mes in [to_say] if isinstance(to_say, str) else to_say:
+            if self.interrupted.is_set():
+                if hasattr(to_say, "close"): to_say.close() # Stops the upstream generation
+                break
+            for chunk in segmenter.feed(mes):
+                self.queue(len(chunks), chunk)
+                chunks.append(chunk)
+        if not self.interrupted.is_set():
+            rest = segmenter.flush()
+            if rest:
+                self.queue(len(chunks), rest)
+                chunks.append(rest)
+            self.queue(len(chunks), None) # Signals the end together
+        for q in self.queues: q.join()
+        self.spoken = self.robots[0].spoken
+        started = [r.first_audio_at for r in self.robots if r.first_audio_at is not None]
+        self.first_audio_at = min(started) if started else None
+        if any(r.interrupted.is_set() for r in self.robots): self.interrupted.set()
+
+    def queue(self, index, to_say):
+        """
+        Queues sentence index for every robot. None for the end of the response
+        """
+        for q in self.queues:
+            q.put((index, to_say))
+
+    def interrupt(self):
+        """
+        Stops every robot
+        """
+        super().interrupt()
+        with self.changed:
+            self.changed.notify_all()
+        for robot in self.robots:
+            robot.interrupt()
+
+    def close(self):
+        for robot in self.robots:
+            robot.close()
+
+    def print_stats(self):
+        for i, (robot, lags) in enumerate(zip(self.robots, self.lags)):
+            if lags:
+                print("Robot {} ({}): {:.3f}s mean, {:.3f}s max lag behind the choir over {} sentences, {} beyond the skew".format(
+                    i, robot.bridge_url, sum(lags) / len(lags), max(lags), len(lags), sum(1 for l in lags if l > self.skew)))
+            robot.print_stats()
@@ -1,14 +1,12 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import sys
 import os
 import subprocess
 import time
 
-# Fix import path for Talker class
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from Talker import Talker
+from ..Talker import Talker
+from .SpeechDuration import SpeechDuration
 
 class ChoregrapheTalker(Talker):
     """
@@ -16,10 +14,11 @@ class ChoregrapheTalker(Talker):
     This approach requires Choregraphe to be connected to NAO
     """
     
-    def __init__(self, ip: str, language: str = "en", sleep_len: float = 0.03, stand=False, volume: int = 80):
+    def __init__(self, ip: str, language: str = "en", sleep_len: float = 0.03, stand=False, volume: int = 80, duration: SpeechDuration = None):
         super().__init__(language=language)
         self.ip = ip
         self.sleep_len = sleep_len
+        self.duration = duration if duration is not None else SpeechDuration(language, char_len=sleep_len)
         self.volume = volume
         self.standing = stand
         
@@ -46,7 +45,9 @@ import time
 def main(robot_ip, text):
     try:
         tts = ALProxy("ALTextToSpeech", robot_ip, 9559)
+        start = time.time()
         tts.say(text)
+        print("Spoke in %.3f seconds" % (time.time() - start)) # Without the interpreter's startup, for calibration
         return True
     except Exception as e:
         print("Error:", e)
@@ -100,19 +101,31 @@ tts.say("{to_say.replace('"', '\\"')}")
             print(f"[CHOREGRAPHE NAO] Error setting up script: {e}")
         
         # Method 2: Try using a direct command if Choregraphe is connected
+        start = time.time()
         try:
             script_cmd = ["python2.7", self.say_script_path, self.ip, to_say]
-            subprocess.run(script_cmd, timeout=5)
+            self.mark_audio()
+            self.publish(to_say, self.duration(to_say))
+            result = subprocess.run(script_cmd, timeout=5, stdout=subprocess.PIPE, universal_newlines=True)
+            print(result.stdout, end="")
+            # The script times the speech itself, which calibrates the estimate without python2.7's startup
+            spoke = [line.split()[2] for line in result.stdout.splitlines() if line.startswith("Spoke in ")]
+            if result.returncode == 0 and spoke and not self.interrupted.is_set():
+                self.duration.observe(to_say, float(spoke[-1]))
         except Exception as e:
             print(f"[CHOREGRAPHE NAO] Error running direct command: {e}")
         
-        # Sleep based on text length
-        time.sleep(len(to_say.strip()) * self.sleep_len)
+        # Wait for what's left of the estimated speech
+        self.interrupted.wait(max(self.duration(to_say) - (time.time() - start), 0))
         
         if last:
             print("[CHOREGRAPHE NAO] *winks*")
 
+    def print_stats(self):
+        self.duration.print_stats()
+
 
 if __name__ == "__main__":
+    # Usage: python -m src.NAO.ChoregrapheTalker
     talker = ChoregrapheTalker(ip="192.168.100.172", language="en")
     talker.say("Hello! This is a test of the Choregraphe talker integration.")
\ No newline at end of file
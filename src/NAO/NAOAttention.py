@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import requests
+
+class NAOAttention:
+    """
+    Tracks whether someone is engaged with the NAO, using the face detection of the bridge server.
+    The bridge has to be started with the "vision" flag.
+    If the bridge can't be reached everyone is assumed to be engaged, so listening isn't blocked
+    """
+
+    def __init__(self, bridge_url: str = "http://localhost:8080", grace: float = 10.0, poll: float = 20.0):
+        """
+        Starts following the bridge's face detection in the background
+
+        Args:
+            bridge_url (str): The URL of the bridge server
+            grace (float): Seconds someone is still considered engaged after their face was last seen
+            poll (float): Longest time, in seconds, each long-poll to the bridge waits for a change
+        """
+        self.bridge_url = bridge_url
+        self.grace = grace
+        self.poll = poll
+        self.present = False
+        self.reachable = False
+        self.last_seen = 0.0
+        self.changed = threading.Condition()
+        self.counts = {"gated": 0, "waits": 0}
+        thread = threading.Thread(target=self.follow, daemon=True)
+        thread.start()
+
+    def follow(self):
+        """
+        Long-polls the bridge for changes in engagement forever
+        """
+        session = requests.Session()
+        while True:
+            try:
+                response = session.get(self.bridge_url + "/attention",
+                    params={"engaged": int(self.present), "wait": self.poll}, timeout=self.poll + 5)
+                response.raise_for_status()
+                present, reachable = response.json()["engaged"], True
+            except Exception as e:
+                if self.reachable: print(f"[NAO ATTENTION] Lost face detection, assuming engaged: {e}")
+                present, reachable = False, False
+            with self.changed:
+                if present or self.present: # Seen now, or just left
+                    self.last_seen = time.time()
+                self.present, self.reachable = present, reachable
+                self.changed.notify_all()
+            if not reachable: time.sleep(1)
+
+    def engaged(self):
+        """
+        Returns:
+            bool: If someone is in front of the NAO, or was within the grace period
+        """
+        return not self.reachable or self.present or time.time() - self.last_seen < self.grace
+
+    def wait(self):
+        """
+        Blocks until someone is engaged
+        """
+        with self.changed:
+            if self.engaged(): return
+            self.counts["waits"] += 1
+            while not self.engaged():
+                self.changed.wait(timeout=1)
+
+    def gate(self):
+        """
+        Counts a phrase skipped since no one was engaged
+        """
+        self.counts["gated"] += 1
+
+    def print_stats(self):
+        print("Attention: {gated} phrases gated, {waits} waits for someone to engage".format(**self.counts))
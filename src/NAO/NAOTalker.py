@@ -1,13 +1,15 @@
-import sys
-from os import path
-# Append to path to find the "Talker" class in the parent dictionary
-sys.path.append(path.dirname(path.dirname(path.realpath(__file__))))
-from Talker import Talker
+from ..Talker import Talker
+from ..Segmenter import Segmenter
+from .SpeechDuration import SpeechDuration
+from .BridgeConnection import BridgeConnection
 import subprocess as sp
+import collections
+import threading
 import time
 import iso639
 import requests
 import json
+from urllib.parse import urlparse
 
 # Helper function to convert language code to language name
 def get_language_name(language_code):
@@ -34,72 +36,300 @@ def get_language_name(language_code):
 
 # Class for connecting to physical NAO robot via the bridge server
 class BridgeNAOTalker(Talker):
-    def __init__(self, ip: str, language: str = "en", sleep_len: float = 0.03, stand=False, volume: int = 100):
+    def __init__(self, ip: str, language: str = "en", sleep_len: float = 0.03, stand=False, volume: int = 100, duration: SpeechDuration = None,
+                 batch_window: float = 0.05, stream_ingest: bool = True, transport: str = "http", socket_port: int = 8082, socket_path: str = "",
+                 reconnect_max: float = 30.0, offline_policy: str = "drop", offline_buffer: int = 16, bridge_url: str = "http://localhost:8080"):
         super().__init__(language = language)
         self.ip = ip
         self.sleep_len = sleep_len
+        self.duration = duration if duration is not None else SpeechDuration(language, char_len=sleep_len)
         self.language = get_language_name(language)
         self.volume = volume
         self.standing = stand
-        self.bridge_url = "http://localhost:8080"
-        
-        print(f"[BRIDGE NAO] Setting up connection to NAO at IP: {ip}")
+        self.bridge_url = bridge_url.rstrip("/")
+        self.poll = 10.0 # Longest time, in seconds, each long-poll for the end of speech waits
+        self.batch_window = batch_window # Seconds commands are held to be sent together. 0 to send each on its own
+        self.batch = [] # Commands waiting to be sent together
+        self.batch_timer = None
+        self.send_lock = threading.RLock() # Keeps requests in the order they were made
+        self.stream_ingest = stream_ingest # If streamed responses are sent as they're generated, for the bridge to split
+        self.turn = 0 # Counts streamed responses
+        self.session = requests.Session() # Reuses one kept-alive connection for every command
+        self.connection = None # Framed socket connection to the bridge, used instead of HTTP if transport is "socket"
+        self.transport = transport
+        self.socket_port = socket_port
+        self.socket_path = socket_path
+        self.reconnect_max = reconnect_max # Longest time, in seconds, between attempts to reach the bridge
+        self.health = 5.0 # Seconds between checks that the bridge is still up
+        self.offline_policy = offline_policy # "buffer" to send commands made without the bridge once it's back, "drop" to not
+        self.offline = collections.deque(maxlen=offline_buffer) # Commands buffered without the bridge, dropping the oldest
+        self.mock_mode = True # Until the bridge is reached. Commands are displayed but not sent to robot
+        self.lost = threading.Event() # Set when a request finds the bridge gone
+        self.closing = threading.Event()
+        self.busy_retries = 3 # Times a command is retried while the bridge's queue is full
+        self.interrupt_latencies = [] # (Seconds from interrupt until the NAO was quiet, of it on the bridge) per interrupt
+        self.interrupted_at = 0.0 # When the last interrupt came
+        self.counts = {"connects": 0, "buffered": 0, "dropped": 0, "busy": 0}
+
+        print(f"[BRIDGE NAO] Setting up connection to NAO at IP: {ip}, through the bridge at {self.bridge_url}")
         print(f"[BRIDGE NAO] Language: {self.language}")
         print(f"[BRIDGE NAO] Volume: {volume}")
 
-        # Try to connect to the bridge server
-        connected = False
+        # Connect to the bridge server in the background, so the conversation can start without it
+        self.monitor = threading.Thread(target=self.watch_bridge, daemon=True)
+        self.monitor.start()
+
+    def watch_bridge(self):
+        """
+        Connects to the bridge, retrying with exponential backoff until it's up, then checks it every
+        health seconds and reconnects if it goes down. Runs on its own thread
+        """
+        backoff = 0.5
+        while not self.closing.is_set():
+            if self.mock_mode:
+                if self.connect():
+                    backoff = 0.5
+                    continue
+                if backoff == 0.5:
+                    print("[BRIDGE NAO] Please start the bridge server with:")
+                    print(f"python nao_py2_scripts/direct_nao_bridge.py {self.ip} {self.language} {self.volume}")
+                    print("[BRIDGE NAO] Operating in mock mode until it's up - commands will be displayed but not sent to robot")
+                self.closing.wait(backoff)
+                backoff = min(backoff * 2, self.reconnect_max)
+            elif self.lost.wait(self.health) or not self.probe():
+                print("[BRIDGE NAO] Lost the bridge server, operating in mock mode until it's back")
+                self.mock_mode = True
+                if self.connection is not None:
+                    self.connection.close()
+                    self.connection = None
+
+    def probe(self):
+        """
+        Returns:
+            bool: If the bridge server answers
+        """
         try:
-            response = requests.options(self.bridge_url, timeout=2)
-            if response.status_code == 200:
-                connected = True
-                print("[BRIDGE NAO] Successfully connected to bridge server")
-        except Exception as e:
-            print(f"[BRIDGE NAO] Could not connect to bridge server: {str(e)}")
-            
-        if not connected:
-            print("[BRIDGE NAO] Please start the bridge server with:")
-            print(f"python /Users/yh/Desktop/NAOChat/nao_py2_scripts/nao_bridge.py {ip} {self.language} {volume}")
-            print("[BRIDGE NAO] Falling back to mock NAO")
-            
-            # Instead of raising an error, we'll switch to mock mode
-            self.mock_mode = True
-            print("[BRIDGE NAO] Operating in mock mode - commands will be displayed but not sent to robot")
-        else:
-            self.mock_mode = False
-            
+            return requests.options(self.bridge_url, timeout=2).status_code == 200
+        except Exception:
+            return False
+
+    def connect(self):
+        """
+        Connects to the bridge server if it's up, then sends the commands buffered without it
+
+        Returns:
+            bool: If the bridge was reached
+        """
+        if not self.probe():
+            return False
+        print("[BRIDGE NAO] Successfully connected to bridge server")
+        if self.transport == "socket":
+            try:
+                self.connection = BridgeConnection(host=urlparse(self.bridge_url).hostname, port=self.socket_port, path=self.socket_path)
+                print("[BRIDGE NAO] Using the bridge's socket transport")
+            except OSError as e:
+                print(f"[BRIDGE NAO] Could not connect to the bridge's socket, using HTTP. Start the bridge with \"socket\": {e}")
+        self.lost.clear()
+        self.mock_mode = False
+        self.counts["connects"] += 1
+        if self.counts["connects"] == 1:
             # Customize the connection message based on language
-            if language == "ar":
+            if self.language == "Arabic":
                 connection_message = "تم الاتصال بنجاح"  # "Connected successfully" in Arabic
-            elif language == "en":
-                connection_message = "Connected successfully"
             else:
                 connection_message = "Connected successfully"
-                
-            # Send the connection message to the physical robot
             print(f"[BRIDGE NAO] Sending connection confirmation to NAO: {connection_message}")
             self.send_to_nao(connection_message)
-            time.sleep(2)  # Give time for the robot to speak
-            
-            if stand:
+            if self.standing:
                 self.send_to_nao("stand")
+        buffered = list(self.offline)
+        self.offline.clear()
+        for command in buffered:
+            self.send_to_nao(command)
+        return True
 
-    def __del__(self):
-        if hasattr(self, 'standing') and self.standing and not getattr(self, 'mock_mode', True):
+    def hold(self, to_say):
+        """
+        Handles to_say made without the bridge, buffering it to send once the bridge is back if offline_policy is "buffer".
+        A stop drops everything buffered
+        """
+        if to_say.lower() == "stop":
+            self.offline.clear()
+        elif self.offline_policy == "buffer":
+            if len(self.offline) == self.offline.maxlen:
+                self.counts["dropped"] += 1
+            self.offline.append(to_say)
+            self.counts["buffered"] += 1
+        else:
+            self.counts["dropped"] += 1
+
+    def close(self):
+        """
+        Stops watching the bridge, sits the NAO down if it stood up and sends any batched commands.
+        Called on exit, as the monitor thread keeps the talker from being garbage collected
+        """
+        if self.closing.is_set():
+            return
+        self.closing.set()
+        if self.standing and not self.mock_mode:
             self.send_to_nao("sit")
+        self.flush()
+        connection, self.connection = self.connection, None
+        if connection is not None:
+            connection.close()
 
     def send_to_nao(self, to_say):
+        """
+        Sends to_say to the NAO. Commands made within batch_window of each other are sent in one request,
+        apart from stop which is sent right away
+        """
         if getattr(self, 'mock_mode', True):
             print(f"[MOCK NAO] {to_say}")
+            self.hold(to_say)
             return True
-            
+        if to_say.lower() == "stop":
+            self.drop_batch()
+        if not self.batch_window or to_say.lower() == "stop":
+            return self.post(to_say) is not None
+        with self.send_lock:
+            self.batch.append(to_say)
+            if self.batch_timer is None:
+                self.batch_timer = threading.Timer(self.batch_window, self.flush)
+                self.batch_timer.daemon = True
+                self.batch_timer.start()
+        return True
+
+    def flush(self):
+        """
+        Sends the commands waiting to be batched, in one request
+        """
+        with self.send_lock:
+            batch, self.batch = self.batch, []
+            if self.batch_timer is not None:
+                self.batch_timer.cancel()
+                self.batch_timer = None
+            if len(batch) == 1:
+                self.post(batch[0])
+            elif batch:
+                self.submit(batch, "batch", texts=batch)
+
+    def drop_batch(self):
+        """
+        Drops the commands waiting to be batched, so they aren't sent after a stop.
+        Doesn't take send_lock, which a flush holds while the bridge is busy
+        """
+        timer, self.batch_timer = self.batch_timer, None
+        if timer is not None:
+            timer.cancel()
+        self.batch = []
+
+    def post(self, to_say):
+        """
+        Sends to_say to the bridge
+
+        Returns:
+            dict: The bridge's response, with the id of the utterance, or None on failure
+        """
+        return self.submit([to_say], "say", text=to_say)
+
+    def submit(self, commands, op, **fields):
+        """
+        Sends commands to the bridge, over the socket or as the same fields over HTTP.
+        While the bridge's queue is full it's retried after the wait the bridge asks for
+
+        Args:
+            commands (list): The commands sent, held if the bridge is down
+            op (str): "say" or "batch"
+            **fields: The request, {"text": ...} or {"texts": [...]}
+
+        Returns:
+            dict: The bridge's response, or None on failure
+        """
+        data = {"text": fields["text"]} if op == "say" else {"batch": fields["texts"]}
+        for attempt in range(self.busy_retries + 1):
+            response = self.request(op, **fields)
+            if response is None:
+                try:
+                    response = self.session.post(self.bridge_url, json=data, timeout=5)
+                    response = response.json() if response.status_code in [200, 429] else None
+                except Exception as e:
+                    print(f"[BRIDGE NAO] Error sending to NAO: {e}")
+                    if isinstance(e, requests.ConnectionError): # The bridge is down, so the monitor reconnects
+                        self.lost.set()
+                        for command in commands: self.hold(command)
+                    return None
+            if response is None or response.get("error") != "busy":
+                return response
+            self.counts["busy"] += 1
+            print(f"[BRIDGE NAO] Bridge is busy with {response.get('queued')} commands, retrying in {response['retry_after']}s")
+            if self.interrupted.wait(response["retry_after"]): break
+        return None
+
+    def request(self, op, timeout=None, **fields):
+        """
+        Sends a request over the socket connection, if there is one. On failure the connection is dropped,
+        and HTTP is used from then on
+
+        Returns:
+            dict: The bridge's response, or None without a connection or on failure
+        """
+        if self.connection is None:
+            return None
         try:
-            data = {"text": to_say}
-            response = requests.post(self.bridge_url, json=data, timeout=5)
-            return response.status_code == 200
+            response = self.connection.request(op, timeout, **fields)
+            return response if response.get("error") in [None, "busy"] else None
+        except (OSError, ConnectionError, TimeoutError) as e:
+            self.drop_connection(e)
+            return None
+
+    def drop_connection(self, error):
+        """
+        Closes the socket connection after it failed with error, so HTTP is used from then on
+        """
+        print(f"[BRIDGE NAO] Socket connection failed, using HTTP: {error}")
+        connection, self.connection = self.connection, None
+        if connection is not None:
+            connection.close()
+
+    def wait_done(self, uid, estimate):
+        """
+        Waits for the NAO to finish utterance uid, pushed by the bridge over the socket or by long-polling it
+
+        Args:
+            uid (int): The id of the utterance, given by the bridge
+            estimate (float): Estimated seconds to say it, used to give up on a bridge that never finishes it
+
+        Returns:
+            dict: The finished utterance with its state and duration, or None if the bridge couldn't tell
+        """
+        deadline = time.time() + estimate * 3 + 10
+        while not self.interrupted.is_set() and time.time() < deadline:
+            if self.connection is not None:
+                try:
+                    utterance = self.connection.wait_utterance(uid, self.poll)
+                except (OSError, ConnectionError, TimeoutError) as e:
+                    self.drop_connection(e)
+                    continue
+            else:
+                utterance = self.utterance(uid, self.poll)
+            if utterance is None or utterance["state"] in ["done", "stopped", "failed"]: return utterance
+        return None
+
+    def utterance(self, uid, wait=0):
+        """
+        Returns:
+            dict: The state of utterance uid on the bridge, once finished or after wait seconds. None on failure
+        """
+        response = self.request("utterance", wait + 5, id=uid, wait=wait)
+        if response is not None:
+            return response
+        try:
+            response = self.session.get(self.bridge_url + "/utterance",
+                params={"id": uid, "wait": wait}, timeout=wait + 5)
+            return response.json() if response.status_code == 200 else None
         except Exception as e:
-            print(f"[BRIDGE NAO] Error sending to NAO: {e}")
-            return False
+            print(f"[BRIDGE NAO] Error waiting for NAO to finish speaking: {e}")
+            return None
 
     def say(self, to_say: str, first: bool = False, last: bool = False):
         """
@@ -112,23 +342,145 @@ class BridgeNAOTalker(Talker):
         """
         if getattr(self, 'mock_mode', True):
             print(f"[MOCK NAO SAYS] {to_say}")
+            self.hold(to_say)
         else:
             print(f"[BRIDGE NAO SAYS] {to_say}")
             
-        self.send_to_nao(to_say)
-        time.sleep(len(to_say.strip())*self.sleep_len)
-        if last:
-            self.send_to_nao('turnoff')
-            self.send_to_nao('turnon')
-            if self.standing:
-                self.send_to_nao('e')
+        response = None
+        if not getattr(self, 'mock_mode', True):
+            with self.send_lock: # After any commands waiting to be batched
+                self.flush()
+                response = self.post(to_say)
+        self.mark_audio()
+        start, estimate = time.time(), self.duration(to_say)
+        self.publish(to_say, estimate)
+        utterance = self.wait_done(response["id"], estimate) if response and "id" in response else None
+        if utterance is None: # No completion signal, so wait for the estimate
+            self.interrupted.wait(max(estimate - (time.time() - start), 0))
+        else:
+            self.end_publish(to_say)
+            if utterance["state"] == "done" and utterance["duration"]:
+                self.duration.observe(to_say, utterance["duration"])
+        if last and not self.interrupted.is_set():
+            self.signal_done()
+
+    def signal_done(self):
+        """
+        Signals the end of a response by blinking, and nodding if standing
+        """
+        self.send_to_nao('turnoff')
+        self.send_to_nao('turnon')
+        if self.standing:
+            self.send_to_nao('e')
+
+    def stream_say(self, to_say):
+        """
+        Streams the string generated by to_say straight to the bridge as it's generated. The bridge
+        splits it into sentences and clauses, and speaks each as soon as it's complete.
+        Without stream_ingest or the bridge, it's split and sent here instead. See Talker.stream_say
+
+        Args:
+            to_say (str): The string to speak
+        """
+        if getattr(self, 'mock_mode', True) or not self.stream_ingest:
+            return super().stream_say(to_say)
+        self.turn += 1
+        segmenter = Segmenter() # Splits the same way as the bridge, to log the speech for echo suppression
+        sent = []
+        published = [] # (segment, when it's estimated to end)
+        speech_end = [time.time()]
+        def publish(segment):
+            print(f"[BRIDGE NAO SAYS] {segment}")
+            self.mark_audio()
+            start = max(time.time(), speech_end[0])
+            speech_end[0] = start + self.duration(segment)
+            self.publish(segment, speech_end[0] - start, start=start)
+            published.append((segment, speech_end[0]))
+        def deltas():
+            """Yields the generated string in pieces, as it's split and published"""
+            for mes in to_say:
+                if self.interrupted.is_set():
+                    if hasattr(to_say, "close"): to_say.close() # Stops the upstream generation
+                    return
+                for segment in segmenter.feed(mes): publish(segment)
+                sent.append(mes)
+                yield mes.encode("utf-8")
+            rest = segmenter.flush()
+            if rest: publish(rest)
+        with self.send_lock: # After any commands waiting to be batched
+            self.flush()
+            if self.connection is not None:
+                response = self.stream_frames(deltas())
+            else:
+                try:
+                    response = self.session.post(self.bridge_url + "/stream", params={"turn": self.turn},
+                        data=deltas(), timeout=(5, 30))
+                    response = response.json() if response.status_code == 200 else None
+                except Exception as e:
+                    print(f"[BRIDGE NAO] Error streaming to NAO: {e}")
+                    response = None
+        if response is None or not response["ids"]: # No completion signal, so wait for the estimate
+            if not self.interrupted.wait(max(speech_end[0] - time.time(), 0)):
+                self.spoken = "".join(sent).strip() + "\n"
+            else: # Keep the segments estimated to have ended before the interruption
+                self.spoken += "".join(segment + "\n" for segment, end in published if end <= self.interrupted_at)
+        else:
+            self.wait_done(response["ids"][-1], max(speech_end[0] - time.time(), 0))
+            for uid, text in zip(response["ids"], response["texts"]):
+                utterance = self.utterance(uid)
+                if utterance is None or utterance["state"] != "done": continue
+                self.spoken += text + "\n"
+                if utterance["duration"]: self.duration.observe(text, utterance["duration"])
+        if not self.interrupted.is_set(): # Nothing to signal once stopped
+            self.signal_done()
+
+    def stream_frames(self, deltas):
+        """
+        Sends each piece from deltas to the bridge as its own frame, without waiting for responses,
+        then ends the turn
+
+        Returns:
+            dict: The bridge's response to the end of the turn, with the ids and texts it spoke. None on failure
+        """
+        try:
+            for delta in deltas:
+                self.connection.send("delta", turn=self.turn, text=delta.decode("utf-8"))
+        except (OSError, ConnectionError) as e:
+            print(f"[BRIDGE NAO] Error streaming to NAO: {e}")
+            for _ in deltas: pass # Still publishes the rest, so it's waited for
+        return self.request("end", 30, turn=self.turn)
+
+    def interrupt(self):
+        """
+        Stops speaking and flushes any speech queued on the bridge
+        """
+        self.interrupted_at = time.time()
+        super().interrupt()
+        start = time.time()
+        if getattr(self, 'mock_mode', True):
+            self.send_to_nao('stop')
+            return
+        self.drop_batch()
+        response = self.post('stop') # The bridge responds once the NAO is quiet
+        if response is not None and response.get("stopped_in") is not None:
+            self.interrupt_latencies.append((time.time() - start, response["stopped_in"]))
+
+    def print_stats(self):
+        print("Bridge: {connects} connections, {buffered} commands buffered and {dropped} dropped without it, "
+              "{busy} retries while it was busy".format(**self.counts))
+        if self.interrupt_latencies:
+            total, on_nao = zip(*self.interrupt_latencies)
+            print("Interrupts: {:.3f}s mean, {:.3f}s max until NAO was quiet, {:.3f}s mean of it stopping on the NAO, over {}".format(
+                sum(total) / len(total), max(total), sum(on_nao) / len(on_nao), len(total)))
+        self.duration.print_stats()
 
 # Add a mock version for testing without NAO hardware
 class MockNAOTalker(Talker):
-    def __init__(self, ip: str, language: str = "en", sleep_len: float = 0.03, stand=False, volume: int = 100):
+    def __init__(self, ip: str, language: str = "en", sleep_len: float = 0.03, stand=False, volume: int = 100, duration: SpeechDuration = None):
         super().__init__(language = language)
         self.ip = ip
         self.sleep_len = sleep_len
+        self.duration = duration if duration is not None else SpeechDuration(language, char_len=sleep_len)
         self.language = get_language_name(language)
         self.volume = volume
         self.standing = stand
@@ -142,6 +494,9 @@ class MockNAOTalker(Talker):
         if hasattr(self, 'standing') and self.standing:
             print(f"[MOCK NAO] Sitting down...")
 
+    def print_stats(self):
+        self.duration.print_stats()
+
     def nao_say(self, to_say):
         print(f"[MOCK NAO] {to_say}")
 
@@ -155,7 +510,8 @@ class MockNAOTalker(Talker):
             last (bool): If NAO should signal when speaking is done via winking
         """
         print(f"[MOCK NAO SAYS] {to_say}")
-        time.sleep(len(to_say.strip())*self.sleep_len)
+        self.mark_audio()
+        self.interrupted.wait(self.duration(to_say))
         if last:
             print("[MOCK NAO] *winks*")
 
@@ -173,8 +529,9 @@ except (ImportError, ConnectionError):
     NAOTalker = MockNAOTalker
 
 if __name__ == "__main__":
-    from Chatter import Chatter
-    from Listener import Listener
+    # Usage: python -m src.NAO.NAOTalker
+    from ..Chatter import Chatter
+    from ..Listener import Listener
     name = "Pepper"
     swe_intro = f"Du är den mänskliga roboten {name}. En NAO-modellrobot byggd av Softbank och programmerad av FIA Robotics. Din uppgift är att hålla en intressant konversation med en grupp människor. Du får max svara med två meningar."
     eng_intro = f"You are the humanoid robot {name}. A NAO model robot built by Softbank and programmed by FIA Robotics. Your task is to hold an interesting conversation with a group of humans. You can at most answer with two sentences"
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import threading
+
+SENTENCE_ENDS = ".!?…؟。！？"
+CLAUSE_ENDS = ",;:،؛、，"
+
+# Characters spoken per second by NAO:s text to speech, per ISO 639-1 code
+CHARS_PER_SECOND = {
+    "en": 14.0, "sv": 13.0, "de": 13.0, "fr": 14.0, "es": 15.0, "it": 14.0, "pt": 14.0,
+    "ar": 11.0, "ru": 12.0, "ja": 7.0, "ko": 7.0, "zh": 5.0
+}
+
+class SpeechDuration:
+    """
+    Estimates how long the NAO takes to say a string, from its characters, words and pauses at punctuation.
+    The cost of each is learned per language from measured durations, and stored in path between runs
+    """
+
+    def __init__(self, language: str = "en", path: str = "", char_len: float = 0.03, rate: float = 0.2):
+        """
+        Args:
+            language (str): The ISO 639-1 code for the language spoken
+            path (str): JSON file the learned costs are loaded from and stored in. Empty to not store them
+            char_len (float): Seconds per character for languages without a known speech rate
+            rate (float): How far, between 0 and 1, each measurement moves the costs towards fitting it
+        """
+        self.language = language
+        self.path = path
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.errors = [] # Seconds each estimate was off by, before learning from it
+        self.costs = {}
+        if path and os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        if path and os.path.isfile(path):
+            with open(path, encoding="utf-8") as f:
+                self.costs = json.load(f)
+        if language not in self.costs:
+            cps = CHARS_PER_SECOND.get(language)
+            self.costs[language] = {
+                "char": 1.0 / cps if cps else char_len, # Seconds per character, excluding spaces
+                "word": 0.02, # Seconds between words
+                "sentence": 0.35, # Seconds paused at the end of a sentence
+                "clause": 0.15, # Seconds paused at a comma, colon or semicolon
+                "base": 0.1 # Seconds to start speaking
+            }
+
+    @staticmethod
+    def features(text):
+        """
+        Returns:
+            dict: How many of each costed part text has
+        """
+        text = text.strip()
+        return {
+            "char": sum(1 for c in text if not c.isspace()),
+            "word": len(text.split()),
+            "sentence": sum(1 for c in text if c in SENTENCE_ENDS),
+            "clause": sum(1 for c in text if c in CLAUSE_ENDS),
+            "base": 1 if text else 0
+        }
+
+    def __call__(self, text):
+        """
+        Returns:
+            float: Estimated seconds to say text
+        """
+        costs = self.costs[self.language]
+        return sum(costs[k] * v for k, v in self.features(text).items())
+
+    def observe(self, text, seconds):
+        """
+        Learns from saying text having taken seconds. Measurements far off the estimate are ignored,
+        as they're more likely a failure than speech
+
+        Args:
+            text (str): What was said
+            seconds (float): How long it took
+        """
+        features = self.features(text)
+        with self.lock:
+            estimate = self(text)
+            if not features["base"] or not estimate / 4 < seconds < estimate * 4:
+                return
+            self.errors.append(seconds - estimate)
+            # Normalised least mean squares, which scales each step by the size of the features
+            step = self.rate * (seconds - estimate) / sum(v * v for v in features.values())
+            costs = self.costs[self.language]
+            for k, v in features.items():
+                costs[k] = max(costs[k] + step * v, 0.0)
+            if self.path:
+                tmp = self.path + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(self.costs, f, indent=2)
+                os.replace(tmp, self.path) # Never leaves a partly written file
+
+    def print_stats(self):
+        if self.errors:
+            print("Speech duration: {:.3f}s mean absolute error over {} measurements, {:.1f} characters per second".format(
+                sum(abs(e) for e in self.errors) / len(self.errors), len(self.errors), 1.0 / max(self.costs[self.language]["char"], 1e-6)))
+
+if __name__ == "__main__":
+    # Usage: python SpeechDuration.py measurements.jsonl [costs.json]
+    # Each line is {"text": "what was said", "seconds": how long it took, "language": "en"}
+    # Learns from the measurements in order, comparing the error with fixed pacing of 0.03s per character
+    import sys
+    with open(sys.argv[1], encoding="utf-8") as f:
+        measurements = [json.loads(line) for line in f if line.strip()]
+    models = {}
+    fixed = []
+    for m in measurements:
+        language = m.get("language", "en")
+        if language not in models:
+            models[language] = SpeechDuration(language, sys.argv[2] if len(sys.argv) > 2 else "")
+        models[language].observe(m["text"], m["seconds"])
+        fixed.append(abs(m["seconds"] - len(m["text"].strip()) * 0.03))
+    for language, model in models.items():
+        print(language, end=": ")
+        model.print_stats()
+    print("Fixed pacing: {:.3f}s mean absolute error".format(sum(fixed) / len(fixed)))
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+SENTENCE_ENDS = ".!?…؟"  # Ends a sentence when followed by whitespace
+CLAUSE_ENDS = ",;:،؛"  # Ends a clause when followed by whitespace
+UNSPACED_ENDS = "。！？"  # Ends a sentence without whitespace following
+
+class Segmenter:
+    def __init__(self, sentences=True, first_min=8, clause_min=40, max_len=200):
+        """
+        Splits streamed text into speakable chunks as it arrives. Chunks end at new lines and,
+        if sentences is set, at the end of sentences and long enough clauses.
+        The first chunk may end at a shorter clause, so speech can start sooner.
+        Each character is only scanned once and the buffer is bounded by max_len, so time is linear
+
+        Args:
+            sentences (bool): If chunks should end at sentences and clauses, or only at new lines
+            first_min (int): Shortest first chunk, in characters, which can end at a clause
+            clause_min (int): Shortest later chunk, in characters, which can end at a clause
+            max_len (int): Longest chunk before it's split at a space, in characters. Only used with sentences
+        """
+        self.sentences = sentences
+        self.first_min = first_min
+        self.clause_min = clause_min
+        self.max_len = max_len
+        self.buffer = ""
+        self.scanned = 0 # Characters of buffer already scanned
+        self.first = True
+
+    def cut(self, end, chunks):
+        """
+        Moves buffer[:end] into chunks, if it's not only whitespace
+        """
+        chunk = self.buffer[:end].strip()
+        self.buffer = self.buffer[end:]
+        self.scanned = 0
+        if chunk:
+            chunks.append(chunk)
+            self.first = False
+
+    def feed(self, text):
+        """
+        Adds text to the buffer
+
+        Args:
+            text (str): The next part of the stream
+
+        Returns:
+            list: The chunks completed by text
+        """
+        self.buffer += text
+        chunks = []
+        i = self.scanned
+        while i < len(self.buffer):
+            c = self.buffer[i]
+            if c == "\n":
+                self.cut(i + 1, chunks)
+                i = 0
+                continue
+            if self.sentences:
+                followed = i + 1 < len(self.buffer) and self.buffer[i + 1].isspace()
+                if i + 1 == len(self.buffer) and (c in SENTENCE_ENDS or c in CLAUSE_ENDS):
+                    break # Wait for the next character to know if it's followed by whitespace
+                if c in UNSPACED_ENDS or (followed and c in SENTENCE_ENDS) or \
+                        (followed and c in CLAUSE_ENDS and i + 1 >= (self.first_min if self.first else self.clause_min)):
+                    self.cut(i + 1, chunks)
+                    i = 0
+                    continue
+                if i >= self.max_len:
+                    space = self.buffer.rfind(" ", 0, i)
+                    self.cut(space + 1 if space > 0 else i, chunks)
+                    i = 0
+                    continue
+            i += 1
+        self.scanned = i
+        return chunks
+
+    def flush(self):
+        """
+        Returns:
+            str: Everything left in the buffer, once the stream has ended
+        """
+        chunk, self.buffer, self.scanned = self.buffer.strip(), "", 0
+        return chunk
+
+def benchmark(stream, segmenter):
+    """
+    Replays a recorded stream through segmenter
+
+    Args:
+        stream (list): (seconds since the request, text) for each streamed token
+        segmenter (Segmenter): The segmenter to test
+
+    Returns:
+        tuple: Seconds until the first chunk and the number of chunks
+    """
+    first, count = None, 0
+    for t, delta in stream:
+        chunks = segmenter.feed(delta)
+        if chunks and first is None: first = t
+        count += len(chunks)
+    if segmenter.flush():
+        count += 1
+        if first is None: first = stream[-1][0]
+    return first, count
+
+if __name__ == "__main__":
+    # Usage: python Segmenter.py [stream.jsonl ...]
+    # Each line of a recorded stream is {"t": seconds since the request, "delta": "streamed text"}
+    import json, sys
+    streams = {}
+    for path in sys.argv[1:]:
+        with open(path, encoding="utf-8") as f:
+            streams[path] = [(line["t"], line["delta"]) for line in map(json.loads, filter(str.strip, f))]
+    if not streams: # Simulate streams at 30 tokens per second, one word per token
+        for name, text in {
+            "english": "Hello there, I am Pepper, a humanoid robot built by Softbank. I love talking to people, so ask me anything!",
+            "arabic": "مرحبا، أنا بيبر، روبوت بشري صنعته سوفت بنك. أحب التحدث مع الناس، هل لديك سؤال؟ اسألني أي شيء!",
+            "swedish": "Hej, jag heter Pepper och är en människoliknande robot. Jag pratar gärna med er, så fråga mig vad som helst!"
+        }.items():
+            words = text.split(" ")
+            streams[name] = [(0.5 + i / 30, word + " ") for i, word in enumerate(words)]
+    for name, stream in streams.items():
+        lines = benchmark(stream, Segmenter(sentences=False))
+        sentences = benchmark(stream, Segmenter())
+        print("{}: time to first audio {:.2f}s -> {:.2f}s, chunks {} -> {}".format(name, lines[0], sentences[0], lines[1], sentences[1]))
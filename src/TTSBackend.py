@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import threading
+import time
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+try:
+    from gtts import gTTS
+    GTTS_AVAILABLE = True
+except ImportError:
+    GTTS_AVAILABLE = False
+
+try:
+    import pyttsx3
+    PYTTSX3_AVAILABLE = True
+except ImportError:
+    PYTTSX3_AVAILABLE = False
+
+class TTSBackend:
+    available = True
+    voice = "" # Identifies the voice in the TTS cache
+
+    def __init__(self):
+        """
+        Base class of the engines LocalTalker synthesises speech with
+        """
+        self.latencies = [] # Seconds spent synthesising each uncached string
+
+    def __call__(self, text, language, cache=None):
+        """
+        Synthesises text, from the cache if possible
+
+        Args:
+            text (str): What to say
+            language (str): The ISO 639-1 code for the language spoken
+            cache (TTSCache): If set, synthesised audio is cached and reused
+
+        Returns:
+            bytes: The spoken audio, as MP3 or WAV
+        """
+        data = cache.get(text, language, self.voice) if cache is not None else None
+        if data is None:
+            start = time.time()
+            data = self.synthesize(text, language)
+            self.latencies.append(time.time() - start)
+            if cache is not None:
+                cache.put(text, language, self.voice, data)
+        return data
+
+    def synthesize(self, text, language):
+        """
+        Synthesises text. Overwritten by each engine
+
+        Returns:
+            bytes: The spoken audio, as MP3 or WAV
+        """
+        raise NotImplementedError
+
+    def print_stats(self):
+        if self.latencies:
+            print("{}: {:.3f}s mean, {:.3f}s max synthesis over {} strings".format(type(self).__name__,
+                sum(self.latencies) / len(self.latencies), max(self.latencies), len(self.latencies)))
+
+class GTTSBackend(TTSBackend):
+    available = GTTS_AVAILABLE
+
+    def __init__(self, tld="com"):
+        """
+        Synthesises speech via Google Translate, over the network
+
+        Args:
+            tld (str): The Google Translate domain used by gTTS, which decides the accent
+        """
+        super(GTTSBackend, self).__init__()
+        self.tld = tld
+        self.voice = "gtts:" + tld
+
+    def synthesize(self, text, language):
+        fp = BytesIO()
+        gTTS(text, lang=language, tld=self.tld).write_to_fp(fp)
+        return fp.getvalue()
+
+class Pyttsx3Backend(TTSBackend):
+    available = PYTTSX3_AVAILABLE
+
+    def __init__(self, rate=0):
+        """
+        Synthesises speech on the CPU via pyttsx3, which uses eSpeak, SAPI5 or NSSpeechSynthesizer
+        depending on the platform. The engine is loaded once and kept between strings
+
+        Args:
+            rate (int): Words per minute. 0 for the engine's default
+        """
+        super(Pyttsx3Backend, self).__init__()
+        if not PYTTSX3_AVAILABLE:
+            print("Warning: pyttsx3 could not be imported, install it with: pip install -r requirements-local.in")
+        self.voice = "pyttsx3:{}".format(rate)
+        self.engine = None
+        self.language = None
+        self.rate = rate
+        self.lock = threading.Lock() # The engine can only run one string at a time
+
+    def select_voice(self, language):
+        """
+        Picks the first installed voice speaking language, if there is one
+        """
+        for voice in self.engine.getProperty("voices"):
+            languages = [l.decode("utf-8", "ignore") if isinstance(l, bytes) else str(l) for l in voice.languages]
+            if any(language in l.lower() for l in languages) or language in voice.id.lower().split("/")[-1].split("-"):
+                self.engine.setProperty("voice", voice.id)
+                break
+        self.language = language
+
+    def synthesize(self, text, language):
+        with self.lock:
+            if self.engine is None:
+                self.engine = pyttsx3.init()
+                if self.rate: self.engine.setProperty("rate", self.rate)
+            if language != self.language:
+                self.select_voice(language)
+            fd, name = tempfile.mkstemp(suffix=".wav")
+            os.close(fd)
+            try:
+                self.engine.save_to_file(text, name)
+                self.engine.runAndWait()
+                with open(name, "rb") as f:
+                    return f.read()
+            finally:
+                os.remove(name)
+
+class FallbackBackend(TTSBackend):
+    def __init__(self, primary, fallback, deadline=2.0, cooldown=30.0):
+        """
+        Synthesises with primary, unless it misses the deadline or fails, then with fallback.
+        After a miss, fallback is used straight away for cooldown seconds before primary is tried again.
+        Late audio from primary is still cached, so it's used the next time the string is said
+
+        Args:
+            primary (TTSBackend): The preferred engine, such as gTTS
+            fallback (TTSBackend): The engine used when primary is too slow, such as pyttsx3
+            deadline (float): Seconds primary has to synthesise a string
+            cooldown (float): Seconds primary is skipped after missing the deadline
+        """
+        super(FallbackBackend, self).__init__()
+        self.primary = primary
+        self.fallback = fallback
+        self.deadline = deadline
+        self.cooldown = cooldown
+        self.available = primary.available or fallback.available
+        self.voice = primary.voice
+        self.skip_until = 0.0
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.counts = {"primary": 0, "fallback": 0, "missed": 0, "failed": 0}
+        self.lock = threading.Lock() # Strings are synthesised by several threads at once
+
+    def count(self, outcome):
+        with self.lock:
+            self.counts[outcome] += 1
+
+    def __call__(self, text, language, cache=None):
+        with self.lock:
+            use_primary = self.primary.available and time.time() >= self.skip_until
+        if use_primary:
+            future = self.executor.submit(self.primary, text, language, cache)
+            try:
+                data = future.result(timeout=self.deadline if self.fallback.available else None)
+                self.count("primary")
+                return data
+            except FutureTimeout:
+                self.count("missed")
+                print("Warning: {} missed its {}s deadline, using {}".format(
+                    type(self.primary).__name__, self.deadline, type(self.fallback).__name__))
+            except Exception as e:
+                if not self.fallback.available: raise
+                self.count("failed")
+                print("Warning: {} failed, using {}: {}".format(type(self.primary).__name__, type(self.fallback).__name__, e))
+            with self.lock:
+                self.skip_until = max(self.skip_until, time.time() + self.cooldown)
+        self.count("fallback")
+        return self.fallback(text, language, cache)
+
+    def print_stats(self):
+        print("TTS fallback: {primary} strings by the primary engine, {fallback} by the fallback, "
+              "{missed} missed deadlines, {failed} failures".format(**self.counts))
+        self.primary.print_stats()
+        self.fallback.print_stats()
+
+BACKENDS = {"gtts": GTTSBackend, "pyttsx3": Pyttsx3Backend}
+
+if __name__ == "__main__":
+    # Usage: python TTSBackend.py [language]
+    # Compares the real-time factor, seconds of synthesis per second of speech, of each available engine
+    import sys
+    from pydub import AudioSegment
+    language = sys.argv[1] if len(sys.argv) > 1 else "en"
+    phrases = ["Hello there.", "I am Pepper, a humanoid robot built by Softbank.",
+               "I love talking to people, so ask me anything you like and I will do my best to answer!"]
+    for name, backend in BACKENDS.items():
+        if not backend.available:
+            print("{}: not installed".format(name))
+            continue
+        backend = backend()
+        try:
+            backend("Warming up.", language) # Loads the engine, which later strings don't pay for
+            synthesis, speech = 0.0, 0.0
+            for phrase in phrases:
+                start = time.time()
+                data = backend(phrase, language)
+                synthesis += time.time() - start
+                speech += AudioSegment.from_file(BytesIO(data)).duration_seconds
+            print("{}: real-time factor {:.3f}, {:.3f}s synthesis for {:.2f}s of speech".format(
+                name, synthesis / speech, synthesis / len(phrases), speech / len(phrases)))
+        except Exception as e:
+            print("{}: failed: {}".format(name, e))
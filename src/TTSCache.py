@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+class TTSCache:
+    def __init__(self, directory="", max_items=128):
+        """
+        Creates a content-addressed cache of synthesised speech. Recently used audio is
+        kept in memory, and if directory is set all audio is also stored on disk between runs
+
+        Args:
+            directory (str): Where audio is stored on disk. Empty to only keep audio in memory
+            max_items (int): How many strings are kept in memory
+        """
+        self.directory = directory
+        self.max_items = max_items
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.counts = {"hits": 0, "disk_hits": 0, "misses": 0}
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+    @staticmethod
+    def key(text, language, voice):
+        """
+        Returns:
+            str: The address of the audio for text spoken in language by voice
+        """
+        return hashlib.sha256("\0".join([language, voice, text]).encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".audio")
+
+    def get(self, text, language, voice):
+        """
+        Returns:
+            bytes: The cached audio, or None if not cached
+        """
+        key = self.key(text, language, voice)
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.counts["hits"] += 1
+                return self.memory[key]
+        if self.directory and os.path.isfile(self.path(key)):
+            with open(self.path(key), "rb") as f:
+                data = f.read()
+            self.add(key, data)
+            with self.lock:
+                self.counts["disk_hits"] += 1
+            return data
+        with self.lock:
+            self.counts["misses"] += 1
+        return None
+
+    def put(self, text, language, voice, data):
+        """
+        Caches data, the audio for text spoken in language by voice
+        """
+        key = self.key(text, language, voice)
+        self.add(key, data)
+        if self.directory:
+            tmp = None
+            try:
+                fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.directory) # Unique, as the same text may be synthesised twice at once
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, self.path(key)) # Never leaves a partly written file
+            except OSError as e:
+                print("Warning: Could not store speech in the TTS cache: {}".format(e))
+                if tmp is not None and os.path.exists(tmp): os.remove(tmp)
+
+    def add(self, key, data):
+        with self.lock:
+            self.memory[key] = data
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_items:
+                self.memory.popitem(last=False)
+
+    def print_stats(self):
+        print("TTS cache: {hits} memory hits, {disk_hits} disk hits, {misses} misses".format(**self.counts))
@@ -9,16 +9,30 @@ except ImportError:
     print("Warning: pydub or one of its dependencies (audioop/pyaudioop) could not be imported. LocalTalker will not function properly.")
 
 try:
-    from io import BytesIO
-    from gtts import gTTS
-    GTTS_AVAILABLE = True
+    import pyaudio
+    PYAUDIO_AVAILABLE = True
 except ImportError:
-    GTTS_AVAILABLE = False
-    print("Warning: gtts could not be imported. LocalTalker will not function properly.")
+    PYAUDIO_AVAILABLE = False
+
+import time
+import threading
+import collections
+import queue
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from .Segmenter import Segmenter
+from .AudioPlayer import AudioPlayer, decode, trim, normalize, AUDIO_PLAYER_AVAILABLE
+from .TTSBackend import GTTSBackend
 
 class Talker:
+    segment_sentences = True # If streams are spoken by sentence, otherwise by line
+
     def __init__(self, language="en"):
         self.language = language
+        self.first_audio_at = None # When the first audio of the last response started
+        self.interrupted = threading.Event() # Set when the last response was interrupted
+        self.spoken = "" # What has been spoken of the last response
+        self.speech_log = collections.deque(maxlen=50) # (start, end, text) of recent speech, used for echo suppression
 
     def __call__(self, to_say):
         """
@@ -28,8 +42,12 @@ class Talker:
         Args:
             to_say (str): The string to speak
         """
+        self.first_audio_at = None
+        self.interrupted.clear()
+        self.spoken = ""
         if isinstance(to_say, str):
             self.say(to_say, first=True, last=True)
+            self.record_spoken(to_say)
         else: # If not a string, it's a string generator
             self.stream_say(to_say)
 
@@ -44,66 +62,460 @@ class Talker:
         """
     
         raise NotImplementedError
+
+    def mark_audio(self):
+        """
+        Records when the first audio of a response starts. Called by subclasses as output begins
+        """
+        if self.first_audio_at is None:
+            self.first_audio_at = time.time()
+
+    def publish(self, to_say, duration, start=None):
+        """
+        Records that to_say is being spoken aloud from now, for duration seconds.
+        Called by subclasses as audio output begins, so listeners can ignore the echo
+
+        Args:
+            to_say (str): The text being spoken
+            duration (float): How long, in seconds, it is expected to be spoken
+            start (float): When it starts being spoken, if not now
+        """
+        start = time.time() if start is None else start
+        self.speech_log.append((start, start + duration, to_say))
+
+    def end_publish(self, to_say):
+        """
+        Records that to_say stopped being spoken aloud now. Called by subclasses that know when speech ends
+        """
+        for i in range(len(self.speech_log) - 1, -1, -1):
+            start, end, text = self.speech_log[i]
+            if text == to_say:
+                self.speech_log[i] = (start, time.time(), text)
+                return
+
+    def record_spoken(self, to_say):
+        """
+        Adds to_say to what has been spoken, unless it was interrupted. 
+        Talkers that know how much of an interrupted string was spoken add that part themselves
+        """
+        if not self.interrupted.is_set():
+            self.spoken += to_say + "\n"
+
+    def interrupt(self):
+        """
+        Stops speaking as soon as possible. Called from another thread, such as on barge-in.
+        Subclasses also stop any audio already playing
+        """
+        self.interrupted.set()
+        if self.speech_log:
+            start, end, to_say = self.speech_log[-1]
+            if end > time.time():
+                self.speech_log[-1] = (start, time.time(), to_say)
     
     def stream_say(self, to_say):
         """
-        Speaks the string generated by to_say line by line.
+        Speaks the string generated by to_say in chunks, as soon as each sentence
+        or clause is complete. See Segmenter.
         
         Args:
             to_say (str): The string to speak
         """
-        res = ""
+        segmenter = Segmenter(sentences=self.segment_sentences)
         first = True
         for mes in to_say:
-            res += mes
-            while res.count('\n') >= 1:
-                pos = res.find('\n')
-                self.say(res[0:pos],first=first)
-                res = res[pos+1:]
+            for chunk in segmenter.feed(mes):
+                if self.interrupted.is_set(): break
+                self.say(chunk,first=first)
+                self.record_spoken(chunk)
                 first = False
+            if self.interrupted.is_set():
+                if hasattr(to_say, "close"): to_say.close() # Stops the upstream generation
+                return
+        res = segmenter.flush()
         self.say(res,first=first,last=True)
+        self.record_spoken(res)
     
 class TerminalTalker(Talker):
+    segment_sentences = False
+
     def __init__(self, language="en", prefix="\nAssistant: "):
         super(TerminalTalker, self).__init__(language=language)
         self.prefix = prefix
 
     def say(self, to_say, first=False, last=False):
+        self.mark_audio()
         if first: print(self.prefix + to_say)
         else: print(to_say)
         if last: print()
 
 class LocalTalker(Talker):
-    def __init__(self, language="en"):
+    def __init__(self, language="en", synth_workers=2, queue_depth=3, tld="com", cache=None, prewarm=None,
+                 trim_silence=True, trim_pad=0.05, loudness=0.1, backend=None):
+        """
+        Speaks through the device speakers via gTTS, or another TTS backend. Speech is pipelined, so the next 
+        string is synthesised by a pool of workers while the current one plays.
+        If numpy and sounddevice are available, audio is decoded in-process and
+        played back to back on a single output stream, which stays open.
+
+        Args:
+            language (str): The ISO 639-1 code for the language spoken
+            synth_workers (int): How many strings are synthesised at once
+            queue_depth (int): How many strings can wait for playback, and how many can be queued on the output stream, before say blocks
+            tld (str): The Google Translate domain used by gTTS, which decides the accent. Unused with backend
+            cache (TTSCache): If set, synthesised audio is cached and reused
+            prewarm (list): Strings synthesised into the cache in the background at start
+            trim_silence (bool): If the silence TTS adds before and after each string is trimmed
+            trim_pad (float): Seconds of silence kept on either side of each string when trimming
+            loudness (float): The RMS each string is normalised to, between 0 and 1. 0 to not normalise
+            backend (TTSBackend): Synthesises the speech. gTTS if not set
+        """
         super(LocalTalker, self).__init__(language=language)
         if not PYDUB_AVAILABLE:
             print("Warning: LocalTalker will output text instead of audio due to missing pydub dependency.")
+        self.synthesizer = ThreadPoolExecutor(max_workers=synth_workers)
+        self.queue = queue.Queue(maxsize=queue_depth)
+        self.queue_depth = queue_depth
+        self.gaps = [] # Seconds of silence between consecutive strings of a response
+        self.last_end = None
+        self.decode_times = [] # Seconds spent decoding and processing each string
+        self.start_latencies = [] # Seconds from playback being requested until it starts
+        self.backend = backend if backend is not None else GTTSBackend(tld=tld)
+        if not self.backend.available:
+            print("Warning: LocalTalker will output text instead of audio as {} is not installed.".format(type(self.backend).__name__))
+        self.cache = cache
+        self.trim_silence = trim_silence
+        self.trim_pad = trim_pad
+        self.loudness = loudness
+        self.output = None
+        if AUDIO_PLAYER_AVAILABLE:
+            try:
+                self.output = AudioPlayer()
+            except Exception as e:
+                print("Warning: LocalTalker could not open an output stream, so each string opens its own: {}".format(e))
+        self.player = threading.Thread(target=self.play_queue, daemon=True)
+        self.player.start()
+        if cache is not None and prewarm and self.backend.available:
+            threading.Thread(target=self.prewarm, args=(prewarm,), daemon=True).start()
+
+    def prewarm(self, phrases):
+        """
+        Synthesises phrases into the cache, skipping those already cached
+        """
+        for phrase in phrases:
+            try:
+                self.backend(phrase, self.language, self.cache)
+            except Exception as e:
+                print("Error prewarming '{}': {}".format(phrase, e))
+
+    def print_text(self, to_say, first=False, last=False):
+        """
+        Prints to_say, used when audio isn't available
+        """
+        if first: print("\nLocalTalker: " + to_say)
+        else: print(to_say)
+        if last: print()
+
+    def synthesize(self, to_say):
+        """
+        Converts to_say into audio
+
+        Returns:
+            np.ndarray or AudioSegment: The spoken audio, as samples if there's an output stream
+        """
+        data = self.backend(to_say, self.language, self.cache)
+        start = time.time()
+        if self.output is not None:
+            segment = decode(data, self.output.samplerate)
+            if self.trim_silence:
+                segment = trim(segment, self.output.samplerate, pad=self.trim_pad)
+            if self.loudness:
+                normalize(segment, rms=self.loudness)
+        else:
+            segment = AudioSegment.from_file(BytesIO(data))
+        self.decode_times.append(time.time() - start)
+        return segment
+
+    def play(self, segment, chunk_ms=50):
+        """
+        Plays segment in short chunks so it can be interrupted
+
+        Args:
+            segment (AudioSegment): The audio to play
+            chunk_ms (int): Milliseconds between checks for interruption
+
+        Returns:
+            float: The fraction of segment played
+        """
+        if not PYAUDIO_AVAILABLE:
+            playback.play(segment)
+            return 1.0
+        opened = time.time()
+        p = pyaudio.PyAudio()
+        stream = p.open(format=p.get_format_from_width(segment.sample_width),
+                        channels=segment.channels,
+                        rate=segment.frame_rate,
+                        output=True)
+        self.start_latencies.append(time.time() - opened)
+        played = 0
+        try:
+            for start in range(0, len(segment), chunk_ms):
+                if self.interrupted.is_set(): break
+                stream.write(segment[start:start + chunk_ms]._data)
+                played = min(start + chunk_ms, len(segment))
+        finally:
+            stream.stop_stream()
+            stream.close()
+            p.terminate()
+        return played / max(len(segment), 1)
+
+    def play_queue(self):
+        """
+        Plays synthesised strings in the order they were said, forever.
+        With an output stream, the next string is queued while the current one plays
+        """
+        playing = collections.deque() # (to_say, handle, first) queued on the output stream
+        while True:
+            while playing and playing[0][1].done.is_set():
+                self.settle(*playing.popleft())
+            if len(playing) >= self.queue_depth: # Leave the rest in the queue, so say still blocks
+                playing[0][1].done.wait(0.02)
+                continue
+            try:
+                item = self.queue.get(timeout=0.02 if playing else None)
+            except queue.Empty:
+                continue
+            to_say, future, first, last = item
+            handle = None
+            try:
+                if self.interrupted.is_set():
+                    future.cancel()
+                    continue
+                try:
+                    segment = future.result()
+                except Exception as e:
+                    print("Error playing audio: {}".format(e))
+                    # Fallback to printing text if audio playback fails
+                    self.print_text(to_say, first, last)
+                    continue
+                if self.interrupted.is_set(): continue
+                if self.output is not None:
+                    self.mark_audio()
+                    handle = self.output.enqueue(segment)
+                    self.publish(to_say, handle.duration)
+                    playing.append((to_say, handle, first)) # Marked done by settle
+                    continue
+                start = time.time()
+                if not first and self.last_end is not None:
+                    self.gaps.append(start - self.last_end)
+                self.mark_audio()
+                self.publish(to_say, segment.duration_seconds)
+                played = self.play(segment)
+                self.last_end = time.time()
+                if self.interrupted.is_set():
+                    # Keep the words spoken before the interruption
+                    self.record_partial(to_say, played)
+                else:
+                    self.spoken += to_say + "\n"
+            finally:
+                if handle is None: self.queue.task_done()
+
+    def settle(self, to_say, handle, first):
+        """
+        Records a string once the output stream has finished or stopped playing it
+        """
+        try:
+            if handle.idle and handle.start_time is not None:
+                self.start_latencies.append(handle.start_time - handle.queued_at)
+            if handle.end_time is None:
+                # Keep the words spoken before the interruption
+                self.record_partial(to_say, handle.played)
+                return
+            if not first and self.last_end is not None:
+                self.gaps.append(max(handle.start_time - self.last_end, 0.0))
+            self.last_end = handle.end_time
+            self.spoken += to_say + "\n"
+        finally:
+            self.queue.task_done()
+
+    def record_spoken(self, to_say):
+        """
+        Not used, as strings are recorded by play_queue once played
+        """
+
+    def record_partial(self, to_say, played):
+        """
+        Adds the whole words of to_say spoken before an interruption, given the fraction of it played
+        """
+        words = to_say[:int(len(to_say) * played)].rpartition(" ")[0]
+        if words.strip():
+            self.spoken += words + "\n"
+
+    def interrupt(self):
+        """
+        Stops playback and drops all strings waiting to be played
+        """
+        super(LocalTalker, self).interrupt()
+        while True:
+            try:
+                _, future, _, _ = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            future.cancel()
+            self.queue.task_done()
+        if self.output is not None:
+            self.output.stop()
+        self.queue.join() # Wait for the current string to stop
 
     def say(self, to_say, first=False, last=False):
-        if not PYDUB_AVAILABLE or not GTTS_AVAILABLE:
+        """
+        Queues to_say to be synthesised and played. Returns once queued, 
+        unless it's the last string, then it returns once everything is played
+        """
+        if not PYDUB_AVAILABLE or not self.backend.available:
             # Fallback to printing text if dependencies are not available
-            if first: print("\nLocalTalker: " + to_say)
-            else: print(to_say)
-            if last: print()
+            self.mark_audio()
+            self.print_text(to_say, first, last)
+            self.spoken += to_say + "\n"
             return
-            
-        try:
-            audio = gTTS(to_say,lang=self.language)
-            fp = BytesIO()
-            audio.write_to_fp(fp)
-            fp.seek(0) # Return to start of file
-            segment = AudioSegment.from_file(fp,format="mp3")
-            playback.play(segment)
-        except Exception as e:
-            print("Error playing audio: {}".format(e))
-            # Fallback to printing text if audio playback fails
-            if first: print("\nLocalTalker: " + to_say)
-            else: print(to_say)
-            if last: print()
+        if to_say.strip() and not self.interrupted.is_set():
+            self.queue.put((to_say, self.synthesizer.submit(self.synthesize, to_say), first, last))
+        if last:
+            self.queue.join()
+
+    def print_stats(self):
+        if self.cache is not None:
+            self.cache.print_stats()
+        self.backend.print_stats()
+        if self.decode_times:
+            print("Decoding: {:.3f}s mean, {:.3f}s max over {} strings".format(
+                sum(self.decode_times) / len(self.decode_times), max(self.decode_times), len(self.decode_times)))
+        if self.start_latencies:
+            print("Playback start latency: {:.3f}s mean, {:.3f}s max over {} starts".format(
+                sum(self.start_latencies) / len(self.start_latencies), max(self.start_latencies), len(self.start_latencies)))
+        if self.gaps:
+            print("Gaps between sentences: {:.3f}s mean, {:.3f}s max over {} gaps".format(
+                sum(self.gaps) / len(self.gaps), max(self.gaps), len(self.gaps)))
+
+class FanOutTalker(Talker):
+    STREAM = object() # Queued before the parts of a streamed response
+    END = object() # Queued after the last part of a streamed response
+
+    def __init__(self, talkers, queue_depth=32):
+        """
+        Speaks each response through several talkers at once, such as the terminal, speakers and a NAO.
+        Each talker has its own worker and queue, so a slow talker doesn't hold up the others.
+        A streamed response is read once, and the parts a talker is behind on are joined in its queue.
+        The first talker is the one whose spoken text is remembered on interruption
+
+        Args:
+            talkers (list): The Talkers to speak through
+            queue_depth (int): How many parts of a stream each talker can be behind before they're joined
+        """
+        super(FanOutTalker, self).__init__(language=talkers[0].language)
+        self.talkers = talkers
+        self.queues = [queue.Queue(maxsize=queue_depth) for _ in talkers]
+        self.merged = [0] * len(talkers) # Parts joined as each talker was behind
+        for talker, q in zip(talkers, self.queues):
+            talker.speech_log = self.speech_log # All speech is logged in one place, for echo suppression
+            threading.Thread(target=self.work, args=(talker, q), daemon=True).start()
+
+    def work(self, talker, q):
+        """
+        Speaks the responses queued for talker, forever
+        """
+        while True:
+            item = q.get()
+            ended = [] if item is self.STREAM else [True]
+            try:
+                if item is self.STREAM:
+                    talker(self.read(q, ended))
+                else:
+                    talker(item)
+            except Exception as e:
+                print("Error in {}: {}".format(type(talker).__name__, e))
+            finally:
+                while not ended: # Skip what's left if talker stopped early or failed
+                    self.read_item(q, ended)
+                q.task_done()
+
+    def read(self, q, ended):
+        """
+        Yields the parts of a stream queued in q, until its end
+        """
+        while not ended:
+            item = self.read_item(q, ended)
+            if not ended: yield item
+
+    def read_item(self, q, ended):
+        """
+        Returns the next part of a stream queued in q, appending to ended at its end
+        """
+        item = q.get()
+        q.task_done()
+        if item is self.END: ended.append(True)
+        return item
+
+    def __call__(self, to_say):
+        """
+        Speaks to_say through every talker, returning once all are done
+        """
+        self.first_audio_at = None
+        self.interrupted.clear()
+        self.spoken = ""
+        if isinstance(to_say, str):
+            for q in self.queues: q.put(to_say)
+        else:
+            for q in self.queues: q.put(self.STREAM)
+            behind = [""] * len(self.queues) # Text each talker's full queue couldn't take yet
+            for mes in to_say:
+                if self.interrupted.is_set():
+                    if hasattr(to_say, "close"): to_say.close() # Stops the upstream generation
+                    break
+                for i, q in enumerate(self.queues):
+                    if behind[i]: self.merged[i] += 1
+                    behind[i] += mes
+                    try:
+                        q.put_nowait(behind[i])
+                        behind[i] = ""
+                    except queue.Full:
+                        pass
+            for i, q in enumerate(self.queues):
+                if behind[i]: q.put(behind[i])
+                q.put(self.END)
+        for q in self.queues: q.join()
+        primary = self.talkers[0]
+        self.spoken = primary.spoken
+        started = [t.first_audio_at for t in self.talkers if t.first_audio_at is not None]
+        self.first_audio_at = min(started) if started else None
+        if any(t.interrupted.is_set() for t in self.talkers): self.interrupted.set()
+
+    def say(self, to_say, first=False, last=False):
+        """
+        Not used, as each talker speaks on its own worker
+        """
+        raise NotImplementedError
+
+    def interrupt(self):
+        """
+        Stops every talker
+        """
+        super(FanOutTalker, self).interrupt()
+        for talker in self.talkers:
+            talker.interrupt()
+
+    def close(self):
+        for talker in self.talkers:
+            if hasattr(talker, "close"): talker.close()
+
+    def print_stats(self):
+        for talker, merged in zip(self.talkers, self.merged):
+            print("{}: {} stream parts joined while behind".format(type(talker).__name__, merged))
+            if hasattr(talker, "print_stats"): talker.print_stats()
 
 if __name__ == "__main__":
-    from Chatter import Chatter
-    from Listener import Listener
+    # Usage: python -m src.Talker
+    from .Chatter import Chatter
+    from .Listener import Listener
     name = "Pepper"
     swe_intro = "Du är den mänskliga roboten {}. En NAO-modellrobot byggd av Softbank och programmerad av FIA Robotics. Din uppgift är att hålla en intressant konversation med en grupp människor. Du får max svara med två meningar.".format(name)
     eng_intro = "You are the humanoid robot {}. A NAO model robot built by Softbank and programmed by FIA Robotics. Your task is to hold an interesting conversation with a group of humans. You can at most answer with two sentences".format(name)
@@ -0,0 +1,45 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+# Import the modules as main.py does, as src.X
+sys.path.insert(0, ROOT)
+
+# Imports nao_py2_scripts/direct_nao_bridge.py under Python 2, with a stand-in for the NAOqi SDK
+BRIDGE_PRELUDE = """
+import sys, types
+naoqi = types.ModuleType("naoqi")
+class ALProxy(object):
+    def __init__(self, *args):
+        raise RuntimeError("No NAO in tests")
+naoqi.ALProxy = ALProxy
+sys.modules["naoqi"] = naoqi
+sys.path.insert(0, {!r})
+import json
+import direct_nao_bridge as bridge
+""".format(os.path.join(ROOT, "nao_py2_scripts"))
+
+@pytest.fixture(scope="session")
+def bridge():
+    """
+    Runs Python 2 code with the bridge imported as bridge. The code prints its result as JSON on the last line.
+    Set PYTHON2 to the interpreter, python2.7 by default. Skipped if it isn't available
+    """
+    python2 = os.environ.get("PYTHON2", "python2.7")
+    try:
+        version = subprocess.run([python2, "-c", "import sys; print(sys.version_info[0])"],
+                                 stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        version = None
+    if version is None or version.stdout.strip() != "2":
+        pytest.skip("Python 2 isn't available to run the bridge")
+    def run(code, timeout=30):
+        result = subprocess.run([python2, "-c", BRIDGE_PRELUDE + code], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True, timeout=timeout, cwd=ROOT, env=dict(os.environ, PYTHONDONTWRITEBYTECODE="1"))
+        assert result.returncode == 0, result.stderr
+        return json.loads(result.stdout.strip().splitlines()[-1])
+    return run
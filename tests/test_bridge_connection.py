@@ -0,0 +1,159 @@
+import json
+import socket
+import threading
+
+import pytest
+
+from src.NAO.BridgeConnection import BridgeConnection, FRAME_HEADER, FRAME_REQUEST, FRAME_RESPONSE, FRAME_EVENT, FRAME_AUDIO
+
+class FakeBridge:
+    """
+    Accepts one connection on a Unix domain socket and lets the test read and write its frames
+    """
+    def __init__(self, tmp_path):
+        self.path = str(tmp_path / "bridge.sock")
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.path)
+        self.server.listen(1)
+        self.conn = None
+        self.accepted = threading.Thread(target=self.accept)
+        self.accepted.start()
+
+    def accept(self):
+        self.conn, _ = self.server.accept()
+
+    def connect(self, timeout=2.0):
+        connection = BridgeConnection(path=self.path, timeout=timeout)
+        self.accepted.join()
+        self.conn.settimeout(5)
+        return connection
+
+    def read(self):
+        data = b""
+        while len(data) < FRAME_HEADER.size:
+            data += self.conn.recv(FRAME_HEADER.size - len(data))
+        size, kind, rid = FRAME_HEADER.unpack(data)
+        payload = b""
+        while len(payload) < size:
+            payload += self.conn.recv(size - len(payload))
+        return kind, rid, json.loads(payload)
+
+    def write(self, kind, rid, payload):
+        if not isinstance(payload, bytes):
+            payload = json.dumps(payload).encode("utf-8")
+        self.conn.sendall(FRAME_HEADER.pack(len(payload), kind, rid) + payload)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+        self.server.close()
+
+@pytest.fixture
+def fake(tmp_path):
+    fake = FakeBridge(tmp_path)
+    yield fake
+    fake.close()
+
+def test_responses_are_matched_by_id(fake):
+    connection = fake.connect()
+    results = {}
+    threads = [threading.Thread(target=lambda op: results.update({op: connection.request(op, text=op)}), args=(op,))
+               for op in ("say", "status")]
+    for thread in threads: thread.start()
+    requests = [fake.read(), fake.read()]
+    assert sorted(message["op"] for _, _, message in requests) == ["say", "status"]
+    assert all(kind == FRAME_REQUEST and rid > 0 for kind, rid, _ in requests)
+    for kind, rid, message in reversed(requests): # Answered out of order
+        fake.write(FRAME_RESPONSE, rid, {"op": message["op"]})
+    for thread in threads: thread.join(5)
+    assert results == {"say": {"op": "say"}, "status": {"op": "status"}}
+    assert connection.pending == {}
+    connection.close()
+
+def test_send_expects_no_response(fake):
+    connection = fake.connect()
+    connection.send("delta", turn=1, text="Hej så länge")
+    assert fake.read() == (FRAME_REQUEST, 0, {"op": "delta", "turn": 1, "text": "Hej så länge"})
+    connection.close()
+
+def test_events_and_audio_are_pushed(fake):
+    connection = fake.connect()
+    events, audio = [], []
+    connection.listeners.append(events.append)
+    connection.audio_listeners.append(audio.append)
+    fake.write(FRAME_AUDIO, 0, b"\x00\x01" * 8)
+    fake.write(FRAME_EVENT, 0, {"event": "attention", "engaged": True})
+    fake.write(FRAME_EVENT, 0, {"event": "utterance", "id": 7, "state": "done", "duration": 1.5})
+    assert connection.wait_utterance(7, 5) == {"event": "utterance", "id": 7, "state": "done", "duration": 1.5}
+    assert audio == [b"\x00\x01" * 8]
+    assert [event["event"] for event in events] == ["attention", "utterance"]
+    connection.close()
+
+def test_pushed_utterances_are_bounded(fake):
+    connection = fake.connect()
+    for uid in range(300):
+        connection.on_event({"event": "utterance", "id": uid, "state": "done"})
+    assert len(connection.utterances) == 256 and next(iter(connection.utterances)) == 44
+    connection.close()
+
+def test_response_timeout(fake):
+    connection = fake.connect(timeout=0.1)
+    with pytest.raises(TimeoutError):
+        connection.request("status")
+    assert connection.pending == {}
+    connection.close()
+
+def test_bridge_closing_fails_pending_and_later_requests(fake):
+    connection = fake.connect()
+    errors = []
+    def request():
+        try:
+            connection.request("status", timeout=5)
+        except ConnectionError as e:
+            errors.append(e)
+    thread = threading.Thread(target=request)
+    thread.start()
+    fake.read()
+    fake.conn.close()
+    thread.join(5)
+    assert len(errors) == 1
+    connection.reader.join(5)
+    assert connection.closed
+    with pytest.raises(ConnectionError):
+        connection.send("delta", turn=1, text="")
+
+def test_bridge_frames_match(bridge):
+    """
+    The bridge packs the same headers, and frees a host's audio listener and thread when it disconnects
+    """
+    result = bridge("""
+import socket, struct, threading
+class Streamer(object):
+    listeners = []
+bridge.audio_streamer = Streamer()
+ours, theirs = socket.socketpair()
+connection = bridge.FrameConnection(ours, "test")
+server = threading.Thread(target=connection.serve)
+server.start()
+payload = json.dumps({"op": "subscribe", "audio": True})
+theirs.sendall(bridge.FRAME_HEADER.pack(len(payload), bridge.FRAME_REQUEST, 5) + payload)
+header = theirs.recv(bridge.FRAME_HEADER.size)
+size, kind, rid = bridge.FRAME_HEADER.unpack(header)
+response = json.loads(theirs.recv(size))
+subscribed = len(Streamer.listeners)
+threads = threading.active_count()
+theirs.close()
+server.join(5)
+for _ in range(50):
+    if threading.active_count() < threads:
+        break
+    threading.Event().wait(0.02)
+print(json.dumps({"header": header.encode("hex"), "kind": kind, "rid": rid, "response": response,
+                  "subscribed": subscribed, "listeners": len(Streamer.listeners),
+                  "threads": threads, "left": threading.active_count()}))
+""")
+    size = len(json.dumps({"success": True, "audio": True}))
+    assert result["header"] == FRAME_HEADER.pack(size, FRAME_RESPONSE, 5).hex()
+    assert (result["kind"], result["rid"], result["response"]) == (FRAME_RESPONSE, 5, {"success": True, "audio": True})
+    assert result["subscribed"] == 1 and result["listeners"] == 0
+    assert result["left"] == result["threads"] - 2 # The reader and the audio sender
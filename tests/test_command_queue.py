@@ -0,0 +1,159 @@
+"""
+The bridge's CommandQueue, run under Python 2 with the NAO replaced by a record of what it was asked to do
+"""
+
+# Speaks by recording each text, holding it until released, and stops by releasing everything
+FAKE_NAO = """
+import threading, time
+class Controller(object):
+    generation = 0
+    stop_latencies = []
+    def stop(self):
+        self.generation += 1
+        release.set()
+        return 0.0
+    def emergency(self):
+        return self.stop()
+ran = []
+release = threading.Event()
+def process(requests, generation):
+    for uid, text in requests:
+        release.wait(10)
+        if generation == bridge.nao_controller.generation:
+            ran.append(text)
+bridge.nao_controller = Controller()
+bridge.process_nao_requests = process
+bridge.command_queue = bridge.CommandQueue(depth=3)
+def settle():
+    for _ in range(500):
+        with bridge.command_queue.changed:
+            if not bridge.command_queue.queued:
+                return
+        time.sleep(0.01)
+"""
+
+def test_runs_in_order(bridge):
+    result = bridge(FAKE_NAO + """
+ids = bridge.command_queue.put(["one"]) + bridge.command_queue.put(["two", "three"])
+release.set()
+settle()
+print(json.dumps({"ids": ids, "ran": ran}))
+""")
+    assert result["ran"] == ["one", "two", "three"]
+    assert result["ids"] == sorted(result["ids"]) and len(set(result["ids"])) == 3
+
+def test_full_queue_turns_away_or_waits(bridge):
+    result = bridge(FAKE_NAO + """
+queue = bridge.command_queue
+queue.put(["one", "two"])
+try:
+    queue.put(["three", "four"])
+    retry_after = None
+except bridge.QueueFull as e:
+    retry_after = e.retry_after
+waiter = threading.Thread(target=queue.put, args=(["three", "four"], True))
+waiter.start()
+time.sleep(0.1)
+waiting = waiter.is_alive()
+release.set()
+waiter.join(5)
+settle()
+big = queue.put(["a", "b", "c", "d"]) # Larger than the queue, but taken once it's empty
+settle()
+print(json.dumps({"retry_after": retry_after, "waiting": waiting, "ran": ran, "status": queue.status(), "big": len(big)}))
+""")
+    assert result["retry_after"] >= 1
+    assert result["waiting"]
+    assert result["ran"] == ["one", "two", "three", "four", "a", "b", "c", "d"]
+    assert result["status"]["rejected"] == 1 and result["status"]["queued"] == 0 and result["status"]["capacity"] == 3
+    assert result["big"] == 4
+
+def test_http_busy_response(bridge):
+    result = bridge(FAKE_NAO + """
+import urllib2
+server = bridge.PooledHTTPServer(("localhost", 0), bridge.NAOBridgeHandler, workers=2)
+thread = threading.Thread(target=server.serve_forever)
+thread.daemon = True
+thread.start()
+url = "http://localhost:%d/" % server.server_address[1]
+def post(data):
+    request = urllib2.Request(url, json.dumps(data), {"Content-Type": "application/json"})
+    try:
+        response = urllib2.urlopen(request, timeout=5)
+        return response.getcode(), None, json.loads(response.read())
+    except urllib2.HTTPError as e:
+        return e.code, e.headers.getheader("Retry-After"), json.loads(e.read())
+responses = [post({"batch": ["one", "two", "three"]}), post({"text": "four"}), post({"text": "stop"})]
+settle() # The stopped speech finishes
+responses.append(post({"text": "five"}))
+settle()
+server.shutdown()
+print(json.dumps({"responses": responses, "ran": ran}))
+""")
+    (queued, _, _), (busy, retry_after, error), (stopped, _, stop), (after, _, _) = result["responses"]
+    assert queued == 200
+    assert busy == 429 and error["error"] == "busy" and int(retry_after) == error["retry_after"] >= 1
+    assert stopped == 200 and stop["success"] # A stop is never turned away
+    assert after == 200
+    assert result["ran"] == ["five"] # The stop dropped what was queued before it
+
+def test_socket_stop_is_read_behind_a_blocked_stream(bridge):
+    """
+    A streamed turn waiting for room in the command queue doesn't hold up a stop on the same connection
+    """
+    result = bridge(FAKE_NAO + """
+import socket
+ours, theirs = socket.socketpair()
+connection = bridge.FrameConnection(ours, "test")
+server = threading.Thread(target=connection.serve)
+server.daemon = True
+server.start()
+def send(rid, message):
+    payload = json.dumps(message)
+    theirs.sendall(bridge.FRAME_HEADER.pack(len(payload), bridge.FRAME_REQUEST, rid) + payload)
+def read():
+    size, kind, rid = bridge.FRAME_HEADER.unpack(theirs.recv(bridge.FRAME_HEADER.size))
+    return rid, json.loads(theirs.recv(size))
+send(0, {"op": "delta", "turn": 1, "text": "One. Two. Three. Four. Five. "})
+time.sleep(0.2) # The turn's feeder is now waiting for room
+send(9, {"op": "say", "text": "stop"})
+theirs.settimeout(2)
+rid, stop = read()
+send(10, {"op": "end", "turn": 1})
+rid_end, end = read()
+print(json.dumps({"rid": rid, "stop": stop, "rid_end": rid_end, "end": end}))
+""")
+    assert result["rid"] == 9 and result["stop"]["success"]
+    assert result["rid_end"] == 10 and result["end"]["success"]
+
+def test_idle_connections_leave_workers_for_a_stop(bridge):
+    """
+    Hosts keeping more connections open than there are workers don't keep a stop waiting
+    """
+    result = bridge(FAKE_NAO + """
+import httplib
+server = bridge.PooledHTTPServer(("localhost", 0), bridge.NAOBridgeHandler, workers=2)
+thread = threading.Thread(target=server.serve_forever)
+thread.daemon = True
+thread.start()
+def get(connection):
+    connection.request("GET", "/status")
+    return json.loads(connection.getresponse().read())
+idle = [httplib.HTTPConnection("localhost", server.server_address[1], timeout=5) for _ in range(4)]
+for connection in idle:
+    get(connection) # Kept open
+start = time.time()
+stopper = httplib.HTTPConnection("localhost", server.server_address[1], timeout=5)
+stopper.request("POST", "/", json.dumps({"text": "stop"}), {"Content-Type": "application/json"})
+stop = json.loads(stopper.getresponse().read())
+stop_time = time.time() - start
+status = get(idle[0]) # Served again once its next request arrives
+for connection in idle[1:]:
+    connection.close()
+time.sleep(0.2)
+server.shutdown()
+print(json.dumps({"stop": stop, "stop_time": stop_time, "status": status, "idle": len(server.idle)}))
+""")
+    assert result["stop"]["success"] and result["stop_time"] < 1
+    assert result["status"]["connections_idle"] == 4 # The other three and the stopper's
+    assert result["idle"] == 2 # The two still open, the closed ones are dropped
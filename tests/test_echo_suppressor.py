@@ -0,0 +1,48 @@
+import time
+import types
+
+import pytest
+
+pytest.importorskip("speech_recognition")
+pytest.importorskip("sounddevice")
+pytest.importorskip("openai")
+from src.Listener import EchoSuppressor
+
+def suppressor(*said, **kwargs):
+    now = time.time()
+    talker = types.SimpleNamespace(speech_log=[(now - 2, now - 1, text) for text in said])
+    return EchoSuppressor(talker, **kwargs)
+
+def test_repeated_speech_is_echo():
+    echo = suppressor("Here is a joke about a cat who learned to play the piano.")
+    assert echo.is_echo("a cat who learned to play")
+    assert echo.counts["matching"] == 1
+
+def test_misheard_speech_is_echo():
+    echo = suppressor("The weather in Stockholm is sunny and warm today.")
+    assert echo.is_echo("the weather in stock home is sunny and warm today")
+
+def test_echo_across_logged_strings():
+    echo = suppressor("I like music.", "What do you like to listen to?")
+    assert echo.is_echo("I like music what do you like")
+
+@pytest.mark.parametrize("text", ["no", "okay", "yes please"])
+def test_short_replies_are_kept(text):
+    echo = suppressor("Did you say no? Okay, yes please, I understand.")
+    assert not echo.is_echo(text)
+
+def test_words_scattered_through_speech_are_kept():
+    echo = suppressor("Here is a joke. Did you ever tell me about your day? A funny one.")
+    assert not echo.is_echo("tell me a joke")
+
+def test_new_question_is_kept():
+    echo = suppressor("I am a robot built to talk with people about anything.")
+    assert not echo.is_echo("what is the capital of France")
+
+def test_old_speech_is_forgotten():
+    echo = suppressor("Here is a joke about a cat who learned to play the piano.", memory=0.5)
+    assert not echo.is_echo("a cat who learned to play")
+
+def test_min_words_is_configurable():
+    echo = suppressor("Okay, let me think.", min_words=1)
+    assert echo.is_echo("okay")
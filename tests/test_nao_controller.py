@@ -0,0 +1,50 @@
+"""
+The bridge's NAOController, run under Python 2 against a stand-in for NAOqi's proxies
+"""
+
+# Runs each task for task_time seconds. wait returns as NAOqi documents it: True if the timeout ran out, False if the task ended
+FAKE_NAOQI = """
+import threading, time
+calls = []
+task_time = [0.05]
+class Post(object):
+    def __init__(self, name):
+        self.name = name
+    def __getattr__(self, method):
+        def start(*args):
+            calls.append((self.name, "post." + method))
+            return len(calls)
+        return start
+class FakeProxy(object):
+    def __init__(self, name, ip, port):
+        self.name = name
+        self.post = Post(name)
+    def getAvailableLanguages(self):
+        return ["English"]
+    def wait(self, task, timeout):
+        time.sleep(min(task_time[0], timeout / 1000.0))
+        return task_time[0] > timeout / 1000.0
+    def __getattr__(self, method):
+        return lambda *args: calls.append((self.name, method))
+bridge.ALProxy = FakeProxy
+bridge.ConnectionSupervisor.reachable = lambda self: True
+bridge.nao_controller = bridge.NAOController("localhost", "English", 50)
+"""
+
+def test_finished_task_succeeds(bridge):
+    result = bridge(FAKE_NAOQI + """
+uid = bridge.utterances.add("Hello there")
+bridge.process_nao_requests([(uid, "Hello there")], bridge.nao_controller.generation)
+print(json.dumps({"state": bridge.utterances.wait(uid)["state"], "stopped": ["ALTextToSpeech", "stop"] in map(list, calls)}))
+""")
+    assert result["state"] == "done"
+    assert not result["stopped"]
+
+def test_task_over_its_limit_is_stopped(bridge):
+    result = bridge(FAKE_NAOQI + """
+task_time[0] = 1.0
+finished = bridge.nao_controller.run_task("ALMotion", "wakeUp", [], 0.1)
+print(json.dumps({"finished": finished, "stopped": ["ALMotion", "stop"] in map(list, calls)}))
+""")
+    assert not result["finished"]
+    assert result["stopped"]
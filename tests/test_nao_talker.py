@@ -0,0 +1,42 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("iso639")
+pytest.importorskip("requests")
+from src.NAO.NAOTalker import NAOTalker
+
+class Response(object):
+    status_code = 200
+    def __init__(self, body):
+        self.body = body
+
+    def json(self):
+        return self.body
+
+class OldBridge(object):
+    """An HTTP session to a bridge which splits streams but returns no ids to follow them by"""
+    def post(self, url, data=None, **kwargs):
+        for _ in data or []: time.sleep(0.01) # Streamed as it's generated
+        return Response({"ids": [], "texts": []} if url.endswith("/stream") else {})
+
+@pytest.fixture
+def talker():
+    talker = NAOTalker(ip="localhost", bridge_url="http://localhost:1", duration=lambda text: 0.2)
+    talker.closing.set() # Keeps the monitor from connecting
+    talker.monitor.join()
+    talker.mock_mode = False
+    talker.session = OldBridge()
+    return talker
+
+SENTENCES = ["The first sentence is spoken in full.", " The second one is cut off.", " The third is never said."]
+
+def test_interrupted_stream_keeps_the_segments_spoken(talker):
+    threading.Timer(0.3, talker.interrupt).start()
+    talker(sentence for sentence in SENTENCES)
+    assert talker.spoken == "The first sentence is spoken in full.\n"
+
+def test_stream_is_spoken_in_full(talker):
+    talker(sentence for sentence in SENTENCES)
+    assert talker.spoken == "".join(SENTENCES) + "\n"
@@ -0,0 +1,25 @@
+import wave
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("speech_recognition")
+pytest.importorskip("sounddevice")
+pytest.importorskip("openai")
+from src.Listener import Listener, ReplaySource
+
+def test_replay_hears_each_clip_once(tmp_path):
+    tone = (np.sin(2 * np.pi * 440 * np.arange(16000) / 16000.0) * 8000).astype("<i2").tobytes()
+    for i in range(3):
+        with wave.open(str(tmp_path / "clip{}.wav".format(i)), "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(16000)
+            w.writeframes(tone)
+    listener = Listener(source=ReplaySource(str(tmp_path), speed=0), default_mic=False)
+    phrases = []
+    listener.timed_recognize = lambda engine, audio: (phrases.append(audio) or "hello", None)
+    with pytest.raises(EOFError):
+        while True:
+            assert listener() == "hello"
+    assert len(phrases) == 3 # Not the silence left at the end of the replay
@@ -0,0 +1,57 @@
+import json
+import os
+
+import pytest
+
+from src.Segmenter import Segmenter, benchmark
+
+# Shared with the bridge's SpeechAssembler, which has to segment the same way
+CASES_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "data", "segmenter_cases.json")
+with open(CASES_PATH, encoding="utf-8") as f:
+    CASES = json.load(f)
+
+def segment(segmenter, deltas):
+    chunks = []
+    for delta in deltas:
+        chunks += segmenter.feed(delta)
+    return chunks, segmenter.flush()
+
+@pytest.mark.parametrize("case", CASES, ids=[case["name"] for case in CASES])
+def test_cases(case):
+    assert segment(Segmenter(**case["options"]), case["deltas"]) == (case["chunks"], case["rest"])
+
+@pytest.mark.parametrize("case", CASES, ids=[case["name"] for case in CASES])
+def test_chunks_dont_depend_on_how_text_is_streamed(case):
+    text = "".join(case["deltas"])
+    assert segment(Segmenter(**case["options"]), list(text)) == (case["chunks"], case["rest"])
+    assert segment(Segmenter(**case["options"]), [text]) == (case["chunks"], case["rest"])
+
+def test_reused_after_flush():
+    segmenter = Segmenter()
+    segment(segmenter, ["Hi Bob, I am Pepper."])
+    assert segmenter.feed("Hi, you. ") == ["Hi, you."] # Later chunks need clause_min to end at a clause
+
+def test_benchmark():
+    stream = [(0.5, "Hello "), (0.6, "there. "), (0.7, "How "), (0.8, "are "), (0.9, "you")]
+    assert benchmark(stream, Segmenter()) == (0.6, 2)
+    assert benchmark(stream, Segmenter(sentences=False)) == (0.9, 1)
+
+def test_bridge_assembler_matches(bridge):
+    """
+    The bridge's SpeechAssembler is a Python 2 copy of Segmenter, so it has to split every case the same way
+    """
+    cases = [case for case in CASES if case["options"].get("sentences", True)]
+    results = bridge("""
+import io
+with io.open({!r}, encoding="utf-8") as f:
+    cases = [case for case in json.load(f) if case["options"].get("sentences", True)]
+results = []
+for case in cases:
+    assembler = bridge.SpeechAssembler(**dict((str(k), v) for k, v in case["options"].items()))
+    chunks = []
+    for delta in case["deltas"]:
+        chunks += assembler.feed(delta)
+    results.append([chunks, assembler.flush()])
+print(json.dumps(results))
+""".format(CASES_PATH))
+    assert results == [[case["chunks"], case["rest"]] for case in cases]
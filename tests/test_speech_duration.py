@@ -0,0 +1,56 @@
+import json
+
+from src.NAO.SpeechDuration import SpeechDuration
+
+SENTENCES = [
+    "Hello there, how are you today?",
+    "I am a robot.",
+    "Ask me anything, and I will do my best to answer it.",
+    "That is a good question; let me think.",
+    "Yes."
+]
+
+def test_features():
+    assert SpeechDuration.features(" Hi, I am Pepper. Nice to meet you! ") == \
+        {"char": 27, "word": 8, "sentence": 2, "clause": 1, "base": 1}
+    assert SpeechDuration.features("   ") == {"char": 0, "word": 0, "sentence": 0, "clause": 0, "base": 0}
+
+def test_unknown_language_uses_char_len():
+    duration = SpeechDuration("xx", char_len=0.1)
+    assert duration.costs["xx"]["char"] == 0.1
+    assert SpeechDuration("en").costs["en"]["char"] == 1.0 / 14.0
+
+def test_calibrates_towards_measured_durations():
+    truth = SpeechDuration("en")
+    truth.costs["en"].update(char=0.1, word=0.05, sentence=0.5, clause=0.2, base=0.3) # A slower voice
+    duration = SpeechDuration("en")
+    first_error = sum(abs(truth(s) - duration(s)) for s in SENTENCES)
+    errors = []
+    for _ in range(3):
+        for _ in range(40):
+            for sentence in SENTENCES:
+                duration.observe(sentence, truth(sentence))
+        errors.append(sum(abs(truth(s) - duration(s)) for s in SENTENCES))
+    assert first_error > errors[0] > errors[1] > errors[2]
+    assert errors[-1] < first_error / 10
+    assert len(duration.errors) == 3 * 40 * len(SENTENCES)
+
+def test_outliers_are_ignored():
+    duration = SpeechDuration("en")
+    costs = dict(duration.costs["en"])
+    estimate = duration("I am a robot.")
+    duration.observe("I am a robot.", estimate * 5) # More likely a failure than speech
+    duration.observe("I am a robot.", estimate / 5)
+    duration.observe("", 1.0)
+    assert duration.costs["en"] == costs
+    assert duration.errors == []
+
+def test_costs_are_stored_between_runs(tmp_path):
+    path = str(tmp_path / "durations" / "speech_durations.json")
+    duration = SpeechDuration("en", path=path)
+    duration.observe("I am a robot.", duration("I am a robot.") * 2)
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f) == duration.costs
+    assert SpeechDuration("en", path=path).costs == duration.costs
+    swedish = SpeechDuration("sv", path=path) # Languages share the file
+    assert swedish.costs["en"] == duration.costs["en"] and "sv" in swedish.costs
@@ -0,0 +1,55 @@
+import os
+import threading
+
+from src.TTSCache import TTSCache
+
+def test_least_recently_used_is_evicted():
+    cache = TTSCache(max_items=2)
+    cache.put("one", "en", "", b"1")
+    cache.put("two", "en", "", b"2")
+    assert cache.get("one", "en", "") == b"1" # Now more recently used than "two"
+    cache.put("three", "en", "", b"3")
+    assert cache.get("two", "en", "") is None
+    assert cache.get("one", "en", "") == b"1"
+    assert cache.get("three", "en", "") == b"3"
+    assert len(cache.memory) == 2
+    assert cache.counts == {"hits": 3, "disk_hits": 0, "misses": 1}
+
+def test_language_and_voice_are_part_of_the_key():
+    cache = TTSCache()
+    cache.put("hello", "en", "a", b"en-a")
+    cache.put("hello", "sv", "a", b"sv-a")
+    assert cache.get("hello", "en", "a") == b"en-a"
+    assert cache.get("hello", "sv", "a") == b"sv-a"
+    assert cache.get("hello", "en", "b") is None
+
+def test_evicted_audio_is_read_back_from_disk(tmp_path):
+    cache = TTSCache(directory=str(tmp_path), max_items=1)
+    cache.put("one", "en", "", b"1")
+    cache.put("two", "en", "", b"2")
+    assert cache.get("one", "en", "") == b"1"
+    assert cache.counts["disk_hits"] == 1
+    assert cache.get("one", "en", "") == b"1" # Back in memory
+    assert cache.counts["hits"] == 1
+    assert not [name for name in os.listdir(str(tmp_path)) if name.endswith(".tmp")]
+
+def test_disk_cache_is_kept_between_runs(tmp_path):
+    TTSCache(directory=str(tmp_path)).put("hello", "en", "", b"audio")
+    assert TTSCache(directory=str(tmp_path)).get("hello", "en", "") == b"audio"
+
+def test_concurrent_puts_of_the_same_text(tmp_path):
+    cache = TTSCache(directory=str(tmp_path))
+    threads = [threading.Thread(target=cache.put, args=("hello", "en", "", b"audio" * 10000)) for _ in range(8)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert os.listdir(str(tmp_path)) == [TTSCache.key("hello", "en", "") + ".audio"]
+    assert TTSCache(directory=str(tmp_path)).get("hello", "en", "") == b"audio" * 10000
+
+def test_failed_disk_write_keeps_audio_in_memory(tmp_path, monkeypatch, capsys):
+    cache = TTSCache(directory=str(tmp_path))
+    def full(src, dst): raise OSError("No space left on device")
+    monkeypatch.setattr(os, "replace", full)
+    cache.put("hello", "en", "", b"audio")
+    assert "Warning" in capsys.readouterr().out
+    assert cache.get("hello", "en", "") == b"audio"
+    assert not os.listdir(str(tmp_path))
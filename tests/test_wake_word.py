@@ -0,0 +1,47 @@
+import sys
+import types
+import wave
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("speech_recognition")
+pytest.importorskip("sounddevice")
+pytest.importorskip("openai")
+from src.Listener import Listener, ReplaySource
+
+class FakeDecoder(object):
+    """Takes the place of pocketsphinx's Decoder, which fails on keyphrases missing from its dictionary"""
+    def __init__(self, config):
+        self.config = config
+
+    @staticmethod
+    def default_config():
+        config = types.SimpleNamespace(values={})
+        config.set_string = config.set_float = lambda key, value: config.values.__setitem__(key, value)
+        return config
+
+@pytest.fixture
+def pocketsphinx(monkeypatch):
+    module = types.ModuleType("pocketsphinx")
+    module.pocketsphinx = types.SimpleNamespace(Decoder=FakeDecoder)
+    monkeypatch.setitem(sys.modules, "pocketsphinx", module)
+
+def listener(tmp_path, **kwargs):
+    with wave.open(str(tmp_path / "silence.wav"), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(16000)
+        w.writeframes(b"\0\0" * 1600)
+    return Listener(source=ReplaySource(str(tmp_path), speed=0), default_mic=False, **kwargs)
+
+def test_unknown_wake_word_falls_back(pocketsphinx, tmp_path, capsys):
+    assert listener(tmp_path, wake_word="Nao").wake_spotter is None
+    assert "Warning: Wake word disabled" in capsys.readouterr().out
+
+def test_wake_spelling_replaces_unknown_name(pocketsphinx, tmp_path):
+    spotter = listener(tmp_path, wake_word="Nao", wake_spelling="Now").wake_spotter
+    assert spotter.decoder.config.values["-keyphrase"] == "now"
+
+def test_known_wake_word(pocketsphinx, tmp_path):
+    assert listener(tmp_path, wake_word="Pepper").wake_spotter is not None